@@ -0,0 +1,158 @@
+"""
+Free-slot engine.
+
+Each doctor's day is represented as an integer bitmap with one bit per
+SLOT_MINUTES slot (bit 0 = 00:00 local time). Weekly availability and
+date exceptions are compiled into that bitmap, booked appointments are
+masked out, and free starts for a given duration are found with shifts
+and ANDs instead of per-slot queries.
+"""
+import math
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+
+from hospitals.models import DoctorAvailability, DoctorAvailabilityException
+from .models import Appointment
+
+SLOT_MINUTES = 15
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+FULL_DAY = (1 << SLOTS_PER_DAY) - 1
+
+
+def _slot_index(value, round_up=False):
+    minutes = value.hour * 60 + value.minute + value.second / 60
+    if round_up:
+        return math.ceil(minutes / SLOT_MINUTES)
+    return int(minutes // SLOT_MINUTES)
+
+
+def interval_mask(start_time, end_time, inward=False):
+    """
+    Bitmap covering [start_time, end_time); an end of 00:00 means midnight.
+    Partial slots are included, or left out with `inward` (for working
+    hours, so no slot starts before or runs past them).
+    """
+    first = _slot_index(start_time, round_up=inward) if start_time else 0
+    last = _slot_index(end_time, round_up=not inward) if end_time and end_time != time(0) else SLOTS_PER_DAY
+    if last <= first:
+        return 0
+    return ((1 << (last - first)) - 1) << first
+
+
+def compile_weekly(rows):
+    """Compile DoctorAvailability rows into {doctor_id: [mask per weekday]}."""
+    weekly = defaultdict(lambda: [0] * 7)
+    for row in rows:
+        weekly[row.doctor_id][row.weekday] |= interval_mask(row.start_time, row.end_time, inward=True)
+    return weekly
+
+
+def day_bounds(day):
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, start + timedelta(days=1)
+
+
+def booked_mask(day, intervals):
+    """Bitmap of slots on `day` touched by any (start, end) datetime interval."""
+    day_start, day_end = day_bounds(day)
+    mask = 0
+    for start, end in intervals:
+        if end <= day_start or start >= day_end:
+            continue
+        first = 0 if start <= day_start else int((start - day_start).total_seconds() // 60 // SLOT_MINUTES)
+        if end >= day_end:
+            last = SLOTS_PER_DAY
+        else:
+            last = math.ceil((end - day_start).total_seconds() / 60 / SLOT_MINUTES)
+        mask |= ((1 << (last - first)) - 1) << first
+    return mask
+
+
+def free_starts(free, duration):
+    """Bitmap of slot indexes where `duration` minutes of consecutive free slots begin."""
+    length = max(1, math.ceil(duration / SLOT_MINUTES))
+    run = free
+    for shift in range(1, length):
+        run &= free >> shift
+    return run
+
+
+def iter_bits(mask):
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def _date_range(start_date, end_date):
+    day = start_date
+    while day <= end_date:
+        yield day
+        day += timedelta(days=1)
+
+
+def find_free_slots(doctor_ids, start_date, end_date, duration=30, limit=5, now=None):
+    """
+    Return {doctor_id: [(start, end), ...]} with at most `limit` free slots
+    per doctor between start_date and end_date (inclusive).
+
+    Runs a fixed number of queries regardless of how many doctors or days
+    are requested.
+    """
+    now = now or timezone.now()
+    doctor_ids = list(doctor_ids)
+    range_start, _ = day_bounds(start_date)
+    _, range_end = day_bounds(end_date)
+
+    weekly = compile_weekly(DoctorAvailability.objects.filter(doctor_id__in=doctor_ids))
+
+    exceptions = defaultdict(list)
+    for exc in DoctorAvailabilityException.objects.filter(
+        doctor_id__in=doctor_ids, date__gte=start_date, date__lte=end_date
+    ):
+        exceptions[(exc.doctor_id, exc.date)].append(exc)
+
+    booked = defaultdict(list)
+    appointments = (
+        Appointment.objects
+        .filter(
+            doctor_id__in=doctor_ids,
+            appointment_time__lt=range_end,
+            end_time__gt=range_start,
+        )
+        .exclude(status='CANCELLED')
+        .values_list('doctor_id', 'appointment_time', 'end_time')
+    )
+    for doctor_id, start, end in appointments:
+        booked[doctor_id].append((start, end))
+
+    results = {}
+    for doctor_id in doctor_ids:
+        slots = []
+        pattern = weekly.get(doctor_id)
+        for day in _date_range(start_date, end_date):
+            if len(slots) >= limit:
+                break
+            mask = pattern[day.weekday()] if pattern else 0
+            for exc in exceptions.get((doctor_id, day), ()):
+                if exc.is_available:
+                    mask |= interval_mask(exc.start_time, exc.end_time, inward=True)
+                else:
+                    mask &= ~interval_mask(exc.start_time, exc.end_time)
+            if not mask:
+                continue
+            day_start, day_end = day_bounds(day)
+            if day_end <= now:
+                continue
+            if day_start < now:
+                mask &= ~booked_mask(day, [(day_start, now)])
+            mask &= ~booked_mask(day, booked[doctor_id]) & FULL_DAY
+            for index in iter_bits(free_starts(mask, duration)):
+                start = day_start + timedelta(minutes=index * SLOT_MINUTES)
+                slots.append((start, start + timedelta(minutes=duration)))
+                if len(slots) >= limit:
+                    break
+        results[doctor_id] = slots
+    return results
@@ -0,0 +1,176 @@
+"""
+Booking service.
+
+All writes that place an appointment on a doctor's calendar go through
+save_booking(), which serialises bookings per doctor and rejects any
+interval overlap (not just identical start times):
+
+- Postgres: a transaction-scoped advisory lock on the doctor id, backed by
+  the `appointments_no_overlap` exclusion constraint.
+- SQLite: the database write lock is taken up front so the overlap check
+  and the insert cannot interleave with another writer.
+- Other backends: SELECT ... FOR UPDATE on the doctor row.
+
+Locking per doctor keeps bookings for different doctors fully parallel;
+contention only exists where a real conflict is possible.
+"""
+import bisect
+from datetime import timedelta
+
+from django.db import IntegrityError, connections, router, transaction
+
+from hospitals.models import Doctor
+from .models import Appointment
+from .signals import appointments_bulk_created
+
+
+class SlotUnavailable(Exception):
+    """The requested interval overlaps an active appointment for the doctor."""
+
+
+def overlapping(doctor_id, start, end, exclude_pk=None, using=None):
+    queryset = (
+        Appointment.objects.using(using)
+        .filter(doctor_id=doctor_id, appointment_time__lt=end, end_time__gt=start)
+        .exclude(status='CANCELLED')
+    )
+    if exclude_pk is not None:
+        queryset = queryset.exclude(pk=exclude_pk)
+    return queryset
+
+
+def lock_doctors(doctor_ids, using=None):
+    """Take the per-doctor booking lock(s); must be called inside a transaction."""
+    using = using or router.db_for_write(Appointment)
+    connection = connections[using]
+    doctor_ids = sorted(set(doctor_ids))
+    if not doctor_ids:
+        return
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            for doctor_id in doctor_ids:
+                cursor.execute('SELECT pg_advisory_xact_lock(%s)', [doctor_id])
+        elif connection.vendor == 'sqlite':
+            # A no-op write promotes the transaction to RESERVED, which
+            # blocks other writers until we commit.
+            cursor.execute(
+                'UPDATE hospitals_doctor SET id = id WHERE id = %s', [doctor_ids[0]]
+            )
+        else:
+            list(Doctor.objects.using(using).select_for_update().filter(id__in=doctor_ids).values_list('id'))
+
+
+def save_booking(appointment):
+    """Save `appointment`, raising SlotUnavailable if it would overlap another one."""
+    appointment.compute_end_time()
+    using = router.db_for_write(Appointment, instance=appointment)
+    with transaction.atomic(using=using):
+        lock_doctors([appointment.doctor_id], using=using)
+        if appointment.status != 'CANCELLED' and overlapping(
+            appointment.doctor_id, appointment.appointment_time, appointment.end_time,
+            exclude_pk=appointment.pk, using=using,
+        ).exists():
+            raise SlotUnavailable("This slot is already booked.")
+        try:
+            with transaction.atomic(using=using):
+                appointment.save(using=using)
+        except IntegrityError as exc:
+            # Unique slot or (on Postgres) exclusion constraint violation.
+            raise SlotUnavailable("This slot is already booked.") from exc
+    return appointment
+
+
+def book_appointment(patient_id, doctor_id, appointment_time, duration=30, **fields):
+    appointment = Appointment(
+        patient_id=patient_id,
+        doctor_id=doctor_id,
+        appointment_time=appointment_time,
+        duration=duration,
+        **fields,
+    )
+    return save_booking(appointment)
+
+
+def interval(appointment_time, duration):
+    return appointment_time, appointment_time + timedelta(minutes=duration)
+
+
+def merge_intervals(intervals):
+    """Sorted (start, end) tuples with overlapping ones combined."""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start < merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _conflicts(intervals, start, end):
+    """`intervals` is a sorted, non-overlapping list of (start, end) tuples."""
+    index = bisect.bisect_left(intervals, (start, end))
+    if index > 0 and intervals[index - 1][1] > start:
+        return True
+    return index < len(intervals) and intervals[index][0] < end
+
+
+def book_many(items, all_or_nothing=False):
+    """
+    Book a batch of appointments in one transaction.
+
+    `items` are dicts with patient_id, doctor_id, appointment_time, duration
+    and optional reason/notes. Existing bookings are fetched with a single
+    range query, conflicts (with the database or earlier items in the batch)
+    are resolved in memory and the accepted rows are inserted with
+    bulk_create. Returns one result dict per item, in input order.
+    """
+    results = [None] * len(items)
+    if not items:
+        return results
+    pending = []
+    for index, item in enumerate(items):
+        appointment = Appointment(**item)
+        appointment.compute_end_time()
+        pending.append((index, appointment))
+
+    doctor_ids = {appointment.doctor_id for _, appointment in pending}
+    window_start = min(appointment.appointment_time for _, appointment in pending)
+    window_end = max(appointment.end_time for _, appointment in pending)
+
+    using = router.db_for_write(Appointment)
+    with transaction.atomic(using=using):
+        lock_doctors(doctor_ids, using=using)
+        booked = {doctor_id: [] for doctor_id in doctor_ids}
+        existing = (
+            Appointment.objects.using(using)
+            .filter(doctor_id__in=doctor_ids, appointment_time__lt=window_end, end_time__gt=window_start)
+            .exclude(status='CANCELLED')
+            .order_by('appointment_time')
+            .values_list('doctor_id', 'appointment_time', 'end_time')
+        )
+        for doctor_id, start, end in existing:
+            booked[doctor_id].append((start, end))
+        # Rows written before bookings were checked for overlap may overlap
+        # each other; merged, the neighbour before the insertion point is the
+        # only one that can reach past a new start.
+        booked = {doctor_id: merge_intervals(intervals) for doctor_id, intervals in booked.items()}
+
+        accepted = []
+        for index, appointment in pending:
+            calendar = booked[appointment.doctor_id]
+            if _conflicts(calendar, appointment.appointment_time, appointment.end_time):
+                results[index] = {'index': index, 'status': 'conflict', 'detail': "This slot is already booked."}
+                continue
+            bisect.insort(calendar, (appointment.appointment_time, appointment.end_time))
+            accepted.append((index, appointment))
+
+        if all_or_nothing and len(accepted) < len(pending):
+            for index, _ in accepted:
+                results[index] = {'index': index, 'status': 'skipped', 'detail': "Batch rejected because of conflicts."}
+            return results
+
+        created = Appointment.objects.using(using).bulk_create([appointment for _, appointment in accepted], batch_size=500)
+        for (index, _), appointment in zip(accepted, created):
+            results[index] = {'index': index, 'status': 'booked', 'id': appointment.pk}
+        appointments_bulk_created.send(sender=Appointment, appointments=created)
+    return results
@@ -0,0 +1,45 @@
+from datetime import datetime
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+from .models import Appointment
+
+
+def _parse_bound(value, name, end_of_day=False):
+    try:
+        day = parse_date(value)
+        parsed = None if day else parse_datetime(value)
+    except ValueError:
+        day = parsed = None
+    if day is not None:
+        parsed = datetime.combine(day, datetime.max.time() if end_of_day else datetime.min.time())
+    elif parsed is None:
+        raise ValidationError({name: ["Use an ISO date or datetime."]})
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+class AppointmentRangeFilter(BaseFilterBackend):
+    """
+    ?start=&end= bound appointment_time (dates are inclusive days) and
+    ?status= takes one or more comma-separated statuses. Both map onto the
+    leading columns of the appointment list indexes.
+    """
+    def filter_queryset(self, request, queryset, view):
+        params = request.query_params
+        if params.get('start'):
+            queryset = queryset.filter(appointment_time__gte=_parse_bound(params['start'], 'start'))
+        if params.get('end'):
+            queryset = queryset.filter(appointment_time__lte=_parse_bound(params['end'], 'end', end_of_day=True))
+        if params.get('status'):
+            statuses = [value.strip().upper() for value in params['status'].split(',') if value.strip()]
+            valid = dict(Appointment.STATUS_CHOICES)
+            unknown = [value for value in statuses if value not in valid]
+            if unknown:
+                raise ValidationError({'status': [f"Unknown status: {', '.join(unknown)}"]})
+            queryset = queryset.filter(status__in=statuses)
+        return queryset
@@ -0,0 +1,113 @@
+import random
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from django.utils import timezone
+
+from appointments.booking import SlotUnavailable, book_appointment
+from appointments.models import Appointment
+from authentication.models import User
+from hospitals.models import Doctor, Hospital, HospitalBranch
+from patients.models import Patient
+
+
+class Command(BaseCommand):
+    help = (
+        "Fire concurrent bookings at one doctor's morning and report conflicts, "
+        "latency percentiles and throughput. Creates throwaway fixtures unless --keep is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--requests', type=int, default=400)
+        parser.add_argument('--doctors', type=int, default=1, help="Spread load over this many doctors")
+        parser.add_argument('--slots', type=int, default=16, help="Distinct 15-minute start offsets to contend on")
+        parser.add_argument('--duration', type=int, default=30)
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--keep', action='store_true', help="Do not delete the benchmark fixtures")
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite' and connection.settings_dict['NAME'] in (':memory:', ''):
+            raise CommandError("bench_booking needs a file or server database shared between threads.")
+        rng = random.Random(options['seed'])
+        hospital, doctors, patients = self._setup(options)
+        morning = timezone.make_aware(
+            datetime.combine(timezone.localdate() + timedelta(days=1), datetime.min.time())
+        ) + timedelta(hours=9)
+
+        def attempt(i):
+            doctor = rng.choice(doctors)
+            start = morning + timedelta(minutes=15 * rng.randrange(options['slots']))
+            began = time.perf_counter()
+            try:
+                book_appointment(
+                    patient_id=patients[i % len(patients)].pk, doctor_id=doctor.pk,
+                    appointment_time=start, duration=options['duration'],
+                )
+                outcome = 'booked'
+            except SlotUnavailable:
+                outcome = 'conflict'
+            except OperationalError:
+                outcome = 'error'
+            return outcome, time.perf_counter() - began
+
+        try:
+            began = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+                results = list(pool.map(attempt, range(options['requests'])))
+            elapsed = time.perf_counter() - began
+            self._report(results, elapsed)
+            self._check_no_overlap(doctors)
+        finally:
+            if not options['keep']:
+                User.objects.filter(patient__in=patients).delete()
+                hospital.delete()
+
+    def _setup(self, options):
+        tag = uuid.uuid4().hex[:8]
+        hospital = Hospital.objects.create(
+            name=f'Bench {tag}', email=f'bench-{tag}@example.com', address='-', phone='-'
+        )
+        branch = HospitalBranch.objects.create(
+            hospital=hospital, name='Bench', address='-', phone='-', city='-', state='-'
+        )
+        doctors = Doctor.objects.bulk_create([
+            Doctor(branch=branch, name=f'Bench {i}', specialization='Bench')
+            for i in range(options['doctors'])
+        ])
+        users = User.objects.bulk_create([
+            User(email=f'bench-{tag}-{i}@example.com', full_name=f'Bench {i}', password='!')
+            for i in range(options['threads'])
+        ])
+        patients = Patient.objects.bulk_create([
+            Patient(user=user, universal_id=f'B{tag}{i}'[:20]) for i, user in enumerate(users)
+        ])
+        return hospital, doctors, patients
+
+    def _report(self, results, elapsed):
+        latencies = sorted(latency * 1000 for _, latency in results)
+        counts = {key: sum(1 for outcome, _ in results if outcome == key) for key in ('booked', 'conflict', 'error')}
+        quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+        self.stdout.write(
+            f"requests={len(results)} booked={counts['booked']} conflicts={counts['conflict']} "
+            f"errors={counts['error']} elapsed={elapsed:.2f}s throughput={len(results) / elapsed:.1f}/s"
+        )
+        self.stdout.write(
+            f"latency ms: p50={quantiles[49]:.1f} p95={quantiles[94]:.1f} "
+            f"p99={quantiles[98]:.1f} max={latencies[-1]:.1f}"
+        )
+
+    def _check_no_overlap(self, doctors):
+        rows = Appointment.objects.filter(doctor__in=doctors).exclude(status='CANCELLED') \
+            .order_by('doctor_id', 'appointment_time').values_list('doctor_id', 'appointment_time', 'end_time')
+        previous = None
+        for row in rows:
+            if previous and previous[0] == row[0] and row[1] < previous[2]:
+                raise CommandError(f"Overlapping bookings found for doctor {row[0]} at {row[1]}")
+            previous = row
+        self.stdout.write(self.style.SUCCESS("No overlapping bookings."))
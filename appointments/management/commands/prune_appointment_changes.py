@@ -0,0 +1,31 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from appointments.models import AppointmentChange
+from appointments.sync import SYNC_RETENTION_DAYS
+from hospital_app.sharding import shard_aliases
+
+
+class Command(BaseCommand):
+    help = "Delete sync change-log rows older than the token retention window."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=SYNC_RETENTION_DAYS)
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        total = 0
+        for alias in shard_aliases():
+            changes = AppointmentChange.objects.using(alias)
+            while True:
+                ids = list(
+                    changes.filter(created_at__lt=cutoff)
+                    .order_by('id').values_list('id', flat=True)[:options['batch_size']]
+                )
+                if not ids:
+                    break
+                total += changes.filter(id__in=ids).delete()[0]
+        self.stdout.write(f"Deleted {total} change rows older than {options['days']} days.")
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from appointments.utilization import rebuild
+from hospital_app.sharding import shard_aliases, use_shard
+
+
+class Command(BaseCommand):
+    help = "Recompute doctor utilization rollups from appointments (for backfills or repairs)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help="First day to rebuild (YYYY-MM-DD); default: all history")
+        parser.add_argument('--end', help="Last day to rebuild (YYYY-MM-DD)")
+        parser.add_argument('--doctor', type=int, action='append', dest='doctors', help="Limit to doctor id (repeatable)")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--shard', action='append', dest='shards',
+                            help="Database shard to rebuild (repeatable); default: all")
+
+    def handle(self, *args, **options):
+        start, end = self._day(options['start']), self._day(options['end'])
+        written = 0
+        for alias in options['shards'] or shard_aliases():
+            with use_shard(alias):
+                written += rebuild(
+                    start=start, end=end, doctor_ids=options['doctors'], batch_size=options['batch_size']
+                )
+        self.stdout.write(f"Wrote {written} utilization rows.")
+
+    def _day(self, value):
+        if not value:
+            return None
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f"Invalid date: {value}")
+        return day
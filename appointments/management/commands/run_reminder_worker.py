@@ -0,0 +1,46 @@
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+
+from appointments.reminders import ReminderWorker, get_sender
+from hospital_app.sharding import use_shard
+
+
+class Command(BaseCommand):
+    help = (
+        "Dispatch appointment reminders as they fall due. Several workers can run "
+        "in parallel; each claims its own batches. With a sharded database, run workers per shard."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backend', help="Dotted path of the sender class (default: settings.APPOINTMENT_REMINDER_BACKEND)")
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--horizon', type=int, default=60, help="Claim reminders due within this many seconds")
+        parser.add_argument('--lease', type=int, default=300, help="Seconds before an unsent claim may be taken over")
+        parser.add_argument('--poll-interval', type=float, default=5.0)
+        parser.add_argument('--once', action='store_true', help="Dispatch what is due now and exit")
+        parser.add_argument('--shard', default='default', help="Database shard whose reminders to send")
+
+    def handle(self, *args, **options):
+        with use_shard(options['shard']):
+            self.run_worker(options)
+
+    def run_worker(self, options):
+        worker = ReminderWorker(
+            sender=get_sender(options['backend']),
+            batch_size=options['batch_size'],
+            horizon=options['horizon'],
+            lease=options['lease'],
+        )
+        if options['once']:
+            worker.run_once()
+        else:
+            stop = threading.Event()
+            signal.signal(signal.SIGTERM, lambda *_: stop.set())
+            self.stdout.write(f"Reminder worker {worker.worker_id} started.")
+            try:
+                worker.run_forever(poll_interval=options['poll_interval'], stop=stop)
+            except KeyboardInterrupt:
+                pass
+        self.stdout.write(f"Sent {worker.sent} reminders, {worker.failed} failed.")
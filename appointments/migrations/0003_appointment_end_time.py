@@ -0,0 +1,106 @@
+from django.db import migrations, models
+from django.db.models import Q
+
+
+def backfill_end_time(apps, schema_editor):
+    from datetime import timedelta
+    Appointment = apps.get_model('appointments', 'Appointment')
+    batch = []
+    for appointment in Appointment.objects.only('id', 'appointment_time', 'duration').iterator(chunk_size=2000):
+        appointment.end_time = appointment.appointment_time + timedelta(minutes=appointment.duration)
+        batch.append(appointment)
+        if len(batch) >= 2000:
+            Appointment.objects.bulk_update(batch, ['end_time'])
+            batch = []
+    if batch:
+        Appointment.objects.bulk_update(batch, ['end_time'])
+
+
+OVERLAP_REPORT_LIMIT = 50
+
+
+def overlapping_active_pairs(connection, limit=OVERLAP_REPORT_LIMIT):
+    """(doctor_id, id, start, end, other id, other start, other end) of overlapping active bookings."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT a.doctor_id, a.id, a.appointment_time, a.end_time, b.id, b.appointment_time, b.end_time "
+            "FROM appointments_appointment a JOIN appointments_appointment b "
+            "ON b.doctor_id = a.doctor_id AND b.id > a.id "
+            "AND b.appointment_time < a.end_time AND a.appointment_time < b.end_time "
+            "WHERE a.status <> 'CANCELLED' AND b.status <> 'CANCELLED' "
+            "ORDER BY a.doctor_id, a.appointment_time, a.id, b.id LIMIT %s",
+            [limit + 1],
+        )
+        return cursor.fetchall()
+
+
+def add_exclusion_constraint(apps, schema_editor):
+    # Overlap is enforced by the database on Postgres; other backends rely on
+    # the per-doctor lock taken in appointments.booking.
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    # Overlapping bookings were allowed before this migration and would make
+    # the ALTER below fail with a bare IntegrityError; list them instead. The
+    # migration runs in one transaction, so nothing of it is kept.
+    pairs = overlapping_active_pairs(schema_editor.connection)
+    if pairs:
+        lines = [
+            f"  doctor {doctor_id}: appointment {first} ({first_start} - {first_end}) "
+            f"overlaps appointment {second} ({second_start} - {second_end})"
+            for doctor_id, first, first_start, first_end, second, second_start, second_end
+            in pairs[:OVERLAP_REPORT_LIMIT]
+        ]
+        if len(pairs) > OVERLAP_REPORT_LIMIT:
+            lines.append(f"  ... and more; only the first {OVERLAP_REPORT_LIMIT} are listed.")
+        raise RuntimeError(
+            "Cannot add the appointments_no_overlap constraint: these active appointments overlap. "
+            "Cancel or reschedule one of each pair, then migrate again.\n" + "\n".join(lines)
+        )
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    schema_editor.execute(
+        "ALTER TABLE appointments_appointment ADD CONSTRAINT appointments_no_overlap "
+        "EXCLUDE USING gist (doctor_id WITH =, tstzrange(appointment_time, end_time, '[)') WITH &&) "
+        "WHERE (status <> 'CANCELLED')"
+    )
+
+
+def drop_exclusion_constraint(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'ALTER TABLE appointments_appointment DROP CONSTRAINT IF EXISTS appointments_no_overlap'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0002_appointment_duration_appointment_notes_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='end_time',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_end_time, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='appointment',
+            name='end_time',
+            field=models.DateTimeField(editable=False, help_text='appointment_time + duration, kept for overlap checks'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='appointment',
+            unique_together=set(),
+        ),
+        migrations.AddConstraint(
+            model_name='appointment',
+            constraint=models.UniqueConstraint(
+                condition=Q(('status', 'CANCELLED'), _negated=True),
+                fields=('doctor', 'appointment_time'),
+                name='appointments_unique_active_slot',
+            ),
+        ),
+        migrations.RunPython(add_exclusion_constraint, drop_exclusion_constraint),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0003_appointment_end_time'),
+        ('hospitals', '0006_doctor_user'),
+        ('patients', '0002_patient_address_patient_emergency_contact_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['patient', 'appointment_time'], name='appt_patient_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['doctor', 'status', 'appointment_time'], name='appt_doctor_status_time_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0004_appointment_list_indexes'),
+        ('patients', '0002_patient_address_patient_emergency_contact_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AppointmentChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('appointment_id', models.BigIntegerField()),
+                ('kind', models.CharField(choices=[('UPSERT', 'Created or updated'), ('DELETE', 'Deleted')], max_length=6)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('patient', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='appointment_changes', to='patients.patient')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['patient', 'id'], name='appt_change_patient_id_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def add_window_index(apps, schema_editor):
+    # Interval index for "window contains the freed slot" lookups on Postgres
+    # (btree_gist is installed by 0003 for the overlap constraint).
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        "CREATE INDEX waitlist_window_gist ON appointments_waitlistentry "
+        "USING gist (doctor_id, tstzrange(earliest, latest, '[]')) WHERE status = 'WAITING'"
+    )
+
+
+def drop_window_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS waitlist_window_gist')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0006_appointment_reminder'),
+        ('hospitals', '0006_doctor_user'),
+        ('patients', '0002_patient_address_patient_emergency_contact_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WaitlistEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('earliest', models.DateTimeField()),
+                ('latest', models.DateTimeField()),
+                ('duration', models.PositiveIntegerField(default=30, help_text='Duration in minutes')),
+                ('reason', models.TextField(blank=True)),
+                ('status', models.CharField(choices=[('WAITING', 'Waiting'), ('BOOKED', 'Booked'), ('WITHDRAWN', 'Withdrawn')], default='WAITING', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('appointment', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='waitlist_entry', to='appointments.appointment')),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='waitlist', to='hospitals.doctor')),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='waitlist_entries', to='patients.patient')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['doctor', 'status', 'earliest'], name='waitlist_doctor_window_idx')],
+            },
+        ),
+        migrations.RunPython(add_window_index, drop_window_index),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0007_waitlist_entry'),
+        ('hospitals', '0006_doctor_user'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='appointment',
+            name='status',
+            field=models.CharField(choices=[('PENDING', 'Pending'), ('CONFIRMED', 'Confirmed'), ('CANCELLED', 'Cancelled'), ('NO_SHOW', 'No show')], default='PENDING', max_length=10),
+        ),
+        migrations.CreateModel(
+            name='DoctorDailyUtilization',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('appointments', models.IntegerField(default=0)),
+                ('booked_minutes', models.IntegerField(default=0)),
+                ('cancellations', models.IntegerField(default=0)),
+                ('no_shows', models.IntegerField(default=0)),
+                ('branch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='utilization', to='hospitals.hospitalbranch')),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='utilization', to='hospitals.doctor')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['branch', 'date'], name='utilization_branch_date_idx')],
+                'constraints': [models.UniqueConstraint(fields=('doctor', 'date'), name='utilization_doctor_date_uniq')],
+            },
+        ),
+    ]
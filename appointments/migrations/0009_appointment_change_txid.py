@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:41
+
+from django.db import migrations, models
+
+
+def create_txid_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        # SQLite serializes writers, so change ids commit in order anyway.
+        return
+    # Every insert, copies from another shard included, gets this database's
+    # transaction id; existing rows keep 0 and sort before all of them.
+    schema_editor.execute(
+        "CREATE FUNCTION appointment_change_txid() RETURNS trigger AS $$ "
+        "BEGIN NEW.txid := pg_current_xact_id()::text::bigint; RETURN NEW; END "
+        "$$ LANGUAGE plpgsql"
+    )
+    schema_editor.execute(
+        "CREATE TRIGGER appointment_change_txid BEFORE INSERT ON appointments_appointmentchange "
+        "FOR EACH ROW EXECUTE FUNCTION appointment_change_txid()"
+    )
+
+
+def drop_txid_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP TRIGGER IF EXISTS appointment_change_txid ON appointments_appointmentchange')
+    schema_editor.execute('DROP FUNCTION IF EXISTS appointment_change_txid()')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0008_doctor_daily_utilization'),
+        ('patients', '0006_duplicate_detection'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='appointmentchange',
+            name='appt_change_patient_id_idx',
+        ),
+        migrations.AddField(
+            model_name='appointmentchange',
+            name='txid',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='appointmentchange',
+            index=models.Index(fields=['patient', 'txid', 'id'], name='appt_change_patient_txid_idx'),
+        ),
+        migrations.RunPython(create_txid_trigger, drop_txid_trigger),
+    ]
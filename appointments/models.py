@@ -1,12 +1,14 @@
+from datetime import timedelta
 from django.db import models
 from patients.models import Patient
-from hospitals.models import Doctor
+from hospitals.models import Doctor, HospitalBranch
 
 class Appointment(models.Model):
     STATUS_CHOICES = [
         ('PENDING',   'Pending'),
         ('CONFIRMED', 'Confirmed'),
         ('CANCELLED', 'Cancelled'),
+        ('NO_SHOW',   'No show'),
     ]
 
     patient          = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='appointments')
@@ -16,10 +18,150 @@ class Appointment(models.Model):
     reason           = models.TextField(blank=True)
     notes            = models.TextField(blank=True)
     duration         = models.PositiveIntegerField(help_text="Duration in minutes", default=30)
+    end_time         = models.DateTimeField(editable=False, help_text="appointment_time + duration, kept for overlap checks")
     created_at       = models.DateTimeField(auto_now_add=True)
 
     class Meta:
-        unique_together = ('doctor', 'appointment_time')  
+        constraints = [
+            models.UniqueConstraint(
+                fields=['doctor', 'appointment_time'],
+                condition=~models.Q(status='CANCELLED'),
+                name='appointments_unique_active_slot',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['patient', 'appointment_time'], name='appt_patient_time_idx'),
+            models.Index(fields=['doctor', 'status', 'appointment_time'], name='appt_doctor_status_time_idx'),
+        ]
+
+    # Fields whose previous values signal handlers need to compute deltas.
+    TRACKED_FIELDS = ('patient_id', 'doctor_id', 'appointment_time', 'duration', 'status')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._original = {
+            name: value for name, value in zip(field_names, values) if name in cls.TRACKED_FIELDS
+        }
+        return instance
+
+    @property
+    def original(self):
+        """Tracked field values as last loaded from or saved to the database; {} if unsaved."""
+        return getattr(self, '_original', {})
+
+    def compute_end_time(self):
+        self.end_time = self.appointment_time + timedelta(minutes=self.duration)
+        return self.end_time
+
+    def save(self, *args, **kwargs):
+        self.compute_end_time()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'appointment_time', 'duration'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'end_time'}
+        super().save(*args, **kwargs)
+        self._original = {name: getattr(self, name) for name in self.TRACKED_FIELDS}
 
     def __str__(self):
         return f"{self.patient.universal_id} → Dr.{self.doctor.name} @ {self.appointment_time}"
+
+
+class AppointmentChange(models.Model):
+    """
+    Append-only change log used for mobile delta sync. (txid, id) is the
+    sync position; rows outlive the appointment so deletions can be
+    replayed.
+    """
+    UPSERT = 'UPSERT'
+    DELETE = 'DELETE'
+    KIND_CHOICES = [
+        (UPSERT, 'Created or updated'),
+        (DELETE, 'Deleted'),
+    ]
+
+    # No constraint: rows for deleted patients are harmless and age out with pruning.
+    patient        = models.ForeignKey(
+        Patient, on_delete=models.DO_NOTHING, db_constraint=False, related_name='appointment_changes'
+    )
+    appointment_id = models.BigIntegerField()
+    kind           = models.CharField(max_length=6, choices=KIND_CHOICES)
+    # Id of the writing transaction, set by a trigger on Postgres (0 elsewhere).
+    txid           = models.BigIntegerField(default=0)
+    created_at     = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['patient', 'txid', 'id'], name='appt_change_patient_txid_idx')]
+
+    def __str__(self):
+        return f"{self.kind} appointment {self.appointment_id} (#{self.pk})"
+
+
+class AppointmentReminder(models.Model):
+    """
+    A reminder due at `remind_at`. Workers claim batches by setting a lease
+    (claimed_by/claimed_until) and mark `sent_at` after dispatching.
+    """
+    appointment   = models.ForeignKey(Appointment, on_delete=models.CASCADE, related_name='reminders')
+    remind_at     = models.DateTimeField()
+    sent_at       = models.DateTimeField(null=True, blank=True)
+    claimed_by    = models.CharField(max_length=64, blank=True)
+    claimed_until = models.DateTimeField(null=True, blank=True)
+    attempts      = models.PositiveSmallIntegerField(default=0)
+    last_error    = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['remind_at'], condition=models.Q(sent_at__isnull=True), name='reminder_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"Reminder for appointment {self.appointment_id} @ {self.remind_at}"
+
+
+class WaitlistEntry(models.Model):
+    """A patient waiting for any slot with a doctor inside [earliest, latest]."""
+    STATUS_CHOICES = [
+        ('WAITING',   'Waiting'),
+        ('BOOKED',    'Booked'),
+        ('WITHDRAWN', 'Withdrawn'),
+    ]
+
+    doctor      = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='waitlist')
+    patient     = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='waitlist_entries')
+    earliest    = models.DateTimeField()
+    latest      = models.DateTimeField()
+    duration    = models.PositiveIntegerField(help_text="Duration in minutes", default=30)
+    reason      = models.TextField(blank=True)
+    status      = models.CharField(max_length=10, choices=STATUS_CHOICES, default='WAITING')
+    appointment = models.OneToOneField(
+        Appointment, on_delete=models.SET_NULL, null=True, blank=True, related_name='waitlist_entry'
+    )
+    created_at  = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['doctor', 'status', 'earliest'], name='waitlist_doctor_window_idx')]
+
+    def __str__(self):
+        return f"{self.patient.universal_id} waiting for Dr.{self.doctor.name} ({self.earliest} - {self.latest})"
+
+
+class DoctorDailyUtilization(models.Model):
+    """
+    Per-doctor, per-day rollup maintained incrementally from Appointment
+    writes (see appointments.utilization). Cancelled appointments only
+    count towards `cancellations`; no-shows still count as booked.
+    """
+    doctor         = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='utilization')
+    branch         = models.ForeignKey(HospitalBranch, on_delete=models.CASCADE, related_name='utilization')
+    date           = models.DateField()
+    appointments   = models.IntegerField(default=0)
+    booked_minutes = models.IntegerField(default=0)
+    cancellations  = models.IntegerField(default=0)
+    no_shows       = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['doctor', 'date'], name='utilization_doctor_date_uniq')]
+        indexes = [models.Index(fields=['branch', 'date'], name='utilization_branch_date_idx')]
+
+    def __str__(self):
+        return f"Dr.{self.doctor_id} on {self.date}: {self.booked_minutes} min"
@@ -0,0 +1,13 @@
+from rest_framework.pagination import CursorPagination
+
+
+class AppointmentCursorPagination(CursorPagination):
+    """
+    Keyset pagination over (appointment_time, id). Each page seeks from the
+    cursor position through the (patient|doctor, ..., appointment_time)
+    indexes, so deep pages cost the same as the first one.
+    """
+    ordering = ('appointment_time', 'id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
@@ -0,0 +1,198 @@
+"""
+Appointment reminders.
+
+Reminders are rows in AppointmentReminder with an indexed `remind_at`.
+A ReminderWorker repeatedly claims the reminders due within a short
+horizon (SELECT ... FOR UPDATE SKIP LOCKED plus a lease, so several
+workers never claim the same row), keeps them in a heap ordered by due
+time and dispatches each one through the configured sender when it
+falls due.
+
+Senders follow the Django email backend pattern and are selected with
+settings.APPOINTMENT_REMINDER_BACKEND.
+"""
+import heapq
+import json
+import os
+import socket
+import sys
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import AppointmentReminder
+
+REMINDER_LEADS = getattr(settings, 'APPOINTMENT_REMINDER_LEADS', [timedelta(hours=24), timedelta(hours=1)])
+REMINDER_MAX_ATTEMPTS = getattr(settings, 'APPOINTMENT_REMINDER_MAX_ATTEMPTS', 5)
+ACTIVE_STATUSES = ('PENDING', 'CONFIRMED')
+
+
+# Scheduling ----------------------------------------------------------------
+
+def build_reminders(appointment, now=None):
+    now = now or timezone.now()
+    if appointment.status not in ACTIVE_STATUSES or appointment.appointment_time <= now:
+        return []
+    due_times = sorted({max(now, appointment.appointment_time - lead) for lead in REMINDER_LEADS})
+    return [AppointmentReminder(appointment=appointment, remind_at=due) for due in due_times]
+
+
+def schedule_reminders(appointments, replace=True):
+    """(Re)create the unsent reminders for `appointments`; pass replace=False for new rows."""
+    appointments = list(appointments)
+    if replace:
+        AppointmentReminder.objects.filter(
+            appointment_id__in=[appointment.pk for appointment in appointments], sent_at__isnull=True
+        ).delete()
+    AppointmentReminder.objects.bulk_create(
+        [reminder for appointment in appointments for reminder in build_reminders(appointment)]
+    )
+
+
+# Senders -------------------------------------------------------------------
+
+class BaseReminderSender:
+    def send(self, reminder):
+        raise NotImplementedError
+
+    @staticmethod
+    def payload(reminder):
+        appointment = reminder.appointment
+        return {
+            'reminder': reminder.pk,
+            'appointment': appointment.pk,
+            'email': appointment.patient.user.email,
+            'patient': appointment.patient.user.full_name,
+            'doctor': appointment.doctor.name,
+            'appointment_time': appointment.appointment_time.isoformat(),
+        }
+
+
+class ConsoleReminderSender(BaseReminderSender):
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self._lock = threading.Lock()
+
+    def send(self, reminder):
+        with self._lock:
+            self.stream.write(json.dumps(self.payload(reminder)) + '\n')
+            self.stream.flush()
+
+
+class FileReminderSender(BaseReminderSender):
+    """Appends one JSON line per reminder to settings.APPOINTMENT_REMINDER_FILE_PATH."""
+    def __init__(self, path=None):
+        self.path = path or getattr(settings, 'APPOINTMENT_REMINDER_FILE_PATH', 'reminders.log')
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+
+    def send(self, reminder):
+        with open(self.path, 'a', encoding='utf-8') as handle:
+            handle.write(json.dumps(self.payload(reminder)) + '\n')
+
+
+class LocmemReminderSender(BaseReminderSender):
+    """Collects payloads in `LocmemReminderSender.outbox`, for tests."""
+    outbox = []
+
+    def send(self, reminder):
+        self.outbox.append(self.payload(reminder))
+
+
+def get_sender(backend=None, **kwargs):
+    path = backend or getattr(
+        settings, 'APPOINTMENT_REMINDER_BACKEND', 'appointments.reminders.ConsoleReminderSender'
+    )
+    return import_string(path)(**kwargs)
+
+
+# Worker --------------------------------------------------------------------
+
+class ReminderWorker:
+    def __init__(self, sender=None, batch_size=200, horizon=60, lease=300, worker_id=None):
+        self.sender = sender or get_sender()
+        self.batch_size = batch_size
+        self.horizon = timedelta(seconds=horizon)
+        self.lease = timedelta(seconds=max(lease, horizon * 2))
+        self.worker_id = worker_id or f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}'
+        self.heap = []
+        self.sent = 0
+        self.failed = 0
+
+    def claim(self, now=None):
+        """Claim up to batch_size reminders due within the horizon and add them to the heap."""
+        now = now or timezone.now()
+        claimable = AppointmentReminder.objects.filter(
+            Q(claimed_until__isnull=True) | Q(claimed_until__lt=now),
+            sent_at__isnull=True,
+            remind_at__lte=now + self.horizon,
+            attempts__lt=REMINDER_MAX_ATTEMPTS,
+        )
+        with transaction.atomic(using=router.db_for_write(AppointmentReminder)):
+            ids = list(
+                claimable.select_for_update(skip_locked=True)
+                .order_by('remind_at')
+                .values_list('id', flat=True)[:self.batch_size]
+            )
+            if not ids:
+                return 0
+            # The filter is re-applied so that, on backends without row locks,
+            # a row claimed by another worker in the meantime is not stolen.
+            claimable.filter(id__in=ids).update(claimed_by=self.worker_id, claimed_until=now + self.lease)
+        claimed = list(
+            AppointmentReminder.objects
+            .filter(id__in=ids, claimed_by=self.worker_id)
+            .select_related('appointment__patient__user', 'appointment__doctor')
+        )
+        for reminder in claimed:
+            heapq.heappush(self.heap, (reminder.remind_at, reminder.pk, reminder))
+        return len(claimed)
+
+    def dispatch_due(self, now=None):
+        now = now or timezone.now()
+        dispatched = 0
+        while self.heap and self.heap[0][0] <= now:
+            _, _, reminder = heapq.heappop(self.heap)
+            # Mark as sent first: zero rows means the reminder was rescheduled,
+            # cancelled or its lease was lost, and must not be sent by us.
+            marked = AppointmentReminder.objects.filter(
+                pk=reminder.pk, claimed_by=self.worker_id, sent_at__isnull=True
+            ).update(sent_at=timezone.now(), claimed_until=None)
+            if not marked:
+                continue
+            try:
+                self.sender.send(reminder)
+            except Exception as exc:
+                self.failed += 1
+                AppointmentReminder.objects.filter(pk=reminder.pk).update(
+                    sent_at=None, attempts=reminder.attempts + 1, last_error=str(exc)[:1000],
+                    claimed_by='', claimed_until=None,
+                )
+                continue
+            self.sent += 1
+            dispatched += 1
+        return dispatched
+
+    def run_once(self, now=None):
+        self.claim(now)
+        return self.dispatch_due(now)
+
+    def run_forever(self, poll_interval=5.0, stop=None):
+        while not (stop and stop.is_set()):
+            self.claim()
+            self.dispatch_due()
+            sleep_for = poll_interval
+            if self.heap:
+                until_next = (self.heap[0][0] - timezone.now()).total_seconds()
+                sleep_for = max(0.0, min(poll_interval, until_next))
+            if stop:
+                stop.wait(sleep_for)
+            else:
+                time.sleep(sleep_for)
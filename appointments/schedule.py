@@ -0,0 +1,96 @@
+"""
+Per-doctor, per-day schedule cache.
+
+A day is stored as a compact tuple of entries sorted by start time,
+(start, duration, status, patient_id, appointment_id), together with an
+ETag computed once at build time. Front-desk polls are served from the
+cache (and answered with 304 when the ETag matches); writes to
+Appointment invalidate the affected days from signal handlers.
+
+Entries are keyed by a per-doctor, per-day generation, which invalidation
+bumps instead of deleting the entry. A rebuild that read the day before
+a booking committed stores it under the old generation, where no reader
+looks any more.
+"""
+import hashlib
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .availability import day_bounds
+from .models import Appointment
+
+# Backstop for an invalidation lost with the cache (e.g. a failed delete).
+SCHEDULE_CACHE_TIMEOUT = getattr(settings, 'APPOINTMENT_SCHEDULE_CACHE_TIMEOUT', 300)
+
+
+def generation_key(doctor_id, day):
+    return f'appointments:schedule-generation:{doctor_id}:{day.isoformat()}'
+
+
+def schedule_generation(doctor_id, day):
+    key = generation_key(doctor_id, day)
+    generation = cache.get(key)
+    if generation is None:
+        # Starts from the clock, so a generation lost to expiry or eviction
+        # is not handed out again while entries stored under it live.
+        cache.add(key, time.time_ns(), SCHEDULE_CACHE_TIMEOUT)
+        generation = cache.get(key, 0)
+    return generation
+
+
+def schedule_key(doctor_id, day, generation):
+    return f'appointments:schedule:{doctor_id}:{day.isoformat()}:{generation}'
+
+
+def build_day_schedule(doctor_id, day):
+    day_start, day_end = day_bounds(day)
+    entries = tuple(
+        Appointment.objects
+        .filter(doctor_id=doctor_id, appointment_time__gte=day_start, appointment_time__lt=day_end)
+        .order_by('appointment_time', 'id')
+        .values_list('appointment_time', 'duration', 'status', 'patient_id', 'id')
+    )
+    digest = hashlib.sha1(repr(entries).encode()).hexdigest()
+    return {'etag': f'"{digest}"', 'entries': entries}
+
+
+def get_day_schedule(doctor_id, day):
+    # Read before the rows: a booking that commits during the build bumps
+    # the generation, so this build is stored where readers no longer look.
+    key = schedule_key(doctor_id, day, schedule_generation(doctor_id, day))
+    schedule = cache.get(key)
+    if schedule is None:
+        schedule = build_day_schedule(doctor_id, day)
+        cache.set(key, schedule, SCHEDULE_CACHE_TIMEOUT)
+    return schedule
+
+
+def serialize_schedule(doctor_id, day, schedule):
+    return {
+        'doctor': doctor_id,
+        'date': day,
+        'appointments': [
+            {
+                'id': appointment_id,
+                'start': start,
+                'end': start + timedelta(minutes=duration),
+                'status': status,
+                'patient': patient_id,
+            }
+            for start, duration, status, patient_id, appointment_id in schedule['entries']
+        ],
+    }
+
+
+def invalidate_day(doctor_id, when):
+    if doctor_id is None or when is None:
+        return
+    try:
+        cache.incr(generation_key(doctor_id, timezone.localdate(when)))
+    except ValueError:
+        # No generation stored; the next read starts a new one.
+        pass
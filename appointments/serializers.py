@@ -1,6 +1,9 @@
 from rest_framework import serializers
-from .models import Appointment
+from .booking import SlotUnavailable, book_appointment, interval, overlapping, save_booking
+from .models import Appointment, WaitlistEntry
+from .utilization import GROUPINGS
 from django.utils import timezone
+from datetime import timedelta
 
 class AppointmentSerializer(serializers.ModelSerializer):
     class Meta:
@@ -10,6 +13,8 @@ class AppointmentSerializer(serializers.ModelSerializer):
             'created_at', 'notes', 'reason', 'duration'
         ]
         read_only_fields = ['id', 'patient', 'status', 'created_at']
+        # Slot conflicts are checked against intervals by the booking service.
+        validators = []
 
     def validate_appointment_time(self, value):
         if value < timezone.now():
@@ -17,13 +22,153 @@ class AppointmentSerializer(serializers.ModelSerializer):
         return value
 
     def validate(self, data):
-        doctor = data.get('doctor')
-        time   = data.get('appointment_time')
-        if Appointment.objects.filter(doctor=doctor, appointment_time=time).exists():
+        instance = self.instance
+        doctor   = data.get('doctor', getattr(instance, 'doctor', None))
+        time     = data.get('appointment_time', getattr(instance, 'appointment_time', None))
+        duration = data.get('duration', getattr(instance, 'duration', 30))
+        if doctor is None or time is None:
+            return data
+        start, end = interval(time, duration)
+        if overlapping(doctor.pk, start, end, exclude_pk=getattr(instance, 'pk', None)).exists():
             raise serializers.ValidationError("This slot is already booked.")
         return data
 
     def create(self, validated_data):
-        user = self.context['request'].user
-        patient = user.patient
-        return Appointment.objects.create(patient=patient, **validated_data)
+        patient_id = self.context['request'].user.patient_id
+        try:
+            return book_appointment(patient_id=patient_id, doctor_id=validated_data.pop('doctor').pk, **validated_data)
+        except SlotUnavailable as exc:
+            raise serializers.ValidationError(str(exc))
+
+    def update(self, instance, validated_data):
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        try:
+            return save_booking(instance)
+        except SlotUnavailable as exc:
+            raise serializers.ValidationError(str(exc))
+
+
+class FreeSlotQuerySerializer(serializers.Serializer):
+    MAX_RANGE_DAYS = 31
+
+    doctors        = serializers.CharField(required=False, help_text="Comma-separated doctor ids")
+    specialization = serializers.CharField(required=False)
+    branch         = serializers.IntegerField(required=False)
+    start          = serializers.DateField(required=False)
+    end            = serializers.DateField(required=False)
+    duration       = serializers.IntegerField(required=False, default=30, min_value=5, max_value=8 * 60)
+    limit          = serializers.IntegerField(required=False, default=5, min_value=1, max_value=50)
+
+    def validate_doctors(self, value):
+        try:
+            return [int(part) for part in value.split(',') if part.strip()]
+        except ValueError:
+            raise serializers.ValidationError("Doctor ids must be integers.")
+
+    def validate(self, data):
+        if not (data.get('doctors') or data.get('specialization') or data.get('branch')):
+            raise serializers.ValidationError("Provide doctors, specialization or branch.")
+        start = data.get('start') or timezone.localdate()
+        end = data.get('end') or start + timedelta(days=6)
+        if end < start:
+            raise serializers.ValidationError("End date must not be before start date.")
+        if (end - start).days >= self.MAX_RANGE_DAYS:
+            raise serializers.ValidationError(f"Date range is limited to {self.MAX_RANGE_DAYS} days.")
+        data['start'], data['end'] = start, end
+        return data
+
+
+class BulkAppointmentItemSerializer(serializers.Serializer):
+    patient          = serializers.IntegerField(required=False)
+    doctor           = serializers.IntegerField()
+    appointment_time = serializers.DateTimeField()
+    duration         = serializers.IntegerField(default=30, min_value=1)
+    reason           = serializers.CharField(required=False, allow_blank=True, default='')
+    notes            = serializers.CharField(required=False, allow_blank=True, default='')
+
+    def validate_appointment_time(self, value):
+        if value < timezone.now():
+            raise serializers.ValidationError("Appointment time must be in the future.")
+        return value
+
+
+class RecurrenceSerializer(serializers.Serializer):
+    patient       = serializers.IntegerField(required=False)
+    doctor        = serializers.IntegerField()
+    start         = serializers.DateTimeField()
+    interval_days = serializers.IntegerField(default=7, min_value=1)
+    count         = serializers.IntegerField(min_value=1)
+    duration      = serializers.IntegerField(default=30, min_value=1)
+    reason        = serializers.CharField(required=False, allow_blank=True, default='')
+
+    def validate_start(self, value):
+        if value < timezone.now():
+            raise serializers.ValidationError("Appointment time must be in the future.")
+        return value
+
+    @staticmethod
+    def expand(data):
+        return [
+            {
+                'patient': data.get('patient'),
+                'doctor': data['doctor'],
+                'appointment_time': data['start'] + timedelta(days=data['interval_days'] * i),
+                'duration': data['duration'],
+                'reason': data['reason'],
+                'notes': '',
+            }
+            for i in range(data['count'])
+        ]
+
+
+class BulkAppointmentSerializer(serializers.Serializer):
+    """Either an explicit list of appointments or a recurrence to expand."""
+    MAX_ITEMS = 2000
+
+    appointments   = BulkAppointmentItemSerializer(many=True, required=False)
+    recurrence     = RecurrenceSerializer(required=False)
+    all_or_nothing = serializers.BooleanField(default=False)
+
+    def validate(self, data):
+        if bool(data.get('appointments')) == bool(data.get('recurrence')):
+            raise serializers.ValidationError("Provide either appointments or recurrence.")
+        if data.get('recurrence'):
+            data['appointments'] = RecurrenceSerializer.expand(data['recurrence'])
+        if len(data['appointments']) > self.MAX_ITEMS:
+            raise serializers.ValidationError(f"At most {self.MAX_ITEMS} appointments per request.")
+        return data
+
+
+class WaitlistEntrySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = WaitlistEntry
+        fields = ['id', 'doctor', 'earliest', 'latest', 'duration', 'reason', 'status', 'appointment', 'created_at']
+        read_only_fields = ['id', 'status', 'appointment', 'created_at']
+
+    def validate(self, data):
+        if data['latest'] <= timezone.now():
+            raise serializers.ValidationError("The waiting window must end in the future.")
+        if data['latest'] < data['earliest'] + timedelta(minutes=data.get('duration', 30)):
+            raise serializers.ValidationError("The waiting window is shorter than the requested duration.")
+        return data
+
+
+class UtilizationQuerySerializer(serializers.Serializer):
+    MAX_RANGE_DAYS = 366
+
+    start  = serializers.DateField(required=False)
+    end    = serializers.DateField(required=False)
+    group  = serializers.ChoiceField(choices=sorted(GROUPINGS), default='day')
+    branch = serializers.IntegerField(required=False)
+    doctor = serializers.IntegerField(required=False)
+
+    def validate(self, data):
+        end = data.get('end') or timezone.localdate()
+        start = data.get('start') or end - timedelta(days=29)
+        if end < start:
+            raise serializers.ValidationError("End date must not be before start date.")
+        if (end - start).days >= self.MAX_RANGE_DAYS:
+            raise serializers.ValidationError(f"Date range is limited to {self.MAX_RANGE_DAYS} days.")
+        data['start'], data['end'] = start, end
+        return data
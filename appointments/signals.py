@@ -0,0 +1,93 @@
+from django.db import router, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from hospital_app.sharding import use_shard
+
+from .models import Appointment, AppointmentChange
+
+# Sent after Appointment rows are inserted with bulk_create, which bypasses
+# post_save. Receivers get `appointments`, the list of created instances.
+appointments_bulk_created = Signal()
+
+
+def _reminders_affected(instance, created):
+    original = instance.original
+    return created or any(
+        original.get(name) != getattr(instance, name) for name in ('appointment_time', 'status')
+    )
+
+
+def _utilization_state(values):
+    return (values.get('doctor_id'), values.get('appointment_time'), values.get('duration'), values.get('status'))
+
+
+def _backfill(doctor_id, start, end, cancelled_by, using):
+    from .waitlist import backfill_slot
+    with use_shard(using):
+        backfill_slot(doctor_id, start, end, cancelled_by)
+
+
+def _invalidate_schedules(days):
+    from .schedule import invalidate_day
+    for doctor_id, when in days:
+        invalidate_day(doctor_id, when)
+
+
+@receiver(post_save, sender=Appointment)
+def appointment_saved(sender, instance, created, using, **kwargs):
+    # Derived rows go to the appointment's own shard.
+    with use_shard(using):
+        _appointment_saved(instance, created, using)
+
+
+def _appointment_saved(instance, created, using):
+    from .reminders import schedule_reminders
+    from .sync import record_changes
+    from .utilization import record_appointment_change
+    days = {(instance.doctor_id, instance.appointment_time)}
+    original = instance.original
+    if original:
+        days.add((original.get('doctor_id'), original.get('appointment_time')))
+    transaction.on_commit(lambda: _invalidate_schedules(days), using=using)
+
+    record_changes([(instance.patient_id, instance.pk)])
+    previous_patient = original.get('patient_id')
+    if previous_patient and previous_patient != instance.patient_id:
+        record_changes([(previous_patient, instance.pk)], kind=AppointmentChange.DELETE)
+
+    if _reminders_affected(instance, created):
+        schedule_reminders([instance], replace=not created)
+
+    current = {name: getattr(instance, name) for name in Appointment.TRACKED_FIELDS}
+    previous = _utilization_state(original) if original else None
+    if previous != _utilization_state(current):
+        record_appointment_change(previous, _utilization_state(current))
+
+    if original and original.get('status') != 'CANCELLED' and instance.status == 'CANCELLED':
+        freed = (instance.doctor_id, instance.appointment_time, instance.end_time, instance.patient_id)
+        transaction.on_commit(lambda: _backfill(*freed, using), using=using)
+
+
+@receiver(post_delete, sender=Appointment)
+def appointment_deleted(sender, instance, using, **kwargs):
+    from .sync import record_changes
+    from .utilization import record_appointment_change
+    days = {(instance.doctor_id, instance.appointment_time)}
+    transaction.on_commit(lambda: _invalidate_schedules(days), using=using)
+    with use_shard(using):
+        record_changes([(instance.patient_id, instance.pk)], kind=AppointmentChange.DELETE)
+        stored = instance.original or {name: getattr(instance, name) for name in Appointment.TRACKED_FIELDS}
+        record_appointment_change(_utilization_state(stored), None)
+
+
+@receiver(appointments_bulk_created, sender=Appointment)
+def appointments_bulk_created_handler(sender, appointments, **kwargs):
+    from .reminders import schedule_reminders
+    from .sync import record_changes
+    from .utilization import record_bulk_created
+    days = {(appointment.doctor_id, appointment.appointment_time) for appointment in appointments}
+    transaction.on_commit(lambda: _invalidate_schedules(days), using=router.db_for_write(Appointment))
+    record_changes([(appointment.patient_id, appointment.pk) for appointment in appointments])
+    schedule_reminders(appointments, replace=False)
+    record_bulk_created(appointments)
@@ -0,0 +1,141 @@
+"""
+Delta sync for mobile clients.
+
+Every appointment write appends an AppointmentChange row in the same
+transaction. Clients hold an opaque token encoding the last change
+position they have seen and when it was issued; a sync returns only the
+appointments touched since then, plus deleted ids.
+
+Change ids are allocated at insert time but transactions may commit out
+of order, so positions are (txid, id) pairs instead, where txid is the
+writing transaction's id (a trigger fills it in on Postgres, migration
+0009). Before reading, a sync takes the snapshot's xmin: every
+transaction with a lower id has finished, so its changes are visible.
+Tokens advance to a returned change only if its txid is below xmin, and
+otherwise to (xmin, 0), so changes from transactions at or above xmin
+are sent again next time; that is harmless because upserts and deletes
+are idempotent. Elsewhere txid is 0 and ids are the position, which is
+safe because SQLite serializes writers, so ids commit in order.
+
+Change ids come from the shard's own id range, so a token issued before
+the patient's hospital moved to this shard gets a full resync.
+"""
+import base64
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import Q
+from django.utils import timezone
+
+from hospital_app.sharding import shard_map
+
+from .models import Appointment, AppointmentChange
+
+SYNC_RETENTION_DAYS = getattr(settings, 'APPOINTMENT_SYNC_RETENTION_DAYS', 90)
+SYNC_MAX_CHANGES = getattr(settings, 'APPOINTMENT_SYNC_MAX_CHANGES', 500)
+
+
+def commit_horizon(using):
+    """Lowest transaction id that may still be running on `using`; None if ids commit in order."""
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint')
+        return cursor.fetchone()[0]
+
+
+def encode_token(position, issued_at=None):
+    issued_at = issued_at or timezone.now()
+    txid, change_id = position
+    raw = f'v2:{txid}:{change_id}:{int(issued_at.timestamp())}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_token(token):
+    """Return ((txid, change_id), issued_at) or None if the token is missing, malformed or old."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+        version, txid, change_id, issued = raw.split(':')
+        if version != 'v2':
+            return None
+        return (int(txid), int(change_id)), datetime.fromtimestamp(int(issued), tz=dt_timezone.utc)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def record_changes(appointments, kind=AppointmentChange.UPSERT):
+    AppointmentChange.objects.bulk_create([
+        AppointmentChange(patient_id=patient_id, appointment_id=appointment_id, kind=kind)
+        for patient_id, appointment_id in appointments
+    ])
+
+
+def latest_position(using, horizon):
+    """Position covering every change committed before `horizon` was taken."""
+    if horizon is not None:
+        return horizon, 0
+    latest = AppointmentChange.objects.using(using).order_by('-id').values_list('id', flat=True).first()
+    return 0, latest or 0
+
+
+def sync_appointments(patient_id, token=None):
+    """
+    Returns a dict with `token`, `full` (client must replace its copy),
+    `has_more`, `appointments` (queryset of current rows) and `deleted` ids.
+    """
+    now = timezone.now()
+    position = decode_token(token)
+    using = router.db_for_read(AppointmentChange)
+    arrival = shard_map.last_arrival(using)
+    # Taken before any read, so transactions below it are visible to them.
+    horizon = commit_horizon(using)
+    if (
+        position is None
+        or position[1] < now - timedelta(days=SYNC_RETENTION_DAYS)
+        or (arrival is not None and position[1] < arrival)
+    ):
+        return {
+            'token': encode_token(latest_position(using, horizon), now),
+            'full': True,
+            'has_more': False,
+            'appointments': Appointment.objects.filter(patient_id=patient_id).order_by('appointment_time', 'id'),
+            'deleted': [],
+        }
+
+    since = position[0]
+    changes = list(
+        AppointmentChange.objects.using(using)
+        .filter(Q(txid__gt=since[0]) | Q(txid=since[0], id__gt=since[1]), patient_id=patient_id)
+        .order_by('txid', 'id')
+        .values_list('txid', 'id', 'appointment_id', 'kind')[:SYNC_MAX_CHANGES + 1]
+    )
+    has_more = len(changes) > SYNC_MAX_CHANGES
+    changes = changes[:SYNC_MAX_CHANGES]
+
+    latest = {}
+    for _, _, appointment_id, kind in changes:
+        latest[appointment_id] = kind
+    upserted = [appointment_id for appointment_id, kind in latest.items() if kind == AppointmentChange.UPSERT]
+    appointments = Appointment.objects.filter(patient_id=patient_id, id__in=upserted).order_by('appointment_time', 'id')
+    deleted = sorted(appointment_id for appointment_id, kind in latest.items() if kind == AppointmentChange.DELETE)
+
+    next_position = since
+    if changes and (horizon is None or changes[-1][0] < horizon):
+        next_position = changes[-1][:2]
+    else:
+        # The page ends past xmin, where an earlier transaction may still
+        # commit; the rest comes on a later sync, once it has finished.
+        has_more = False
+    if horizon is not None and not has_more:
+        next_position = max(next_position, (horizon, 0))
+    return {
+        'token': encode_token(next_position, now),
+        'full': False,
+        'has_more': has_more,
+        'appointments': appointments,
+        'deleted': deleted,
+    }
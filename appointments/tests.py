@@ -1,12 +1,28 @@
+import importlib
+import io
+import threading
+import time as time_module
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections, transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from rest_framework.test import APITestCase
+from rest_framework.test import APITestCase, APITransactionTestCase
 from rest_framework import status
-from .models import Appointment
-from hospitals.models import Hospital, HospitalBranch, Doctor
+from .booking import SlotUnavailable, book_appointment, book_many, save_booking
+from .models import Appointment, AppointmentChange, AppointmentReminder, DoctorDailyUtilization, WaitlistEntry
+from . import schedule
+from .reminders import LocmemReminderSender, ReminderWorker
+from .sync import sync_appointments
+from .waitlist import backfill_slot
+from hospitals.models import Hospital, HospitalBranch, Doctor, DoctorAvailability, DoctorAvailabilityException
 from patients.models import Patient
 from authentication.models import User
 from django.utils import timezone
-from datetime import timedelta
+from datetime import datetime, time, timedelta
+from unittest import mock, skipUnless
 
 
 class AppointmentTests(APITestCase):
@@ -178,4 +194,594 @@ class AppointmentTests(APITestCase):
             url = f'/api/appointments/{appointment.id}/'
         response = self.client.delete(url)
         self.assertIn(response.status_code, [200, 204, 202, 204])
-        self.assertFalse(Appointment.objects.filter(id=appointment.id).exists())
\ No newline at end of file
+        self.assertFalse(Appointment.objects.filter(id=appointment.id).exists())
+
+    def test_overlapping_booking_rejected(self):
+        start = timezone.now() + timedelta(days=10)
+        Appointment.objects.create(patient=self.patient, doctor=self.doctor, appointment_time=start, duration=30)
+        data = {
+            'doctor': self.doctor.id,
+            'appointment_time': (start + timedelta(minutes=15)).isoformat(),
+            'reason': 'Overlap',
+        }
+        response = self.client.post('/api/appointments/my/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('This slot is already booked.', str(response.data))
+        data['appointment_time'] = (start + timedelta(minutes=30)).isoformat()
+        response = self.client.post('/api/appointments/my/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_cancelled_appointment_frees_slot(self):
+        start = timezone.now() + timedelta(days=11)
+        Appointment.objects.create(patient=self.patient, doctor=self.doctor, appointment_time=start, status='CANCELLED')
+        appointment = book_appointment(patient_id=self.patient.id, doctor_id=self.doctor.id, appointment_time=start)
+        self.assertEqual(appointment.end_time, start + timedelta(minutes=30))
+
+    def test_rescheduling_into_overlap_rejected(self):
+        start = timezone.now() + timedelta(days=12)
+        Appointment.objects.create(patient=self.patient, doctor=self.doctor, appointment_time=start, duration=60)
+        other = Appointment.objects.create(patient=self.patient, doctor=self.doctor, appointment_time=start + timedelta(hours=2))
+        with self.assertRaises(SlotUnavailable):
+            other.appointment_time = start + timedelta(minutes=45)
+            save_booking(other)
+
+
+class FreeSlotTests(APITestCase):
+    def setUp(self):
+        self.hospital = Hospital.objects.create(name='Slot Hospital', email='slots@example.com', address='1 St', phone='1234567890')
+        self.branch = HospitalBranch.objects.create(hospital=self.hospital, name='Slot Branch', address='1 St', phone='1234567890', city='City', state='State')
+        self.cardiologist = Doctor.objects.create(branch=self.branch, name='Dr. Heart', specialization='Cardiology')
+        self.pediatrician = Doctor.objects.create(branch=self.branch, name='Dr. Kid', specialization='Pediatrics')
+        self.day = timezone.localdate() + timedelta(days=7)
+        for doctor in (self.cardiologist, self.pediatrician):
+            DoctorAvailability.objects.create(doctor=doctor, weekday=self.day.weekday(), start_time=time(9), end_time=time(11))
+        self.user = User.objects.create_user(email='slots@example.com', password='testpass123', full_name='Slot User')
+        self.patient = Patient.objects.get(user=self.user)
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('free-slots')
+
+    def _at(self, hour, minute=0):
+        return timezone.make_aware(datetime.combine(self.day, time(hour, minute)))
+
+    def test_free_slots_skip_booked_intervals(self):
+        Appointment.objects.create(patient=self.patient, doctor=self.cardiologist, appointment_time=self._at(9), duration=45)
+        response = self.client.get(self.url, {'doctors': self.cardiologist.id, 'start': self.day, 'end': self.day, 'limit': 10})
+        self.assertEqual(response.status_code, 200)
+        starts = [slot['start'] for slot in response.data['results'][0]['slots']]
+        self.assertEqual(starts[0], self._at(9, 45))
+        self.assertEqual(starts[-1], self._at(10, 30))
+        self.assertEqual(len(starts), 4)
+
+    def test_partial_slots_fall_outside_working_hours(self):
+        DoctorAvailability.objects.filter(doctor=self.pediatrician).update(start_time=time(9, 10), end_time=time(10, 50))
+        response = self.client.get(self.url, {'doctors': self.pediatrician.id, 'start': self.day, 'end': self.day, 'limit': 10})
+        starts = [slot['start'] for slot in response.data['results'][0]['slots']]
+        self.assertEqual((starts[0], starts[-1]), (self._at(9, 15), self._at(10, 15)))
+
+    def test_exception_removes_day(self):
+        DoctorAvailabilityException.objects.create(doctor=self.cardiologist, date=self.day)
+        response = self.client.get(self.url, {'specialization': 'cardiology', 'start': self.day, 'end': self.day})
+        self.assertEqual(response.data['results'], [])
+
+    def test_query_count_is_fixed_across_doctors(self):
+        for i in range(10):
+            doctor = Doctor.objects.create(branch=self.branch, name=f'Dr. {i}', specialization='Cardiology')
+            DoctorAvailability.objects.create(doctor=doctor, weekday=self.day.weekday(), start_time=time(9), end_time=time(17))
+        with self.assertNumQueries(4):
+            response = self.client.get(self.url, {'branch': self.branch.id, 'start': self.day, 'end': self.day, 'limit': 2})
+        self.assertEqual(len(response.data['results']), 12)
+
+    def test_requires_doctor_filter(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 400)
+
+
+class BulkAppointmentTests(APITestCase):
+    def setUp(self):
+        self.hospital = Hospital.objects.create(name='Bulk Hospital', email='bulk@example.com', address='1 St', phone='1234567890')
+        self.branch = HospitalBranch.objects.create(hospital=self.hospital, name='Bulk Branch', address='1 St', phone='1234567890', city='City', state='State')
+        self.doctor = Doctor.objects.create(branch=self.branch, name='Dr. Physio', specialization='Physiotherapy')
+        self.user = User.objects.create_user(email='bulk@example.com', password='testpass123', full_name='Bulk Patient')
+        self.patient = Patient.objects.get(user=self.user)
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('appointment-bulk')
+        self.start = (timezone.now() + timedelta(days=1)).replace(microsecond=0)
+
+    def test_weekly_recurrence(self):
+        data = {'recurrence': {'doctor': self.doctor.id, 'start': self.start.isoformat(), 'count': 12}}
+        response = self.client.post(self.url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['booked'], 12)
+        times = list(Appointment.objects.filter(patient=self.patient).order_by('appointment_time').values_list('appointment_time', flat=True))
+        self.assertEqual(times[1] - times[0], timedelta(days=7))
+
+    def test_conflicts_reported_per_item(self):
+        Appointment.objects.create(patient=self.patient, doctor=self.doctor, appointment_time=self.start)
+        items = [
+            {'doctor': self.doctor.id, 'appointment_time': (self.start + timedelta(minutes=15)).isoformat()},
+            {'doctor': self.doctor.id, 'appointment_time': (self.start + timedelta(hours=1)).isoformat()},
+            {'doctor': self.doctor.id, 'appointment_time': (self.start + timedelta(hours=1, minutes=10)).isoformat()},
+        ]
+        with self.assertNumQueries(14):
+            response = self.client.post(self.url, {'appointments': items}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([result['status'] for result in response.data['results']], ['conflict', 'booked', 'conflict'])
+
+    def test_conflict_with_overlapping_legacy_rows(self):
+        # [0:00-3:00] and [0:30-0:45] overlap, as rows from before overlap checks can.
+        Appointment.objects.bulk_create([
+            Appointment(patient=self.patient, doctor=self.doctor, appointment_time=self.start, duration=180,
+                        end_time=self.start + timedelta(hours=3)),
+            Appointment(patient=self.patient, doctor=self.doctor, appointment_time=self.start + timedelta(minutes=30),
+                        duration=15, end_time=self.start + timedelta(minutes=45)),
+        ])
+        # The earlier item widens the fetched window so both legacy rows are loaded.
+        results = book_many([
+            {'patient_id': self.patient.id, 'doctor_id': self.doctor.id,
+             'appointment_time': self.start - timedelta(hours=1), 'duration': 30},
+            {'patient_id': self.patient.id, 'doctor_id': self.doctor.id,
+             'appointment_time': self.start + timedelta(hours=1), 'duration': 30},
+        ])
+        self.assertEqual([result['status'] for result in results], ['booked', 'conflict'])
+
+    def test_all_or_nothing(self):
+        items = [
+            {'doctor': self.doctor.id, 'appointment_time': self.start.isoformat()},
+            {'doctor': self.doctor.id, 'appointment_time': self.start.isoformat()},
+        ]
+        response = self.client.post(self.url, {'appointments': items, 'all_or_nothing': True}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertFalse(Appointment.objects.filter(doctor=self.doctor).exists())
+
+
+class OverlapConstraintMigrationTests(APITestCase):
+    migration = importlib.import_module('appointments.migrations.0003_appointment_end_time')
+
+    def setUp(self):
+        hospital = Hospital.objects.create(name='Legacy Hospital', email='legacy@example.com', address='1 St', phone='1234567890')
+        branch = HospitalBranch.objects.create(hospital=hospital, name='Legacy Branch', address='1 St', phone='1234567890', city='City', state='State')
+        self.doctor = Doctor.objects.create(branch=branch, name='Dr. Legacy', specialization='General')
+        self.patient = Patient.objects.get(user=User.objects.create_user(email='legacy@example.com', password='testpass123', full_name='Legacy Patient'))
+        self.start = (timezone.now() + timedelta(days=1)).replace(microsecond=0)
+
+    def test_overlapping_rows_are_listed_before_the_constraint(self):
+        # Written before overlap checks existed; the cancelled one does not count.
+        long, short, _ = Appointment.objects.bulk_create([
+            Appointment(patient=self.patient, doctor=self.doctor, appointment_time=self.start, duration=180,
+                        end_time=self.start + timedelta(hours=3)),
+            Appointment(patient=self.patient, doctor=self.doctor, appointment_time=self.start + timedelta(minutes=30),
+                        duration=15, end_time=self.start + timedelta(minutes=45)),
+            Appointment(patient=self.patient, doctor=self.doctor, appointment_time=self.start + timedelta(hours=1),
+                        duration=30, end_time=self.start + timedelta(hours=1, minutes=30), status='CANCELLED'),
+        ])
+        pairs = self.migration.overlapping_active_pairs(connection)
+        self.assertEqual([(first, second) for _, first, _, _, second, _, _ in pairs], [(long.id, short.id)])
+
+        schema_editor = mock.Mock(connection=connection)
+        with mock.patch.object(connection, 'vendor', 'postgresql'):
+            with self.assertRaisesMessage(RuntimeError, f'appointment {long.id} ('):
+                self.migration.add_exclusion_constraint(None, schema_editor)
+        schema_editor.execute.assert_not_called()
+
+
+class AppointmentListPaginationTests(APITestCase):
+    def setUp(self):
+        self.hospital = Hospital.objects.create(name='Page Hospital', email='page@example.com', address='1 St', phone='1234567890')
+        self.branch = HospitalBranch.objects.create(hospital=self.hospital, name='Page Branch', address='1 St', phone='1234567890', city='City', state='State')
+        self.doctor_user = User.objects.create_user(email='doc@example.com', password='testpass123', full_name='Doc', role='DOCTOR')
+        self.doctor = Doctor.objects.create(branch=self.branch, user=self.doctor_user, name='Dr. Page', specialization='General')
+        self.user = User.objects.create_user(email='page@example.com', password='testpass123', full_name='Page Patient')
+        self.patient = Patient.objects.get(user=self.user)
+        self.start = timezone.now() + timedelta(days=1)
+        for i in range(7):
+            Appointment.objects.create(
+                patient=self.patient, doctor=self.doctor,
+                appointment_time=self.start + timedelta(days=i),
+                status='CANCELLED' if i % 3 == 0 else 'PENDING',
+            )
+
+    def test_patient_list_is_cursor_paginated_in_time_order(self):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get('/api/appointments/my/', {'page_size': 3})
+        seen = [item['id'] for item in response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            seen.extend(item['id'] for item in response.data['results'])
+        expected = list(Appointment.objects.order_by('appointment_time', 'id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_doctor_list_filters_by_status_and_range(self):
+        self.client.force_authenticate(user=self.doctor_user)
+        end = (self.start + timedelta(days=4)).date().isoformat()
+        response = self.client.get(reverse('doctor-appointments'), {'status': 'pending', 'end': end})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 3)
+        self.assertTrue(all(item['status'] == 'PENDING' for item in response.data['results']))
+
+    def test_invalid_status_filter(self):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get('/api/appointments/my/', {'status': 'bogus'})
+        self.assertEqual(response.status_code, 400)
+
+
+class DoctorDayScheduleTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.hospital = Hospital.objects.create(name='Desk Hospital', email='desk@example.com', address='1 St', phone='1234567890')
+        self.branch = HospitalBranch.objects.create(hospital=self.hospital, name='Desk Branch', address='1 St', phone='1234567890', city='City', state='State')
+        self.doctor = Doctor.objects.create(branch=self.branch, name='Dr. Desk', specialization='General')
+        self.user = User.objects.create_user(email='patient-desk@example.com', password='testpass123', full_name='Desk Patient')
+        self.patient = Patient.objects.get(user=self.user)
+        self.staff = User.objects.create_user(email='frontdesk@example.com', password='testpass123', full_name='Front Desk', role='ADMIN')
+        self.client.force_authenticate(user=self.staff)
+        self.day = timezone.localdate() + timedelta(days=1)
+        self.url = reverse('doctor-day-schedule', args=[self.doctor.id])
+        self.at_nine = timezone.make_aware(datetime.combine(self.day, time(9)))
+
+    def test_repeated_polls_use_cache_and_etag(self):
+        Appointment.objects.create(patient=self.patient, doctor=self.doctor, appointment_time=self.at_nine)
+        response = self.client.get(self.url, {'date': self.day})
+        self.assertEqual(len(response.data['appointments']), 1)
+        self.assertEqual(response.data['appointments'][0]['patient'], self.patient.id)
+        with self.assertNumQueries(0):
+            cached = self.client.get(self.url, {'date': self.day}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+
+    def test_save_and_delete_invalidate_day(self):
+        response = self.client.get(self.url, {'date': self.day})
+        self.assertEqual(response.data['appointments'], [])
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment = Appointment.objects.create(patient=self.patient, doctor=self.doctor, appointment_time=self.at_nine)
+        response = self.client.get(self.url, {'date': self.day}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['appointments']), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment.appointment_time = self.at_nine + timedelta(days=1)
+            appointment.save()
+        self.assertEqual(self.client.get(self.url, {'date': self.day}).data['appointments'], [])
+
+    def test_rebuild_racing_a_booking_is_not_served(self):
+        build = schedule.build_day_schedule
+
+        def build_then_book(doctor_id, day):
+            stale = build(doctor_id, day)
+            with self.captureOnCommitCallbacks(execute=True):
+                Appointment.objects.create(patient=self.patient, doctor=self.doctor, appointment_time=self.at_nine)
+            return stale
+
+        with mock.patch('appointments.schedule.build_day_schedule', side_effect=build_then_book):
+            self.assertEqual(schedule.get_day_schedule(self.doctor.id, self.day)['entries'], ())
+        self.assertEqual(len(schedule.get_day_schedule(self.doctor.id, self.day)['entries']), 1)
+
+    def test_patients_cannot_read_schedules(self):
+        self.client.force_authenticate(user=self.user)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+
+class AppointmentSyncTests(APITestCase):
+    def setUp(self):
+        self.hospital = Hospital.objects.create(name='Sync Hospital', email='sync@example.com', address='1 St', phone='1234567890')
+        self.branch = HospitalBranch.objects.create(hospital=self.hospital, name='Sync Branch', address='1 St', phone='1234567890', city='City', state='State')
+        self.doctor = Doctor.objects.create(branch=self.branch, name='Dr. Sync', specialization='General')
+        self.user = User.objects.create_user(email='sync@example.com', password='testpass123', full_name='Sync Patient')
+        self.patient = Patient.objects.get(user=self.user)
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('appointment-sync')
+        self.start = timezone.now() + timedelta(days=1)
+        self.first = Appointment.objects.create(patient=self.patient, doctor=self.doctor, appointment_time=self.start)
+        self.second = Appointment.objects.create(patient=self.patient, doctor=self.doctor, appointment_time=self.start + timedelta(hours=1))
+
+    def test_full_then_incremental_sync(self):
+        response = self.client.get(self.url)
+        self.assertTrue(response.data['full'])
+        self.assertEqual(len(response.data['appointments']), 2)
+
+        response = self.client.get(self.url, {'since': response.data['token']})
+        self.assertFalse(response.data['full'])
+        self.assertEqual(response.data['appointments'], [])
+        self.assertEqual(response.data['deleted'], [])
+
+        self.first.status = 'CANCELLED'
+        self.first.save()
+        second_id = self.second.id
+        self.second.delete()
+        response = self.client.get(self.url, {'since': response.data['token']})
+        self.assertEqual([item['id'] for item in response.data['appointments']], [self.first.id])
+        self.assertEqual(response.data['appointments'][0]['status'], 'CANCELLED')
+        self.assertEqual(response.data['deleted'], [second_id])
+
+    def test_bulk_bookings_are_logged(self):
+        token = self.client.get(self.url).data['token']
+        book_many([{'patient_id': self.patient.id, 'doctor_id': self.doctor.id, 'appointment_time': self.start + timedelta(days=1), 'duration': 30}])
+        response = self.client.get(self.url, {'since': token})
+        self.assertEqual(len(response.data['appointments']), 1)
+
+    def test_pages_advance_the_token(self):
+        token = self.client.get(self.url).data['token']
+        self.first.save()
+        self.second.save()
+        with mock.patch('appointments.sync.SYNC_MAX_CHANGES', 1):
+            response = self.client.get(self.url, {'since': token})
+            self.assertTrue(response.data['has_more'])
+            self.assertEqual([item['id'] for item in response.data['appointments']], [self.first.id])
+            response = self.client.get(self.url, {'since': response.data['token']})
+        self.assertFalse(response.data['has_more'])
+        self.assertEqual([item['id'] for item in response.data['appointments']], [self.second.id])
+
+    @mock.patch('appointments.sync.commit_horizon')
+    def test_token_stays_below_running_transactions(self, horizon):
+        # Transaction 8 is still running when transaction 9 commits a change.
+        horizon.return_value = 8
+        token = self.client.get(self.url).data['token']
+        third = Appointment.objects.create(patient=self.patient, doctor=self.doctor, appointment_time=self.start + timedelta(hours=2))
+        AppointmentChange.objects.filter(appointment_id=third.id).update(txid=9)
+        response = self.client.get(self.url, {'since': token})
+        self.assertEqual([item['id'] for item in response.data['appointments']], [third.id])
+
+        # Transaction 8 commits with a higher change id; the token has not passed it.
+        fourth = Appointment.objects.create(patient=self.patient, doctor=self.doctor, appointment_time=self.start + timedelta(hours=3))
+        AppointmentChange.objects.filter(appointment_id=fourth.id).update(txid=8)
+        horizon.return_value = 10
+        response = self.client.get(self.url, {'since': response.data['token']})
+        self.assertEqual([item['id'] for item in response.data['appointments']], [third.id, fourth.id])
+        response = self.client.get(self.url, {'since': response.data['token']})
+        self.assertEqual(response.data['appointments'], [])
+
+    def test_invalid_token_forces_full_sync(self):
+        response = self.client.get(self.url, {'since': 'not-a-token'})
+        self.assertTrue(response.data['full'])
+
+    def test_deleting_patient_with_appointments(self):
+        self.patient.delete()
+        self.assertFalse(Appointment.objects.filter(id=self.first.id).exists())
+
+
+@skipUnless(connection.vendor == 'postgresql', 'needs concurrent Postgres transactions')
+class AppointmentSyncPostgresTests(APITransactionTestCase):
+    def setUp(self):
+        self.hospital = Hospital.objects.create(name='Sync Hospital', email='syncpg@example.com', address='1 St', phone='1234567890')
+        self.branch = HospitalBranch.objects.create(hospital=self.hospital, name='Sync Branch', address='1 St', phone='1234567890', city='City', state='State')
+        self.doctors = [
+            Doctor.objects.create(branch=self.branch, name=f'Dr. Sync {number}', specialization='General')
+            for number in range(2)
+        ]
+        self.user = User.objects.create_user(email='syncpg@example.com', password='testpass123', full_name='Sync Patient')
+        self.patient = Patient.objects.get(user=self.user)
+        self.start = timezone.now() + timedelta(days=1)
+
+    def test_change_committed_late_is_delivered(self):
+        token = sync_appointments(self.patient.id)['token']
+        written, release = threading.Event(), threading.Event()
+        slow = []
+
+        def slow_writer():
+            try:
+                with transaction.atomic():
+                    slow.append(Appointment.objects.create(patient=self.patient, doctor=self.doctors[0], appointment_time=self.start))
+                    written.set()
+                    release.wait(10)
+            finally:
+                connections.close_all()
+
+        thread = threading.Thread(target=slow_writer)
+        thread.start()
+        self.assertTrue(written.wait(10))
+        # Committed after the slow transaction took a lower change id.
+        fast = Appointment.objects.create(patient=self.patient, doctor=self.doctors[1], appointment_time=self.start)
+        result = sync_appointments(self.patient.id, token)
+        self.assertEqual([appointment.id for appointment in result['appointments']], [fast.id])
+
+        release.set()
+        thread.join()
+        result = sync_appointments(self.patient.id, result['token'])
+        self.assertIn(slow[0].id, [appointment.id for appointment in result['appointments']])
+
+
+class AppointmentReminderTests(APITestCase):
+    def setUp(self):
+        LocmemReminderSender.outbox = []
+        self.hospital = Hospital.objects.create(name='Remind Hospital', email='remind@example.com', address='1 St', phone='1234567890')
+        self.branch = HospitalBranch.objects.create(hospital=self.hospital, name='Remind Branch', address='1 St', phone='1234567890', city='City', state='State')
+        self.doctor = Doctor.objects.create(branch=self.branch, name='Dr. Remind', specialization='General')
+        self.user = User.objects.create_user(email='remind@example.com', password='testpass123', full_name='Remind Patient')
+        self.patient = Patient.objects.get(user=self.user)
+        self.start = timezone.now() + timedelta(days=2)
+        self.appointment = Appointment.objects.create(patient=self.patient, doctor=self.doctor, appointment_time=self.start)
+
+    def test_reminders_follow_appointment_changes(self):
+        due = sorted(self.appointment.reminders.values_list('remind_at', flat=True))
+        self.assertEqual(due, [self.start - timedelta(hours=24), self.start - timedelta(hours=1)])
+        self.appointment.appointment_time = self.start + timedelta(days=1)
+        self.appointment.save()
+        self.assertEqual(min(self.appointment.reminders.values_list('remind_at', flat=True)), self.start)
+        self.appointment.status = 'CANCELLED'
+        self.appointment.save()
+        self.assertFalse(self.appointment.reminders.exists())
+
+    def test_workers_do_not_double_send(self):
+        later = self.start - timedelta(minutes=30)
+        first = ReminderWorker(sender=LocmemReminderSender(), worker_id='a')
+        second = ReminderWorker(sender=LocmemReminderSender(), worker_id='b')
+        self.assertEqual(first.claim(later), 2)
+        self.assertEqual(second.claim(later), 0)
+        first.dispatch_due(later)
+        second.run_once(later)
+        self.assertEqual(len(LocmemReminderSender.outbox), 2)
+        self.assertEqual(LocmemReminderSender.outbox[0]['email'], 'remind@example.com')
+        self.assertFalse(AppointmentReminder.objects.filter(sent_at__isnull=True).exists())
+
+    def test_rescheduled_reminder_is_not_sent(self):
+        worker = ReminderWorker(sender=LocmemReminderSender(), worker_id='a')
+        worker.claim(self.start)
+        self.appointment.status = 'CANCELLED'
+        self.appointment.save()
+        worker.dispatch_due(self.start)
+        self.assertEqual(LocmemReminderSender.outbox, [])
+
+
+class WaitlistBackfillTests(APITestCase):
+    def setUp(self):
+        self.hospital = Hospital.objects.create(name='Wait Hospital', email='wait@example.com', address='1 St', phone='1234567890')
+        self.branch = HospitalBranch.objects.create(hospital=self.hospital, name='Wait Branch', address='1 St', phone='1234567890', city='City', state='State')
+        self.doctor = Doctor.objects.create(branch=self.branch, name='Dr. Wait', specialization='General')
+        self.booked_user = User.objects.create_user(email='booked@example.com', password='testpass123', full_name='Booked')
+        self.waiting_user = User.objects.create_user(email='waiting@example.com', password='testpass123', full_name='Waiting')
+        self.booked = Patient.objects.get(user=self.booked_user)
+        self.waiting = Patient.objects.get(user=self.waiting_user)
+        self.start = (timezone.now() + timedelta(days=3)).replace(microsecond=0)
+        self.appointment = Appointment.objects.create(patient=self.booked, doctor=self.doctor, appointment_time=self.start)
+
+    def _join(self, earliest, latest, **extra):
+        self.client.force_authenticate(user=self.waiting_user)
+        data = {'doctor': self.doctor.id, 'earliest': earliest.isoformat(), 'latest': latest.isoformat(), **extra}
+        response = self.client.post(reverse('waitlist'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return WaitlistEntry.objects.get(id=response.data['id'])
+
+    def test_cancellation_books_waitlisted_patient(self):
+        entry = self._join(self.start - timedelta(hours=1), self.start + timedelta(hours=2))
+        self.client.force_authenticate(user=self.booked_user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('appointment-cancel', args=[self.appointment.id]))
+        self.assertEqual(response.data['status'], 'CANCELLED')
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, 'BOOKED')
+        self.assertEqual(entry.appointment.patient, self.waiting)
+        self.assertEqual(entry.appointment.appointment_time, self.start)
+
+    def test_cancelling_patient_does_not_get_the_slot_back(self):
+        own = WaitlistEntry.objects.create(
+            patient=self.booked, doctor=self.doctor, duration=30,
+            earliest=self.start - timedelta(hours=1), latest=self.start + timedelta(hours=2),
+        )
+        entry = self._join(self.start - timedelta(hours=1), self.start + timedelta(hours=2))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.appointment.status = 'CANCELLED'
+            self.appointment.save()
+        own.refresh_from_db()
+        entry.refresh_from_db()
+        self.assertEqual(own.status, 'WAITING')
+        self.assertEqual(entry.status, 'BOOKED')
+
+    def test_window_must_contain_freed_slot(self):
+        entry = self._join(self.start + timedelta(minutes=10), self.start + timedelta(hours=2))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.appointment.status = 'CANCELLED'
+            self.appointment.save()
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, 'WAITING')
+
+    def test_withdrawn_entries_are_skipped(self):
+        entry = self._join(self.start - timedelta(hours=1), self.start + timedelta(hours=2))
+        response = self.client.delete(reverse('waitlist-withdraw', args=[entry.id]))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertIsNone(backfill_slot(self.doctor.id, self.start + timedelta(hours=1), self.start + timedelta(hours=1, minutes=30)))
+
+
+class UtilizationRollupTests(APITestCase):
+    def setUp(self):
+        self.hospital = Hospital.objects.create(name='Util Hospital', email='util@example.com', address='1 St', phone='1234567890')
+        self.branch = HospitalBranch.objects.create(hospital=self.hospital, name='Util Branch', address='1 St', phone='1234567890', city='City', state='State')
+        self.doctor = Doctor.objects.create(branch=self.branch, name='Dr. Util', specialization='General')
+        user = User.objects.create_user(email='util@example.com', password='testpass123', full_name='Util Patient')
+        self.patient = Patient.objects.get(user=user)
+        self.day = timezone.localdate() + timedelta(days=2)
+        self.at = lambda hour: timezone.make_aware(datetime.combine(self.day, time(hour)))
+
+    def _snapshot(self):
+        return list(DoctorDailyUtilization.objects.order_by('doctor_id', 'date').values(
+            'doctor_id', 'branch_id', 'date', 'appointments', 'booked_minutes', 'cancellations', 'no_shows'))
+
+    def test_incremental_rollups_match_rebuild(self):
+        first = Appointment.objects.create(patient=self.patient, doctor=self.doctor, appointment_time=self.at(9), duration=45)
+        second = Appointment.objects.create(patient=self.patient, doctor=self.doctor, appointment_time=self.at(10))
+        third = Appointment.objects.create(patient=self.patient, doctor=self.doctor, appointment_time=self.at(11))
+        book_many([{'patient_id': self.patient.id, 'doctor_id': self.doctor.id, 'appointment_time': self.at(12), 'duration': 20}])
+        first.status = 'NO_SHOW'
+        first.save()
+        second.status = 'CANCELLED'
+        second.save()
+        third.appointment_time = self.at(9) + timedelta(days=1)
+        third.save()
+        third.delete()
+
+        incremental = self._snapshot()
+        self.assertEqual(incremental[0]['booked_minutes'], 65)
+        self.assertEqual(incremental[0]['cancellations'], 1)
+        self.assertEqual(incremental[0]['no_shows'], 1)
+        call_command('rebuild_utilization', stdout=io.StringIO())
+        rebuilt = [row for row in self._snapshot() if any(row[name] for name in ('appointments', 'cancellations'))]
+        self.assertEqual([row for row in incremental if any(row[name] for name in ('appointments', 'cancellations'))], rebuilt)
+
+    def test_report_reads_rollups_only(self):
+        Appointment.objects.create(patient=self.patient, doctor=self.doctor, appointment_time=self.at(9))
+        admin = User.objects.create_user(email='util-admin@example.com', password='testpass123', full_name='Admin', role='ADMIN')
+        self.client.force_authenticate(user=admin)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('utilization'), {'start': self.day, 'end': self.day, 'group': 'branch', 'branch': self.branch.id})
+        self.assertEqual(response.data['rows'], [{'branch_id': self.branch.id, 'appointments': 1, 'booked_minutes': 30, 'cancellations': 0, 'no_shows': 0}])
+
+    def test_deleting_hospital_with_appointments(self):
+        Appointment.objects.create(patient=self.patient, doctor=self.doctor, appointment_time=self.at(9))
+        self.hospital.delete()
+        self.assertFalse(DoctorDailyUtilization.objects.exists())
+
+
+@override_settings(DATABASE_REPLICAS={'default': ['replica']}, DATABASE_REPLICA_PIN_SECONDS=60)
+class ReplicaRoutingTests(APITransactionTestCase):
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        from authentication.tokens import ClaimsRefreshToken
+        from hospital_app.replicas import replica_pool
+        replica_pool.reset()
+        cache.clear()
+        hospital = Hospital.objects.create(name='Test Hospital', email='hospital@example.com', address='123 St', phone='1')
+        branch = HospitalBranch.objects.create(hospital=hospital, name='Main', address='123 St', phone='1', city='City', state='State')
+        self.doctor = Doctor.objects.create(branch=branch, name='Dr. Who', specialization='General')
+        user = User.objects.create_user(email='patient@example.com', password='testpass123', full_name='Patient User')
+        Patient.objects.filter(user=user).update(hospital_branch=branch)
+        self.user = user
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {ClaimsRefreshToken.for_user(user).access_token}')
+
+    def _request(self, method, url, data=None):
+        """(response, primary query count, replica query count)"""
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica']) as replica:
+            response = getattr(self.client, method)(url, data)
+        return response, len(primary), len(replica)
+
+    def test_reads_pin_to_primary_after_a_write(self):
+        url = reverse('patient-appointments')
+        response, primary, replica = self._request('get', url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((primary, bool(replica)), (0, True))
+        response, _, replica = self._request('post', url, {
+            'doctor': self.doctor.pk, 'appointment_time': (timezone.now() + timedelta(days=1)).isoformat(),
+        })
+        self.assertEqual((response.status_code, replica), (201, 0))
+        response, primary, replica = self._request('get', url)
+        self.assertEqual((bool(primary), replica), (True, 0))
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_reads_that_only_choose_an_alias_do_not_pin(self):
+        from hospital_app.replicas import is_pinned
+        self.assertEqual(self.client.get(reverse('user-detail')).status_code, 200)
+        self.assertFalse(is_pinned(self.user.pk))
+
+    def test_unhealthy_replica_falls_back_to_primary(self):
+        with mock.patch.object(connections['replica'], 'cursor', side_effect=OperationalError('down')):
+            response, primary, _ = self._request('get', reverse('patient-appointments'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(primary)
+
+    @override_settings(DATABASE_REPLICAS={'default': ['r1', 'r2', 'r3']})
+    def test_round_robin_and_least_latency_selection(self):
+        from hospital_app.replicas import ReplicaPool
+        pool = ReplicaPool()
+        for alias, latency, healthy in (('r1', 0.03, True), ('r2', 0.01, True), ('r3', 0.001, False)):
+            state = pool.state(alias)
+            state.latency, state.healthy, state.checked_at = latency, healthy, time_module.monotonic()
+        self.assertEqual([pool.choose('default') for _ in range(4)], ['r1', 'r2', 'r1', 'r2'])
+        with override_settings(DATABASE_REPLICA_SELECTION='least_latency'):
+            self.assertEqual(pool.choose('default'), 'r2')
@@ -3,10 +3,26 @@ from .views import (
     PatientAppointmentListCreateView,
     AppointmentDetailView,
     DoctorAppointmentListView,
+    FreeSlotsView,
+    BulkAppointmentCreateView,
+    DoctorDayScheduleView,
+    AppointmentSyncView,
+    AppointmentCancelView,
+    WaitlistListCreateView,
+    WaitlistWithdrawView,
+    UtilizationView,
 )
 
 urlpatterns = [
     path('my/', PatientAppointmentListCreateView.as_view(), name='patient-appointments'),
     path('<int:pk>/', AppointmentDetailView.as_view(), name='appointment-detail'),
     path('doctor/', DoctorAppointmentListView.as_view(), name='doctor-appointments'),
+    path('free-slots/', FreeSlotsView.as_view(), name='free-slots'),
+    path('bulk/', BulkAppointmentCreateView.as_view(), name='appointment-bulk'),
+    path('doctor/<int:doctor_id>/schedule/', DoctorDayScheduleView.as_view(), name='doctor-day-schedule'),
+    path('sync/', AppointmentSyncView.as_view(), name='appointment-sync'),
+    path('<int:pk>/cancel/', AppointmentCancelView.as_view(), name='appointment-cancel'),
+    path('waitlist/', WaitlistListCreateView.as_view(), name='waitlist'),
+    path('waitlist/<int:pk>/', WaitlistWithdrawView.as_view(), name='waitlist-withdraw'),
+    path('utilization/', UtilizationView.as_view(), name='utilization'),
 ]
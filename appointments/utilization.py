@@ -0,0 +1,180 @@
+"""
+Doctor utilization rollups.
+
+Each appointment contributes a small vector to the (doctor, local date)
+row of DoctorDailyUtilization. Writes apply the difference between an
+appointment's previous and current contribution, so dashboards read a
+bounded number of rollup rows instead of aggregating Appointment.
+"""
+from collections import Counter, defaultdict
+from datetime import datetime, time, timedelta
+
+from django.db import router, transaction
+from django.db.models import Count, F, IntegerField, Q, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from hospital_app.sharding import current_shard, fan_out
+from hospitals.models import Doctor
+from .models import Appointment, DoctorDailyUtilization
+
+METRICS = ('appointments', 'booked_minutes', 'cancellations', 'no_shows')
+
+
+def contribution(doctor_id, appointment_time, duration, status):
+    """Return ((doctor_id, date), Counter) for one appointment state."""
+    key = (doctor_id, timezone.localdate(appointment_time))
+    if status == 'CANCELLED':
+        return key, Counter(cancellations=1)
+    values = Counter(appointments=1, booked_minutes=duration)
+    if status == 'NO_SHOW':
+        values['no_shows'] = 1
+    return key, values
+
+
+def apply_deltas(deltas):
+    """`deltas` maps (doctor_id, date) to a Counter of metric changes."""
+    deltas = {key: values for key, values in deltas.items() if any(values.values())}
+    if not deltas:
+        return
+    # Rows are only created for increments; pure decrements (deletions,
+    # including cascades from a doctor being deleted) touch existing rows.
+    missing = [key for key, values in deltas.items() if any(value > 0 for value in values.values())]
+    with transaction.atomic(using=router.db_for_write(DoctorDailyUtilization)):
+        if missing:
+            branches = dict(
+                Doctor.objects.filter(id__in={doctor_id for doctor_id, _ in missing}).values_list('id', 'branch_id')
+            )
+            DoctorDailyUtilization.objects.bulk_create(
+                [
+                    DoctorDailyUtilization(doctor_id=doctor_id, branch_id=branches[doctor_id], date=day)
+                    for doctor_id, day in missing
+                    if doctor_id in branches
+                ],
+                ignore_conflicts=True,
+            )
+        for (doctor_id, day), values in deltas.items():
+            DoctorDailyUtilization.objects.filter(doctor_id=doctor_id, date=day).update(
+                **{name: F(name) + values[name] for name in METRICS if values[name]}
+            )
+
+
+def deltas_for_change(previous, current):
+    """
+    `previous`/`current` are (doctor_id, appointment_time, duration, status)
+    tuples, or None for a creation/deletion.
+    """
+    deltas = defaultdict(Counter)
+    if previous and all(value is not None for value in previous):
+        key, values = contribution(*previous)
+        deltas[key].subtract(values)
+    if current:
+        key, values = contribution(*current)
+        deltas[key].update(values)
+    return deltas
+
+
+def record_appointment_change(previous, current):
+    apply_deltas(deltas_for_change(previous, current))
+
+
+def record_bulk_created(appointments):
+    deltas = defaultdict(Counter)
+    for appointment in appointments:
+        key, values = contribution(
+            appointment.doctor_id, appointment.appointment_time, appointment.duration, appointment.status
+        )
+        deltas[key].update(values)
+    apply_deltas(deltas)
+
+
+def rebuild(start=None, end=None, doctor_ids=None, batch_size=1000):
+    """
+    Recompute rollups from Appointment with GROUP BY for [start, end]
+    (inclusive local dates, open-ended if None). Returns rows written.
+    """
+    rollups = DoctorDailyUtilization.objects.all()
+    appointments = Appointment.objects.all()
+    if start:
+        rollups = rollups.filter(date__gte=start)
+        appointments = appointments.filter(
+            appointment_time__gte=timezone.make_aware(datetime.combine(start, time.min))
+        )
+    if end:
+        rollups = rollups.filter(date__lte=end)
+        appointments = appointments.filter(
+            appointment_time__lt=timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min))
+        )
+    if doctor_ids:
+        rollups = rollups.filter(doctor_id__in=doctor_ids)
+        appointments = appointments.filter(doctor_id__in=doctor_ids)
+
+    active = ~Q(status='CANCELLED')
+    grouped = (
+        appointments
+        .annotate(day=TruncDate('appointment_time'))
+        .values('doctor_id', 'doctor__branch_id', 'day')
+        .annotate(
+            total=Count('id', filter=active),
+            minutes=Coalesce(Sum('duration', filter=active), 0, output_field=IntegerField()),
+            cancelled=Count('id', filter=Q(status='CANCELLED')),
+            missed=Count('id', filter=Q(status='NO_SHOW')),
+        )
+        .order_by()
+    )
+    written = 0
+    with transaction.atomic(using=router.db_for_write(DoctorDailyUtilization)):
+        rollups.delete()
+        batch = []
+        for row in grouped.iterator(chunk_size=batch_size):
+            batch.append(DoctorDailyUtilization(
+                doctor_id=row['doctor_id'], branch_id=row['doctor__branch_id'], date=row['day'],
+                appointments=row['total'], booked_minutes=row['minutes'],
+                cancellations=row['cancelled'], no_shows=row['missed'],
+            ))
+            if len(batch) >= batch_size:
+                written += len(DoctorDailyUtilization.objects.bulk_create(batch))
+                batch = []
+        if batch:
+            written += len(DoctorDailyUtilization.objects.bulk_create(batch))
+    return written
+
+
+GROUPINGS = {
+    'day': ('date',),
+    'doctor': ('doctor_id',),
+    'branch': ('branch_id',),
+    'doctor_day': ('doctor_id', 'date'),
+}
+
+
+def utilization_report(start, end, group='day', branch_id=None, doctor_id=None):
+    """
+    Aggregate rollup rows only; cost depends on the date range, not on history
+    size. Without a shard for the request, every shard is aggregated and the
+    results are summed.
+    """
+    fields = GROUPINGS[group]
+
+    def aggregate(alias):
+        rollups = DoctorDailyUtilization.objects.using(alias).filter(date__gte=start, date__lte=end)
+        if branch_id:
+            rollups = rollups.filter(branch_id=branch_id)
+        if doctor_id:
+            rollups = rollups.filter(doctor_id=doctor_id)
+        sums = {name: Coalesce(Sum(name), 0) for name in METRICS}
+        return list(rollups.values(*fields).annotate(**sums).order_by(*fields)), rollups.aggregate(**sums)
+
+    shard = current_shard()
+    merged = {}
+    totals = dict.fromkeys(METRICS, 0)
+    for rows, shard_totals in fan_out(aggregate, [shard] if shard else None).values():
+        for row in rows:
+            target = merged.setdefault(tuple(row[name] for name in fields), {
+                **{name: row[name] for name in fields}, **dict.fromkeys(METRICS, 0),
+            })
+            for name in METRICS:
+                target[name] += row[name]
+        for name in METRICS:
+            totals[name] += shard_totals[name]
+    return {'rows': [merged[key] for key in sorted(merged)], 'totals': totals}
@@ -1,6 +1,30 @@
-from rest_framework import generics, permissions
-from .models import Appointment
-from .serializers import AppointmentSerializer
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from rest_framework import generics, permissions, status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from authentication.permissions import IsAdmin, IsClinicStaff
+from hospitals.models import Doctor
+from patients.models import Patient
+from .availability import find_free_slots
+from .booking import book_many, save_booking
+from .filters import AppointmentRangeFilter
+from .models import Appointment, WaitlistEntry
+from .pagination import AppointmentCursorPagination
+from .schedule import get_day_schedule, serialize_schedule
+from .serializers import (
+    AppointmentSerializer, BulkAppointmentSerializer, FreeSlotQuerySerializer, UtilizationQuerySerializer,
+    WaitlistEntrySerializer,
+)
+from .sync import sync_appointments
+from .utilization import utilization_report
+
+def visible_appointments(user):
+    if user.role == 'PATIENT':
+        return Appointment.objects.filter(patient_id=user.patient_id)
+    elif user.role == 'DOCTOR':
+        return Appointment.objects.filter(doctor_id=user.doctor_id)
+    return Appointment.objects.none()
 
 class IsPatient(permissions.BasePermission):
     def has_permission(self, request, view):
@@ -13,9 +37,11 @@ class IsDoctor(permissions.BasePermission):
 class PatientAppointmentListCreateView(generics.ListCreateAPIView):
     serializer_class = AppointmentSerializer
     permission_classes = [IsPatient]
+    pagination_class = AppointmentCursorPagination
+    filter_backends = [AppointmentRangeFilter]
 
     def get_queryset(self):
-        return Appointment.objects.filter(patient=self.request.user.patient)
+        return Appointment.objects.filter(patient_id=self.request.user.patient_id)
 
     def get_serializer_context(self):
         return {'request': self.request}
@@ -25,16 +51,211 @@ class AppointmentDetailView(generics.RetrieveUpdateDestroyAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        user = self.request.user
-        if user.role == 'PATIENT':
-            return Appointment.objects.filter(patient=user.patient)
-        elif user.role == 'DOCTOR':
-            return Appointment.objects.filter(doctor=user.doctor)
-        return Appointment.objects.none()
+        return visible_appointments(self.request.user)
 
 class DoctorAppointmentListView(generics.ListAPIView):
     serializer_class = AppointmentSerializer
     permission_classes = [IsDoctor]
+    pagination_class = AppointmentCursorPagination
+    filter_backends = [AppointmentRangeFilter]
+
+    def get_queryset(self):
+        return Appointment.objects.filter(doctor_id=self.request.user.doctor_id)
+
+
+class FreeSlotsView(APIView):
+    """Next free slots for one or many doctors, e.g. ?specialization=Cardiology&limit=3."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        query = FreeSlotQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+        params = query.validated_data
+
+        doctors = Doctor.objects.all()
+        if params.get('doctors'):
+            doctors = doctors.filter(id__in=params['doctors'])
+        if params.get('specialization'):
+            doctors = doctors.filter(specialization__iexact=params['specialization'])
+        if params.get('branch'):
+            doctors = doctors.filter(branch_id=params['branch'])
+        doctors = list(doctors.order_by('id').values('id', 'name', 'specialization', 'branch_id'))
+
+        slots = find_free_slots(
+            [doctor['id'] for doctor in doctors],
+            params['start'], params['end'],
+            duration=params['duration'], limit=params['limit'],
+        )
+        results = [
+            {
+                'doctor': doctor['id'],
+                'name': doctor['name'],
+                'specialization': doctor['specialization'],
+                'branch': doctor['branch_id'],
+                'slots': [{'start': start, 'end': end} for start, end in slots[doctor['id']]],
+            }
+            for doctor in doctors
+            if slots[doctor['id']]
+        ]
+        return Response({'start': params['start'], 'end': params['end'], 'results': results})
+
+
+class IsPatientOrStaff(permissions.BasePermission):
+    def has_permission(self, request, view):
+        user = request.user
+        return user.is_authenticated and (user.role in ('PATIENT', 'ADMIN') or user.is_staff)
+
+
+class BulkAppointmentCreateView(APIView):
+    """
+    Book many appointments at once, e.g. a weekly series or a vaccination
+    drive. Patients book for themselves; staff must give a patient per item.
+    Conflicts are reported per item instead of failing the whole batch
+    unless all_or_nothing is set.
+    """
+    permission_classes = [IsPatientOrStaff]
+
+    def post(self, request):
+        serializer = BulkAppointmentSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        items = serializer.validated_data['appointments']
+
+        if request.user.role == 'PATIENT':
+            patient_id = request.user.patient_id
+            for item in items:
+                item['patient'] = patient_id
+        elif any(item.get('patient') is None for item in items):
+            return Response({'patient': ['This field is required for staff bookings.']},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        unknown = self._unknown_ids(items)
+        if unknown:
+            return Response(unknown, status=status.HTTP_400_BAD_REQUEST)
+
+        results = book_many(
+            [
+                {
+                    'patient_id': item['patient'],
+                    'doctor_id': item['doctor'],
+                    'appointment_time': item['appointment_time'],
+                    'duration': item['duration'],
+                    'reason': item.get('reason', ''),
+                    'notes': item.get('notes', ''),
+                }
+                for item in items
+            ],
+            all_or_nothing=serializer.validated_data['all_or_nothing'],
+        )
+        booked = sum(1 for result in results if result['status'] == 'booked')
+        return Response(
+            {'booked': booked, 'conflicts': len(results) - booked, 'results': results},
+            status=status.HTTP_201_CREATED if booked else status.HTTP_409_CONFLICT,
+        )
+
+    def _unknown_ids(self, items):
+        errors = {}
+        doctor_ids = {item['doctor'] for item in items}
+        patient_ids = {item['patient'] for item in items}
+        missing = doctor_ids - set(Doctor.objects.filter(id__in=doctor_ids).values_list('id', flat=True))
+        if missing:
+            errors['doctor'] = [f"Unknown doctor ids: {sorted(missing)}"]
+        missing = patient_ids - set(Patient.objects.filter(id__in=patient_ids).values_list('id', flat=True))
+        if missing:
+            errors['patient'] = [f"Unknown patient ids: {sorted(missing)}"]
+        return errors
+
+
+class DoctorDayScheduleView(APIView):
+    """
+    A doctor's appointments for one day (?date=YYYY-MM-DD, default today),
+    served from the schedule cache with an ETag so unchanged polls get 304.
+    """
+    permission_classes = [IsClinicStaff]
+
+    def get(self, request, doctor_id):
+        try:
+            day = parse_date(request.query_params['date']) if 'date' in request.query_params else timezone.localdate()
+        except ValueError:
+            day = None
+        if day is None:
+            return Response({'date': ['Use YYYY-MM-DD.']}, status=status.HTTP_400_BAD_REQUEST)
+
+        schedule = get_day_schedule(doctor_id, day)
+        headers = {'ETag': schedule['etag'], 'Cache-Control': 'private, no-cache'}
+        if schedule['etag'] in request.headers.get('If-None-Match', ''):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(serialize_schedule(doctor_id, day, schedule), headers=headers)
+
+
+class AppointmentSyncView(APIView):
+    """
+    Delta sync for mobile clients: GET ?since=<token> returns appointments
+    created or changed and ids deleted since the token, plus a new token.
+    Without a (valid) token the full list is returned with full=true.
+    """
+    permission_classes = [IsPatient]
+
+    def get(self, request):
+        result = sync_appointments(request.user.patient_id, request.query_params.get('since'))
+        return Response({
+            'token': result['token'],
+            'full': result['full'],
+            'has_more': result['has_more'],
+            'appointments': AppointmentSerializer(result['appointments'], many=True).data,
+            'deleted': result['deleted'],
+        })
+
+
+class AppointmentCancelView(APIView):
+    """Cancel an appointment; the freed slot is offered to the doctor's waitlist."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, pk):
+        appointment = generics.get_object_or_404(visible_appointments(request.user), pk=pk)
+        if appointment.status != 'CANCELLED':
+            appointment.status = 'CANCELLED'
+            save_booking(appointment)
+        return Response(AppointmentSerializer(appointment).data)
+
+
+class WaitlistListCreateView(generics.ListCreateAPIView):
+    serializer_class = WaitlistEntrySerializer
+    permission_classes = [IsPatient]
 
     def get_queryset(self):
-        return Appointment.objects.filter(doctor__user=self.request.user)
+        return WaitlistEntry.objects.filter(patient_id=self.request.user.patient_id).order_by('-created_at')
+
+    def perform_create(self, serializer):
+        serializer.save(patient_id=self.request.user.patient_id)
+
+
+class WaitlistWithdrawView(generics.DestroyAPIView):
+    permission_classes = [IsPatient]
+
+    def get_queryset(self):
+        return WaitlistEntry.objects.filter(patient_id=self.request.user.patient_id, status='WAITING')
+
+    def perform_destroy(self, instance):
+        instance.status = 'WITHDRAWN'
+        instance.save(update_fields=['status'])
+
+
+class UtilizationView(APIView):
+    """
+    Booked minutes, appointments, cancellations and no-shows from the
+    utilization rollups, grouped by day, doctor, branch or doctor_day.
+    """
+    permission_classes = [IsAdmin]
+
+    def get(self, request):
+        query = UtilizationQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+        params = query.validated_data
+        report = utilization_report(
+            params['start'], params['end'], group=params['group'],
+            branch_id=params.get('branch'), doctor_id=params.get('doctor'),
+        )
+        return Response({'start': params['start'], 'end': params['end'], 'group': params['group'], **report})
@@ -0,0 +1,61 @@
+"""
+Cancellation backfill.
+
+When an appointment is cancelled, the freed interval is offered to the
+oldest waiting WaitlistEntry for the same doctor whose window contains it
+and whose requested duration fits. The lookup is an index probe (a GiST
+range index on Postgres, the (doctor, status, earliest) B-tree elsewhere),
+and the booking happens under the same per-doctor lock as every other
+booking, so a competing manual booking cannot land in between.
+"""
+from django.db import connections, models, router, transaction
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+
+from .booking import SlotUnavailable, lock_doctors, overlapping, save_booking
+from .models import Appointment, WaitlistEntry
+
+
+def matching_entries(doctor_id, start, end, exclude_patient_id=None):
+    minutes = int((end - start).total_seconds() // 60)
+    queryset = WaitlistEntry.objects.filter(
+        doctor_id=doctor_id, status='WAITING', duration__lte=minutes,
+        earliest__lte=start, latest__gte=end,
+    )
+    if exclude_patient_id is not None:
+        queryset = queryset.exclude(patient_id=exclude_patient_id)
+    if connections[router.db_for_read(WaitlistEntry)].vendor == 'postgresql':
+        # Lets the planner use the waitlist_window_gist index.
+        queryset = queryset.filter(RawSQL(
+            "tstzrange(earliest, latest, '[]') @> tstzrange(%s, %s, '[)')", [start, end],
+            output_field=models.BooleanField(),
+        ))
+    return queryset.order_by('created_at', 'id')
+
+
+def backfill_slot(doctor_id, start, end, cancelled_by=None):
+    """
+    Book the freed [start, end) interval for the first eligible waitlisted
+    patient other than `cancelled_by`, the patient who gave it up.
+    """
+    if start <= timezone.now():
+        return None
+    with transaction.atomic(using=router.db_for_write(Appointment)):
+        lock_doctors([doctor_id])
+        if overlapping(doctor_id, start, end).exists():
+            return None
+        entry = matching_entries(doctor_id, start, end, cancelled_by).select_for_update(skip_locked=True).first()
+        if entry is None:
+            return None
+        appointment = Appointment(
+            patient_id=entry.patient_id, doctor_id=doctor_id, appointment_time=start,
+            duration=entry.duration, reason=entry.reason or 'Booked from waitlist',
+        )
+        try:
+            save_booking(appointment)
+        except SlotUnavailable:
+            return None
+        entry.status = 'BOOKED'
+        entry.appointment = appointment
+        entry.save(update_fields=['status', 'appointment'])
+        return appointment
@@ -1,5 +1,8 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.utils.html import format_html
+
+from .images import variant_urls
 from .models import User
 
 @admin.register(User)
@@ -27,7 +30,9 @@ class UserAdmin(BaseUserAdmin):
 
     def profile_image_display(self, obj):
         if obj.profile_image:
-            return f"<img src='{obj.profile_image.url}' width='40' height='40' style='object-fit:cover;border-radius:50%;' />"
+            return format_html(
+                "<img src='{}' width='40' height='40' style='object-fit:cover;border-radius:50%;' />",
+                variant_urls(obj.profile_image)['thumb'],
+            )
         return "-"
     profile_image_display.short_description = 'Profile Image'
-    profile_image_display.allow_tags = True
@@ -0,0 +1,174 @@
+"""
+JWT authentication backed by token claims.
+
+Access tokens carry the user's role, staff flags, patient id and doctor id
+(see authentication.tokens), so ClaimsJWTAuthentication can return a
+ClaimsUser without touching the database. Anything not in the token is
+loaded from a bounded, TTL'd per-process user cache.
+
+User and Patient saves invalidate the cache and record when the user
+changed in the AUTH_USER_CHANGES_CACHE alias, which must be shared by all
+workers. Tokens issued before that change fall back to the database row
+(re-read if this process cached it earlier), so a role change or
+deactivation takes effect on every worker's next request, and refreshing
+such a token re-reads the row too (see authentication.views). Revoked
+tokens are rejected before any of this (see authentication.revocation).
+
+When the database is sharded, the `hospital_id` claim selects the shard
+for the rest of the request unless the URL already did.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.utils.functional import cached_property
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+
+from hospital_app.replicas import use_primary
+from hospital_app.sharding import activate_hospital, current_shard
+from .revocation import is_revoked
+
+AUTH_USER_CACHE_SIZE = getattr(settings, 'AUTH_USER_CACHE_SIZE', 1024)
+AUTH_USER_CACHE_TTL = getattr(settings, 'AUTH_USER_CACHE_TTL', 300)
+
+
+class UserCache:
+    """LRU cache of User rows with a TTL; change timestamps live in a shared cache."""
+
+    CHANGED_KEY = 'auth:user-changed:{}'
+
+    def __init__(self, maxsize=AUTH_USER_CACHE_SIZE, ttl=AUTH_USER_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def changes(self):
+        return caches[getattr(settings, 'AUTH_USER_CHANGES_CACHE', 'default')]
+
+    # Keys are strings because the user id claim is serialized as one.
+    def get(self, user_id, changed_at=0.0):
+        """The User row, reloaded if the cached copy is older than `changed_at`."""
+        user_id = str(user_id)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is not None and entry[0] > now and entry[1] > changed_at:
+                self._users.move_to_end(user_id)
+                return entry[2]
+        loaded_at = time.time()
+        # Read from the primary: right after an invalidation a lagging replica
+        # could still hold the old row, which would then be cached for `ttl`.
+        User = get_user_model()
+        with use_primary():
+            user = User.objects.filter(pk=user_id).first()
+        if user is not None:
+            with self._lock:
+                self._users[user_id] = (now + self.ttl, loaded_at, user)
+                self._users.move_to_end(user_id)
+                while len(self._users) > self.maxsize:
+                    self._users.popitem(last=False)
+        return user
+
+    def invalidate(self, user_id):
+        user_id = str(user_id)
+        with self._lock:
+            self._users.pop(user_id, None)
+        # Only tokens issued before the change need the record, so it can
+        # expire with the longest-lived token.
+        lifetime = max(api_settings.ACCESS_TOKEN_LIFETIME, api_settings.REFRESH_TOKEN_LIFETIME)
+        self.changes.set(self.CHANGED_KEY.format(user_id), time.time(), lifetime.total_seconds())
+
+    def changed_at(self, user_id):
+        """UNIX timestamp of the user's last recorded change, or 0.0."""
+        return self.changes.get(self.CHANGED_KEY.format(user_id), 0.0)
+
+    def changed_since(self, user_id, issued_at):
+        """True if the user may have changed at or after `issued_at` (a UNIX timestamp)."""
+        return self.changed_at(user_id) >= issued_at
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+
+
+user_cache = UserCache()
+
+
+def invalidate_user(user_id):
+    user_cache.invalidate(user_id)
+
+
+class ClaimsUser(TokenUser):
+    """
+    Request user built from token claims. Attributes that are not claims
+    (email, full_name, ...) are read from the cached User row.
+    """
+
+    @cached_property
+    def role(self):
+        return self.token['role']
+
+    @cached_property
+    def patient_id(self):
+        return self.token.get('patient_id')
+
+    @cached_property
+    def doctor_id(self):
+        return self.token.get('doctor_id')
+
+    def __str__(self):
+        return f"ClaimsUser {self.id} ({self.role})"
+
+    def get_full_user(self):
+        return user_cache.get(self.pk)
+
+    def __getattr__(self, attr):
+        if attr.startswith('_') or attr == 'token':
+            raise AttributeError(attr)
+        return getattr(self.get_full_user(), attr)
+
+
+def full_user(user):
+    """The User row for `user`, which may be a ClaimsUser."""
+    return user.get_full_user() if isinstance(user, ClaimsUser) else user
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    def authenticate(self, request):
+        result = super().authenticate(request)
+        if result is not None and current_shard() is None:
+            activate_hospital(result[1].get('hospital_id'), write=request.method not in SAFE_METHODS)
+        return result
+
+    def get_validated_token(self, raw_token):
+        validated_token = super().get_validated_token(raw_token)
+        if is_revoked(validated_token):
+            raise InvalidToken("Token has been revoked")
+        return validated_token
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as exc:
+            raise InvalidToken("Token contained no recognizable user identification") from exc
+
+        changed_at = user_cache.changed_at(user_id)
+        if 'claims_at' in validated_token and changed_at < validated_token['claims_at']:
+            return ClaimsUser(validated_token)
+
+        # Tokens without claims, or issued before the user last changed.
+        user = user_cache.get(user_id, changed_at)
+        if user is None:
+            raise AuthenticationFailed("User not found", code='user_not_found')
+        if not user.is_active:
+            raise AuthenticationFailed("User is inactive", code='user_inactive')
+        return user
@@ -0,0 +1,128 @@
+"""
+Profile image storage and variants.
+
+Originals are stored content-addressed: the file name is the SHA-256 of
+its bytes, so identical uploads are written once and shared. Thumbnail
+variants are derived from the original's name, rendered by a small
+thread pool after the saving transaction commits, and never block the
+request. Until a variant exists its URL falls back to the original.
+"""
+import hashlib
+import io
+import os
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from PIL import Image, ImageOps
+
+PROFILE_IMAGE_VARIANTS = getattr(settings, 'PROFILE_IMAGE_VARIANTS', {'thumb': 64, 'small': 256})
+PROFILE_IMAGE_WORKERS = getattr(settings, 'PROFILE_IMAGE_WORKERS', 2)
+VARIANT_DIR = 'variants'
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        digest = digest.hexdigest()
+        extension = os.path.splitext(name)[1].lower() or '.bin'
+        name = posixpath.join(posixpath.dirname(name), digest[:2], digest + extension)
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length=max_length)
+
+    def save_exact(self, name, content):
+        """Save under `name` as given (variants are already named after their original)."""
+        return super().save(name, content)
+
+
+profile_image_storage = ContentAddressedStorage()
+
+
+def get_profile_image_storage():
+    return profile_image_storage
+
+
+def variant_name(name, variant):
+    directory, filename = posixpath.split(name)
+    stem = os.path.splitext(filename)[0]
+    return posixpath.join(directory.split('/')[0], VARIANT_DIR, stem[:2], f'{stem}_{variant}.jpg')
+
+
+def render_variant(image, size):
+    variant = ImageOps.exif_transpose(image).convert('RGB')
+    variant.thumbnail((size, size))
+    buffer = io.BytesIO()
+    variant.save(buffer, format='JPEG', quality=85, optimize=True)
+    return buffer.getvalue()
+
+
+def generate_variants(name, storage=profile_image_storage):
+    """Render missing variants of `name`; returns the variant names written."""
+    missing = {
+        variant: size for variant, size in PROFILE_IMAGE_VARIANTS.items()
+        if not storage.exists(variant_name(name, variant))
+    }
+    if not missing:
+        return []
+    with storage.open(name, 'rb') as handle, Image.open(handle) as image:
+        image.load()
+        return [
+            storage.save_exact(variant_name(name, variant), ContentFile(render_variant(image, size)))
+            for variant, size in missing.items()
+        ]
+
+
+def variant_urls(image_field):
+    """{'original': url, <variant>: url} for a FieldFile, falling back to the original."""
+    if not image_field:
+        return None
+    storage = image_field.storage
+    urls = {'original': image_field.url}
+    for variant in PROFILE_IMAGE_VARIANTS:
+        name = variant_name(image_field.name, variant)
+        urls[variant] = storage.url(name) if storage.exists(name) else urls['original']
+    return urls
+
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending = set()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=PROFILE_IMAGE_WORKERS, thread_name_prefix='profile-images')
+        return _executor
+
+
+def schedule_variants(name):
+    """Render variants in the background once the current transaction commits."""
+    def submit():
+        future = _get_executor().submit(generate_variants, name)
+        _pending.add(future)
+        future.add_done_callback(_pending.discard)
+
+    transaction.on_commit(submit)
+
+
+def wait_for_pending(timeout=None):
+    """Block until scheduled variants are rendered (management commands, tests)."""
+    futures = list(_pending)
+    wait(futures, timeout=timeout)
+    for future in futures:
+        future.result()
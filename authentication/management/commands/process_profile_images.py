@@ -0,0 +1,30 @@
+import re
+
+from django.core.management.base import BaseCommand
+
+from authentication.images import generate_variants
+from authentication.models import User
+
+HASHED_NAME = re.compile(r'/[0-9a-f]{2}/[0-9a-f]{64}\.[^/]+$')
+
+
+class Command(BaseCommand):
+    help = "Move legacy profile images into content-addressed storage and render missing variants."
+
+    def handle(self, *args, **options):
+        moved = rendered = 0
+        users = User.objects.exclude(profile_image='').exclude(profile_image__isnull=True).only('id', 'profile_image')
+        for user in users.iterator(chunk_size=500):
+            image = user.profile_image
+            if not HASHED_NAME.search(image.name):
+                storage = image.storage
+                if not storage.exists(image.name):
+                    self.stderr.write(f"user {user.pk}: missing file {image.name}")
+                    continue
+                with storage.open(image.name, 'rb') as handle:
+                    name = storage.save(image.name, handle)
+                User.objects.filter(pk=user.pk).update(profile_image=name)
+                image.name = name
+                moved += 1
+            rendered += len(generate_variants(image.name))
+        self.stdout.write(f"Moved {moved} images to content-addressed storage, rendered {rendered} variants.")
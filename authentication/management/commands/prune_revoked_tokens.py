@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from authentication.models import RevokedToken
+
+
+class Command(BaseCommand):
+    help = "Delete revoked-token rows whose tokens have expired anyway."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        total = 0
+        while True:
+            ids = list(
+                RevokedToken.objects.filter(expires_at__lte=now)
+                .order_by('id').values_list('id', flat=True)[:options['batch_size']]
+            )
+            if not ids:
+                break
+            total += RevokedToken.objects.filter(id__in=ids).delete()[0]
+        self.stdout.write(f"Deleted {total} expired revoked tokens.")
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:49
+
+import authentication.images
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0002_user_profile_image_alter_user_last_login'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='profile_image',
+            field=models.ImageField(blank=True, null=True, storage=authentication.images.get_profile_image_storage, upload_to='user_profiles/'),
+        ),
+    ]
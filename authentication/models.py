@@ -1,6 +1,8 @@
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseUserManager
 from django.db import models
 
+from .images import get_profile_image_storage
+
 class UserManager(BaseUserManager):
     def create_user(self, email, password=None, role='PATIENT', **extra_fields):
         if not email:
@@ -28,7 +30,7 @@ class User(AbstractBaseUser, PermissionsMixin):
     role = models.CharField(max_length=10, choices=ROLE_CHOICES, default='PATIENT')
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
-    profile_image = models.ImageField(upload_to='user_profiles/', blank=True, null=True)
+    profile_image = models.ImageField(upload_to='user_profiles/', storage=get_profile_image_storage, blank=True, null=True)
     last_login = models.DateTimeField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
@@ -40,3 +42,28 @@ class User(AbstractBaseUser, PermissionsMixin):
     def __str__(self):
         return self.email
 
+    @property
+    def patient_id(self):
+        patient = getattr(self, 'patient', None)
+        return patient.pk if patient else None
+
+    @property
+    def doctor_id(self):
+        doctor = getattr(self, 'doctor', None)
+        return doctor.pk if doctor else None
+
+
+
+class RevokedToken(models.Model):
+    """
+    Denylist of refresh-token JTIs. Access tokens carry their refresh
+    token's JTI in the `rjti` claim, so revoking a refresh token also
+    revokes every access token issued from it.
+    """
+    jti = models.CharField(max_length=64, unique=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='revoked_tokens')
+    expires_at = models.DateTimeField(db_index=True)
+    revoked_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.jti} (revoked {self.revoked_at})"
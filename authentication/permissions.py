@@ -0,0 +1,13 @@
+from rest_framework import permissions
+
+
+class IsClinicStaff(permissions.BasePermission):
+    def has_permission(self, request, view):
+        user = request.user
+        return user.is_authenticated and (user.role in ('ADMIN', 'DOCTOR') or user.is_staff)
+
+
+class IsAdmin(permissions.BasePermission):
+    def has_permission(self, request, view):
+        user = request.user
+        return user.is_authenticated and (user.role == 'ADMIN' or user.is_staff)
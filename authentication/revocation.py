@@ -0,0 +1,115 @@
+"""
+Token revocation.
+
+Revoked refresh-token JTIs are stored in RevokedToken and mirrored in a
+per-process Bloom filter. Authentication only queries the table when the
+filter reports a possible match, so valid tokens cost one in-memory
+lookup. The filter is patched with new rows every
+AUTH_REVOCATION_SYNC_SECONDS (one query per process per interval) and
+rebuilt every AUTH_REVOCATION_REBUILD_SECONDS to shed expired entries.
+Revocations made in this process take effect immediately, and in other
+processes within the sync interval.
+"""
+import hashlib
+import math
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import RevokedToken
+
+BLOOM_CAPACITY = getattr(settings, 'AUTH_REVOCATION_BLOOM_CAPACITY', 100_000)
+BLOOM_ERROR_RATE = getattr(settings, 'AUTH_REVOCATION_BLOOM_ERROR_RATE', 0.001)
+SYNC_SECONDS = getattr(settings, 'AUTH_REVOCATION_SYNC_SECONDS', 30)
+REBUILD_SECONDS = getattr(settings, 'AUTH_REVOCATION_REBUILD_SECONDS', 3600)
+
+
+class BloomFilter:
+    def __init__(self, capacity=BLOOM_CAPACITY, error_rate=BLOOM_ERROR_RATE):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class RevocationFilter:
+    def __init__(self, capacity=BLOOM_CAPACITY):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.bloom = None
+            self.synced_at = self.built_at = float('-inf')
+            self.synced_since = None
+
+    def sync(self, force=False):
+        """Patch the filter with recently revoked JTIs, or rebuild it when due."""
+        now = time.monotonic()
+        if not force and now - self.synced_at < SYNC_SECONDS:
+            return
+        with self._lock:
+            if not force and now - self.synced_at < SYNC_SECONDS:
+                return
+            started = timezone.now()
+            rebuild = self.bloom is None or now - self.built_at >= REBUILD_SECONDS or self.bloom.count >= self.bloom.capacity
+            if rebuild:
+                rows = RevokedToken.objects.filter(expires_at__gt=started)
+                bloom = BloomFilter(max(self.capacity, rows.count() * 2))
+            else:
+                # Overlap the previous window so rows from transactions that
+                # committed late are still picked up; re-adding is harmless.
+                rows = RevokedToken.objects.filter(revoked_at__gte=self.synced_since - timedelta(seconds=SYNC_SECONDS))
+                bloom = self.bloom
+            for jti in rows.values_list('jti', flat=True).iterator():
+                bloom.add(jti)
+            if rebuild:
+                self.built_at = now
+            self.bloom, self.synced_at, self.synced_since = bloom, now, started
+
+    def is_revoked(self, jti):
+        self.sync()
+        if jti not in self.bloom:
+            return False
+        return RevokedToken.objects.filter(jti=jti).exists()
+
+    def add(self, jti):
+        self.sync()
+        with self._lock:
+            self.bloom.add(jti)
+
+
+revocations = RevocationFilter()
+
+
+def revoke(refresh_token, user_id=None):
+    """Revoke a validated refresh token (and the access tokens issued from it)."""
+    expires_at = datetime.fromtimestamp(refresh_token['exp'], tz=dt_timezone.utc)
+    RevokedToken.objects.get_or_create(
+        jti=refresh_token['jti'], defaults={'user_id': user_id, 'expires_at': expires_at}
+    )
+    revocations.add(refresh_token['jti'])
+
+
+def is_revoked(token):
+    """True if `token` (refresh or access) belongs to a revoked refresh token."""
+    jti = token.get('rjti') or (token['jti'] if token.get('token_type') == 'refresh' else None)
+    return bool(jti) and revocations.is_revoked(jti)
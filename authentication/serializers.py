@@ -1,6 +1,11 @@
 from rest_framework import serializers
+from .images import variant_urls
 from .models import User
 from django.contrib.auth import authenticate
+from rest_framework_simplejwt.exceptions import TokenError
+
+from .revocation import is_revoked
+from .tokens import ClaimsRefreshToken
 
 
 class RegisterSerializer(serializers.ModelSerializer):
@@ -25,14 +30,19 @@ class RegisterSerializer(serializers.ModelSerializer):
 
 # User detail/update serializer
 class UserSerializer(serializers.ModelSerializer):
+    profile_image_variants = serializers.SerializerMethodField()
+
     class Meta:
         model = User
         fields = [
             'id', 'email', 'full_name', 'role', 'is_active', 'is_staff',
-            'profile_image', 'last_login', 'created_at'
+            'profile_image', 'profile_image_variants', 'last_login', 'created_at'
         ]
         read_only_fields = ['id', 'role', 'is_active', 'is_staff', 'last_login', 'created_at']
 
+    def get_profile_image_variants(self, obj):
+        return variant_urls(obj.profile_image)
+
 
 class LoginSerializer(serializers.Serializer):
     email = serializers.EmailField()
@@ -42,4 +52,18 @@ class LoginSerializer(serializers.Serializer):
         user = authenticate(email=data['email'], password=data['password'])
         if not user:
             raise serializers.ValidationError("Invalid credentials")
-        return {'user': user}
\ No newline at end of file
+        return {'user': user}
+
+
+class RefreshTokenSerializer(serializers.Serializer):
+    """Validates a refresh token that has not been revoked."""
+    refresh = serializers.CharField()
+
+    def validate(self, data):
+        try:
+            token = ClaimsRefreshToken(data['refresh'])
+        except TokenError:
+            raise serializers.ValidationError("Invalid or expired refresh token.")
+        if is_revoked(token):
+            raise serializers.ValidationError("Refresh token has been revoked.")
+        return {'token': token}
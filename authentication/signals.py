@@ -0,0 +1,35 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from hospital_app.sharding import mirror_reference
+from .backends import invalidate_user
+from .images import schedule_variants
+from .models import User
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
+
+
+@receiver(post_save, sender=User)
+def render_profile_image_variants(sender, instance, update_fields=None, **kwargs):
+    if not instance.profile_image:
+        return
+    if update_fields is not None and 'profile_image' not in update_fields:
+        return
+    schedule_variants(instance.profile_image.name)
+
+
+@receiver(post_save, sender=User)
+def mirror_user(sender, instance, using, update_fields=None, **kwargs):
+    # Login only touches last_login, which no shard reads.
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    mirror_reference(instance, using)
+
+
+@receiver(post_delete, sender=User)
+def unmirror_user(sender, instance, using, **kwargs):
+    mirror_reference(instance, using)
@@ -1,6 +1,21 @@
 from django.urls import reverse
 from rest_framework.test import APITestCase
 from rest_framework import status
+from rest_framework_simplejwt.tokens import AccessToken
+from unittest import mock
+
+from datetime import timedelta
+
+from django.core.cache import caches
+from django.test import override_settings
+from django.utils import timezone
+from .backends import UserCache, user_cache
+from .images import generate_variants, variant_name
+from .serializers import UserSerializer
+from .throttling import TokenBucketTable, buckets, clear_buckets
+from .revocation import BloomFilter, RevocationFilter, revocations
+from .models import RevokedToken
+from .tokens import ClaimsRefreshToken
 from .models import User
 from django.core.files.uploadedfile import SimpleUploadedFile
 from io import BytesIO
@@ -53,3 +68,215 @@ class UserAuthTests(APITestCase):
         response = self.client.put(url, {'full_name': 'Updated Name'}, format='json')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['full_name'], 'Updated Name')
+
+
+class ClaimsAuthenticationTests(APITestCase):
+    def setUp(self):
+        user_cache.clear()
+        clear_buckets()
+        revocations.reset()
+        revocations.sync(force=True)
+        self.user = User.objects.create_user(email='claims@example.com', password='testpass123', full_name='Claims User')
+        response = self.client.post(reverse('login'), {'email': 'claims@example.com', 'password': 'testpass123'})
+        self.access = response.data['access']
+        self.refresh = response.data['refresh']
+
+    def test_access_token_carries_claims(self):
+        token = AccessToken(self.access)
+        self.assertEqual(token['role'], 'PATIENT')
+        self.assertEqual(token['patient_id'], self.user.patient.pk)
+        self.assertIsNone(token['doctor_id'])
+
+    def test_read_endpoint_skips_user_and_patient_lookups(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.access}')
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('patient-appointments'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_user_details_come_from_cache(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.access}')
+        with self.assertNumQueries(1):
+            self.client.get(reverse('user-detail'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('user-detail'))
+        self.assertEqual(response.data['email'], 'claims@example.com')
+
+    def test_user_save_invalidates_older_tokens(self):
+        self.user.is_active = False
+        self.user.save()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.access}')
+        response = self.client.get(reverse('user-detail'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_changes_reach_other_workers_and_refreshes(self):
+        other_worker = UserCache()
+        self.assertTrue(other_worker.get(self.user.pk).is_active)
+        self.user.role = 'ADMIN'
+        self.user.save()
+        claims_at = AccessToken(self.access)['claims_at']
+        self.assertTrue(other_worker.changed_since(self.user.pk, claims_at))
+        self.assertEqual(other_worker.get(self.user.pk, other_worker.changed_at(self.user.pk)).role, 'ADMIN')
+
+        response = self.client.post(reverse('token-refresh'), {'refresh': self.refresh})
+        self.assertEqual(AccessToken(response.data['access'])['role'], 'ADMIN')
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.post(reverse('token-refresh'), {'refresh': self.refresh})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_cache_is_bounded(self):
+        cache = UserCache(maxsize=2, ttl=60)
+        users = [User.objects.create_user(email=f'bounded{i}@example.com', password='x', full_name='B') for i in range(3)]
+        for user in users:
+            cache.get(user.pk)
+        self.assertEqual(list(cache._users), [str(users[1].pk), str(users[2].pk)])
+        for user in users:
+            cache.invalidate(user.pk)
+        self.assertTrue(cache.changed_since(users[0].pk, 0))
+
+
+def _image_upload(name='photo.jpg', color='blue', size=(400, 300)):
+    image_io = BytesIO()
+    Image.new('RGB', size, color=color).save(image_io, format='JPEG')
+    return SimpleUploadedFile(name=name, content=image_io.getvalue(), content_type='image/jpeg')
+
+
+class ProfileImagePipelineTests(APITestCase):
+    def _register(self, email, image):
+        data = {'email': email, 'full_name': 'Image User', 'password': 'testpass123', 'profile_image': image}
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('register'), data, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response
+
+    def test_identical_uploads_are_stored_once(self):
+        self._register('img1@example.com', _image_upload('a.jpg'))
+        self._register('img2@example.com', _image_upload('b.jpg'))
+        first, second = (User.objects.get(email=email).profile_image for email in ('img1@example.com', 'img2@example.com'))
+        self.assertEqual(first.name, second.name)
+        self.assertRegex(first.name, r'^user_profiles/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$')
+
+    def test_variants_rendered_off_request_and_returned(self):
+        with mock.patch('authentication.images._get_executor') as executor:
+            response = self._register('img3@example.com', _image_upload(color='green'))
+        user = User.objects.get(email='img3@example.com')
+        executor.return_value.submit.assert_called_once_with(generate_variants, user.profile_image.name)
+        variants = response.data['user']['profile_image_variants']
+        self.assertEqual(variants['thumb'], variants['original'])
+
+        generate_variants(user.profile_image.name)
+        variants = UserSerializer(user).data['profile_image_variants']
+        self.assertIn('/variants/', variants['thumb'])
+        with user.profile_image.storage.open(variant_name(user.profile_image.name, 'thumb')) as handle:
+            self.assertEqual(max(Image.open(handle).size), 64)
+
+
+@override_settings(AUTH_THROTTLE_RATES={'login': {'ip': '5/min', 'email': '2/min'}, 'register': {'ip': '1/hour'}})
+class CredentialThrottleTests(APITestCase):
+    def setUp(self):
+        clear_buckets()
+        caches['throttle'].clear()
+        User.objects.create_user(email='throttled@example.com', password='testpass123', full_name='Throttled')
+
+    def _login(self, email):
+        return self.client.post(reverse('login'), {'email': email, 'password': 'wrong'})
+
+    def test_email_bucket_rejects_before_hashing(self):
+        self.assertEqual(self._login('throttled@example.com').status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self._login('Throttled@example.com').status_code, status.HTTP_401_UNAUTHORIZED)
+        with mock.patch('authentication.serializers.authenticate') as authenticate:
+            response = self._login('throttled@example.com')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', response)
+        authenticate.assert_not_called()
+        self.assertEqual(self._login('other@example.com').status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_ip_bucket_and_refill(self):
+        table = TokenBucketTable(maxsize=2)
+        self.assertEqual(table.consume('a', 2, 60, now=0), 0)
+        self.assertEqual(table.consume('a', 2, 60, now=0), 0)
+        self.assertAlmostEqual(table.consume('a', 2, 60, now=0), 30)
+        self.assertEqual(table.consume('a', 2, 60, now=30), 0)
+        table.consume('b', 2, 60, now=30)
+        table.consume('c', 2, 60, now=30)
+        self.assertEqual(list(table._buckets), ['b', 'c'])
+
+        data = {'email': 'new@example.com', 'full_name': 'New', 'password': 'testpass123'}
+        self.assertEqual(self.client.post(reverse('register'), data).status_code, status.HTTP_201_CREATED)
+        data['email'] = 'new2@example.com'
+        self.assertEqual(self.client.post(reverse('register'), data).status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_forwarded_for_header_does_not_pick_the_ip_bucket(self):
+        data = {'email': 'spoof@example.com', 'full_name': 'Spoof', 'password': 'testpass123'}
+        response = self.client.post(reverse('register'), data, HTTP_X_FORWARDED_FOR='10.0.0.1')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        data['email'] = 'spoof2@example.com'
+        response = self.client.post(reverse('register'), data, HTTP_X_FORWARDED_FOR='10.0.0.2')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_ip_spray_does_not_evict_email_buckets(self):
+        for _ in range(2):
+            self._login('throttled@example.com')
+        with mock.patch.object(buckets['ip'], 'maxsize', 1):
+            for i in range(3):
+                self.client.post(reverse('login'), {'email': f'spray{i}@example.com', 'password': 'wrong'}, REMOTE_ADDR=f'10.0.1.{i}')
+        self.assertEqual(self._login('throttled@example.com').status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    # A fixed clock keeps the run inside one counting window.
+    @override_settings(AUTH_THROTTLE_CACHE='throttle')
+    @mock.patch('authentication.throttling.time.time', return_value=1_000_020.0)
+    def test_shared_cache_limits_across_workers(self, _):
+        for _ in range(2):
+            self._login('throttled@example.com')
+        clear_buckets()  # a different worker process has a fresh table
+        self.assertEqual(self._login('throttled@example.com').status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+
+class TokenRevocationTests(APITestCase):
+    def setUp(self):
+        clear_buckets()
+        revocations.reset()
+        revocations.sync(force=True)
+        self.user = User.objects.create_user(email='revoke@example.com', password='testpass123', full_name='Revoke User')
+        self.tokens = self.client.post(reverse('login'), {'email': 'revoke@example.com', 'password': 'testpass123'}).data
+
+    def test_logout_revokes_refresh_and_access_tokens(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.tokens['access']}")
+        self.assertEqual(self.client.get(reverse('user-detail')).status_code, status.HTTP_200_OK)
+        response = self.client.post(reverse('logout'), {'refresh': self.tokens['refresh']})
+        self.assertEqual(response.status_code, status.HTTP_205_RESET_CONTENT)
+        self.assertEqual(self.client.get(reverse('user-detail')).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.client.credentials()
+        response = self.client.post(reverse('token-refresh'), {'refresh': self.tokens['refresh']})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_refresh_issues_access_token_without_query_for_valid_tokens(self):
+        with self.assertNumQueries(0):
+            response = self.client.post(reverse('token-refresh'), {'refresh': self.tokens['refresh']})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(AccessToken(response.data['access'])['rjti'], ClaimsRefreshToken(self.tokens['refresh'])['jti'])
+
+    def test_revocations_from_other_processes_arrive_on_sync(self):
+        refresh = ClaimsRefreshToken(self.tokens['refresh'])
+        RevokedToken.objects.create(jti=refresh['jti'], user=self.user, expires_at=timezone.now() + timedelta(days=1))
+        self.assertFalse(revocations.is_revoked(refresh['jti']))
+        revocations.sync(force=True)
+        self.assertTrue(revocations.is_revoked(refresh['jti']))
+
+    def test_grown_filter_is_not_rebuilt_on_every_sync(self):
+        for i in range(3):
+            RevokedToken.objects.create(jti=f'grown-{i}', user=self.user, expires_at=timezone.now() + timedelta(days=1))
+        revocation_filter = RevocationFilter(capacity=2)
+        revocation_filter.sync(force=True)
+        built_at = revocation_filter.built_at
+        revocation_filter.sync(force=True)
+        self.assertEqual(revocation_filter.built_at, built_at)
+        self.assertTrue(revocation_filter.is_revoked('grown-2'))
+
+    def test_bloom_filter_false_positive_rate(self):
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        for i in range(1000):
+            bloom.add(f'revoked-{i}')
+        self.assertTrue(all(f'revoked-{i}' in bloom for i in range(1000)))
+        false_positives = sum(f'valid-{i}' in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
@@ -0,0 +1,141 @@
+"""
+Token-bucket throttling for the credential endpoints.
+
+Every login or registration attempt costs a password hash, so attempts
+are throttled by client IP and by email before the view runs. The client
+IP is REMOTE_ADDR unless REST_FRAMEWORK['NUM_PROXIES'] says how many
+X-Forwarded-For hops to trust; the header alone is client-supplied.
+Buckets live in per-process tables (LRU OrderedDicts with a size cap),
+one for IPs and one for emails so a spray of addresses cannot evict the
+email buckets, and turn rejected requests away without touching the
+database or cache.
+When AUTH_THROTTLE_CACHE names a cache alias (Redis, database cache, ...),
+requests the local bucket allows are also counted in a fixed window in
+that shared cache, so the limit holds across workers.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+DEFAULT_RATES = {
+    'login': {'ip': '20/min', 'email': '5/min'},
+    'register': {'ip': '10/hour', 'email': '3/hour'},
+}
+PERIODS = {'s': 1, 'sec': 1, 'min': 60, 'hour': 3600, 'day': 86400}
+
+
+def parse_rate(rate):
+    """'5/min' -> (5, 60)."""
+    count, period = rate.split('/')
+    return int(count), PERIODS[period]
+
+
+class TokenBucketTable:
+    """Buckets keyed by string; the least recently used are evicted past `maxsize`."""
+
+    def __init__(self, maxsize=100_000):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key, capacity, period, now=None):
+        """Take one token; returns seconds to wait, or 0 if allowed."""
+        now = time.monotonic() if now is None else now
+        refill = capacity / period
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * refill)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                wait = 0
+            else:
+                self._buckets[key] = (tokens, now)
+                wait = (1 - tokens) / refill
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+buckets = {
+    kind: TokenBucketTable(getattr(settings, 'AUTH_THROTTLE_TABLE_SIZE', 100_000))
+    for kind in ('ip', 'email')
+}
+
+
+def clear_buckets():
+    for table in buckets.values():
+        table.clear()
+
+
+def shared_count_exceeded(key, capacity, period, alias):
+    """Fixed-window counter in a shared cache; returns seconds to wait, or 0."""
+    cache = caches[alias]
+    now = time.time()
+    window = int(now // period)
+    cache_key = f'throttle:{key}:{window}'
+    if cache.add(cache_key, 1, timeout=period + 1):
+        return 0
+    try:
+        count = cache.incr(cache_key)
+    except ValueError:
+        # Expired between add() and incr().
+        cache.add(cache_key, 1, timeout=period + 1)
+        return 0
+    return (window + 1) * period - now if count > capacity else 0
+
+
+class CredentialRateThrottle(BaseThrottle):
+    """Throttles by IP first, then by the submitted email, for `scope`."""
+    scope = None
+
+    def rates(self):
+        return getattr(settings, 'AUTH_THROTTLE_RATES', DEFAULT_RATES)[self.scope]
+
+    def allow_request(self, request, view):
+        self.wait_seconds = 0
+        rates = self.rates()
+        # The IP check runs before the body is parsed.
+        if not self._take('ip', self.client_ip(request), rates['ip']):
+            return False
+        email = request.data.get('email') if hasattr(request.data, 'get') else None
+        if email and 'email' in rates:
+            return self._take('email', str(email).strip().lower(), rates['email'])
+        return True
+
+    def client_ip(self, request):
+        # get_ident() trusts the whole X-Forwarded-For header when
+        # NUM_PROXIES is unset, which lets clients pick their own bucket.
+        if api_settings.NUM_PROXIES is None:
+            return request.META.get('REMOTE_ADDR')
+        return self.get_ident(request)
+
+    def _take(self, kind, value, rate):
+        key = f'{self.scope}:{kind}:{value}'
+        capacity, period = parse_rate(rate)
+        wait = buckets[kind].consume(key, capacity, period)
+        alias = getattr(settings, 'AUTH_THROTTLE_CACHE', None)
+        if not wait and alias:
+            wait = shared_count_exceeded(key, capacity, period, alias)
+        self.wait_seconds = max(self.wait_seconds, wait)
+        return not wait
+
+    def wait(self):
+        return self.wait_seconds or None
+
+
+class LoginRateThrottle(CredentialRateThrottle):
+    scope = 'login'
+
+
+class RegisterRateThrottle(CredentialRateThrottle):
+    scope = 'register'
@@ -0,0 +1,52 @@
+import time
+
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from hospital_app.sharding import is_sharded, locate_user, use_shard
+
+CLAIMS_VERSION = 1
+
+
+def user_claims(user):
+    """Claims embedded in every token so most requests never load the user row."""
+    alias, hospital_id = locate_user(user.pk)
+    with use_shard(alias):
+        claims = {
+            'role': user.role,
+            'is_staff': user.is_staff,
+            'is_superuser': user.is_superuser,
+            'patient_id': user.patient_id,
+            'doctor_id': user.doctor_id,
+            'claims_version': CLAIMS_VERSION,
+            # Sub-second issue time, compared against the user cache's change log.
+            'claims_at': time.time(),
+        }
+    if is_sharded():
+        # Picks the database shard for the user's requests (see hospital_app.sharding).
+        claims['hospital_id'] = hospital_id
+    return claims
+
+
+class ClaimsRefreshToken(RefreshToken):
+    """Refresh token whose access tokens carry `user_claims`."""
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        for claim, value in user_claims(user).items():
+            token[claim] = value
+        return token
+
+    @property
+    def access_token(self):
+        access = super().access_token
+        # Lets revoking this refresh token revoke its access tokens too.
+        access['rjti'] = self['jti']
+        return access
+
+    def access_token_for(self, user):
+        """An access token with claims freshly taken from `user`, for refreshes."""
+        access = self.access_token
+        for claim, value in user_claims(user).items():
+            access[claim] = value
+        return access
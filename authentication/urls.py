@@ -1,8 +1,10 @@
 from django.urls import path
-from .views import RegisterView, LoginView, UserDetailView
+from .views import RegisterView, LoginView, LogoutView, TokenRefreshView, UserDetailView
 
 urlpatterns = [
     path('register/', RegisterView.as_view(), name='register'),
     path('login/', LoginView.as_view(), name='login'),
     path('user/', UserDetailView.as_view(), name='user-detail'),
+    path('token/refresh/', TokenRefreshView.as_view(), name='token-refresh'),
+    path('logout/', LogoutView.as_view(), name='logout'),
 ]
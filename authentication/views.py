@@ -2,12 +2,19 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from .serializers import RegisterSerializer, LoginSerializer, UserSerializer
-from rest_framework_simplejwt.tokens import RefreshToken
+from .serializers import RegisterSerializer, LoginSerializer, RefreshTokenSerializer, UserSerializer
+from .backends import full_user, user_cache
+from .models import User
+from .revocation import revoke
+from .throttling import LoginRateThrottle, RegisterRateThrottle
+from .tokens import ClaimsRefreshToken
 from rest_framework.permissions import IsAuthenticated
+from rest_framework_simplejwt.settings import api_settings
 
 
 class RegisterView(APIView):
+    throttle_classes = [RegisterRateThrottle]
+
     def post(self, request):
         serializer = RegisterSerializer(data=request.data)
         if serializer.is_valid():
@@ -21,11 +28,11 @@ class UserDetailView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        serializer = UserSerializer(request.user)
+        serializer = UserSerializer(full_user(request.user))
         return Response(serializer.data)
 
     def put(self, request):
-        serializer = UserSerializer(request.user, data=request.data, partial=True)
+        serializer = UserSerializer(User.objects.get(pk=request.user.pk), data=request.data, partial=True)
         if serializer.is_valid():
             serializer.save()
             return Response(serializer.data)
@@ -33,13 +40,46 @@ class UserDetailView(APIView):
 
 
 class LoginView(APIView):
+    throttle_classes = [LoginRateThrottle]
+
     def post(self, request):
         serializer = LoginSerializer(data=request.data)
         if serializer.is_valid():
             user = serializer.validated_data['user']
-            refresh = RefreshToken.for_user(user)
+            refresh = ClaimsRefreshToken.for_user(user)
             return Response({
                 'refresh': str(refresh),
                 'access': str(refresh.access_token),
             })
-        return Response(serializer.errors, status=status.HTTP_401_UNAUTHORIZED)
\ No newline at end of file
+        return Response(serializer.errors, status=status.HTTP_401_UNAUTHORIZED)
+
+
+class TokenRefreshView(APIView):
+    """
+    Issues an access token from a refresh token. Claims are copied unless the
+    user changed after the refresh token was issued; then they are re-read
+    from the user row, and inactive users are refused.
+    """
+    def post(self, request):
+        serializer = RefreshTokenSerializer(data=request.data)
+        if serializer.is_valid():
+            token = serializer.validated_data['token']
+            user_id = token.get(api_settings.USER_ID_CLAIM)
+            if 'claims_at' in token and not user_cache.changed_since(user_id, token['claims_at']):
+                return Response({'access': str(token.access_token)})
+            user = User.objects.filter(pk=user_id, is_active=True).first()
+            if user is None:
+                return Response({'detail': 'User not found or inactive.'}, status=status.HTTP_401_UNAUTHORIZED)
+            return Response({'access': str(token.access_token_for(user))})
+        return Response(serializer.errors, status=status.HTTP_401_UNAUTHORIZED)
+
+
+class LogoutView(APIView):
+    """Revokes the given refresh token and every access token issued from it."""
+    def post(self, request):
+        serializer = RefreshTokenSerializer(data=request.data)
+        if serializer.is_valid():
+            token = serializer.validated_data['token']
+            revoke(token, user_id=token.get('user_id'))
+            return Response(status=status.HTTP_205_RESET_CONTENT)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -15,10 +15,8 @@ class ChatbotAPIView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request):
-        user = request.user
-        try:
-            patient = user.patient
-        except AttributeError:
+        patient_id = request.user.patient_id
+        if patient_id is None:
             return Response({'detail':'Only patients can use chatbot.'}, status=status.HTTP_403_FORBIDDEN)
 
         symptoms = request.data.get('symptoms', '').lower()
@@ -35,7 +33,7 @@ class ChatbotAPIView(APIView):
             recommendation  = 'Please see a doctor for a proper diagnosis.'
 
         session = ChatbotSession.objects.create(
-            patient=patient,
+            patient_id=patient_id,
             symptoms=symptoms,
             suggested_drugs=suggested_drugs,
             recommendation=recommendation
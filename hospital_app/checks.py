@@ -0,0 +1,39 @@
+"""
+System checks for settings that only work when shared between workers.
+
+Several features keep a version, map or timestamp in a cache alias that
+every worker must see (see the *_CACHE settings). A per-process backend
+such as LocMemCache silently breaks them once more than one worker runs,
+so `manage.py check --deploy` refuses it.
+"""
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+SHARED_CACHE_SETTINGS = (
+    'HOSPITAL_DIRECTORY_CACHE',
+    'SHARD_MAP_CACHE',
+    'DATABASE_REPLICA_PIN_CACHE',
+    'AUTH_USER_CHANGES_CACHE',
+    'AUTH_THROTTLE_CACHE',
+)
+PER_PROCESS_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_caches(app_configs, **kwargs):
+    errors = []
+    for name in SHARED_CACHE_SETTINGS:
+        alias = getattr(settings, name, None)
+        if alias is None:
+            continue
+        backend = settings.CACHES.get(alias, {}).get('BACKEND')
+        if backend in PER_PROCESS_BACKENDS:
+            errors.append(Error(
+                f"{name} uses cache alias {alias!r}, whose backend is not shared between workers.",
+                hint="Point it at a shared cache such as Redis.",
+                id='hospital_app.E001',
+            ))
+    return errors
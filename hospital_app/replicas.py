@@ -0,0 +1,236 @@
+"""
+Read-replica routing.
+
+settings.DATABASE_REPLICAS maps a primary alias (usually 'default', or
+any shard from DATABASE_SHARDS) to read-only replica aliases. Reads are
+sent to a replica only inside a GET/HEAD/OPTIONS request that
+ReplicaMiddleware has cleared for it; everything else - writes,
+management commands, workers, and reads inside a transaction on the
+primary - stays on the primary.
+
+A request is kept on the primary for DATABASE_REPLICA_PIN_SECONDS after
+its JWT subject last wrote (an unsafe request, or any write made while
+serving a safe one), so a client that books an appointment and then
+lists its appointments never sees replication lag. Pins live in a shared
+cache (DATABASE_REPLICA_PIN_CACHE), which must be shared between workers
+in production.
+
+Each process checks a replica's health at most every
+DATABASE_REPLICA_CHECK_INTERVAL seconds, with the check folded into the
+request that notices it is due. A replica that fails the check, or lags
+further than DATABASE_REPLICA_MAX_LAG seconds (Postgres only), is skipped
+until the next check; with none left, reads go to the primary. Among
+healthy replicas, DATABASE_REPLICA_SELECTION picks 'round_robin' or
+'least_latency' (lowest moving average of the check round trip).
+"""
+import itertools
+import re
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DatabaseError, connections
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import UntypedToken
+
+from .sharding import ShardRouter
+
+PIN_KEY = 'replicas:pin:{}'
+LATENCY_WEIGHT = 0.3
+WRITE_SQL = re.compile(r'\s*(INSERT|UPDATE|DELETE|REPLACE|MERGE)\b', re.IGNORECASE)
+
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+def replica_map():
+    return getattr(settings, 'DATABASE_REPLICAS', {})
+
+
+def primary_of(alias):
+    for primary, replicas in replica_map().items():
+        if alias in replicas:
+            return primary
+    return alias
+
+
+@contextmanager
+def use_primary():
+    """Read from primaries inside the block, e.g. when filling a shared cache."""
+    token = _replica_reads.set(False)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+class ReplicaState:
+    def __init__(self):
+        self.healthy = True
+        self.checked_at = None
+        self.latency = None
+        self.lock = threading.Lock()
+
+
+class ReplicaPool:
+    def __init__(self):
+        self._states = {}
+        self._turns = {}
+        self._lock = threading.Lock()
+
+    def state(self, alias):
+        state = self._states.get(alias)
+        if state is None:
+            with self._lock:
+                state = self._states.setdefault(alias, ReplicaState())
+        return state
+
+    def check(self, alias):
+        """Ping `alias` and record whether it is usable and how fast it answered."""
+        state = self.state(alias)
+        connection = connections[alias]
+        max_lag = getattr(settings, 'DATABASE_REPLICA_MAX_LAG', None)
+        started = time.perf_counter()
+        try:
+            with connection.cursor() as cursor:
+                if connection.vendor == 'postgresql':
+                    # An idle but caught-up replica has an old replay timestamp,
+                    # so lag only counts while WAL is still being replayed.
+                    cursor.execute(
+                        "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                        "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+                    )
+                    lag = float(cursor.fetchone()[0])
+                else:
+                    cursor.execute('SELECT 1')
+                    lag = 0.0
+            healthy = max_lag is None or lag <= max_lag
+        except DatabaseError:
+            healthy = False
+            connection.close()
+        elapsed = time.perf_counter() - started
+        if healthy:
+            state.latency = elapsed if state.latency is None else (
+                LATENCY_WEIGHT * elapsed + (1 - LATENCY_WEIGHT) * state.latency
+            )
+        state.healthy = healthy
+        state.checked_at = time.monotonic()
+        return healthy
+
+    def is_healthy(self, alias):
+        state = self.state(alias)
+        interval = getattr(settings, 'DATABASE_REPLICA_CHECK_INTERVAL', 5.0)
+        if state.checked_at is None or time.monotonic() - state.checked_at >= interval:
+            # One request re-checks; the others use the previous answer meanwhile.
+            if state.lock.acquire(blocking=state.checked_at is None):
+                try:
+                    self.check(alias)
+                finally:
+                    state.lock.release()
+        return state.healthy
+
+    def choose(self, primary):
+        """A healthy replica of `primary`, or `primary` itself."""
+        healthy = [alias for alias in replica_map().get(primary, ()) if self.is_healthy(alias)]
+        if not healthy:
+            return primary
+        if getattr(settings, 'DATABASE_REPLICA_SELECTION', 'round_robin') == 'least_latency':
+            return min(healthy, key=lambda alias: self.state(alias).latency or 0.0)
+        turns = self._turns.get(primary)
+        if turns is None:
+            turns = self._turns.setdefault(primary, itertools.count())
+        return healthy[next(turns) % len(healthy)]
+
+    def reset(self):
+        with self._lock:
+            self._states = {}
+            self._turns = {}
+
+
+replica_pool = ReplicaPool()
+
+
+class ReplicaRouter(ShardRouter):
+    """ShardRouter whose reads may go to one of the shard's replicas."""
+
+    def db_for_read(self, model, **hints):
+        primary = primary_of(super().db_for_read(model, **hints))
+        if not _replica_reads.get() or connections[primary].in_atomic_block:
+            return primary
+        return replica_pool.choose(primary)
+
+    def db_for_write(self, model, **hints):
+        # Instances read from a replica are written back to its primary.
+        return primary_of(super().db_for_write(model, **hints))
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return primary_of(db) == db
+
+
+# Read-your-writes ------------------------------------------------------------
+
+def _pin_cache():
+    return caches[getattr(settings, 'DATABASE_REPLICA_PIN_CACHE', 'default')]
+
+
+def token_subject(request):
+    """
+    The user id claim of the request's bearer token, or None. The token is
+    not verified: it only decides where reads go, and authentication still
+    checks it before anything is served.
+    """
+    header = request.META.get('HTTP_AUTHORIZATION', '').split()
+    if len(header) != 2 or header[0] not in api_settings.AUTH_HEADER_TYPES:
+        return None
+    try:
+        return UntypedToken(header[1], verify=False).get(api_settings.USER_ID_CLAIM)
+    except TokenError:
+        return None
+
+
+def pin(subject):
+    _pin_cache().set(PIN_KEY.format(subject), 1, getattr(settings, 'DATABASE_REPLICA_PIN_SECONDS', 10))
+
+
+def is_pinned(subject):
+    return _pin_cache().get(PIN_KEY.format(subject)) is not None
+
+
+class WriteRecorder:
+    """Execute wrapper noting whether any statement run through it wrote."""
+
+    def __init__(self):
+        self.wrote = False
+
+    def __call__(self, execute, sql, params, many, context):
+        if not self.wrote and WRITE_SQL.match(sql):
+            self.wrote = True
+        return execute(sql, params, many, context)
+
+
+class ReplicaMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not replica_map():
+            return self.get_response(request)
+        subject = token_subject(request)
+        safe = request.method in SAFE_METHODS
+        reads = _replica_reads.set(safe and not (subject is not None and is_pinned(subject)))
+        recorder = WriteRecorder()
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    if primary_of(alias) == alias:
+                        stack.enter_context(connections[alias].execute_wrapper(recorder))
+                response = self.get_response(request)
+            if subject is not None and (not safe or recorder.wrote):
+                pin(subject)
+        finally:
+            _replica_reads.reset(reads)
+        return response
@@ -55,6 +55,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'hospital_app.sharding.ShardMiddleware',
+    'hospital_app.replicas.ReplicaMiddleware',
 ]
 
 ROOT_URLCONF = 'hospital_app.urls'
@@ -94,6 +96,34 @@ DATABASES = {
     }
 }
 
+# Directory versions, the shard map, replica pins and user change times are
+# shared between workers through these caches, so 'default' must not be a
+# per-process backend (`manage.py check --deploy` enforces this).
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': 'redis://localhost:6379/1',
+    }
+}
+
+# Aliases holding per-hospital tenant data, 'default' first; see
+# hospital_app/sharding.py and `manage.py move_hospital`. Add the extra
+# aliases to DATABASES as well.
+DATABASE_SHARDS = ['default']
+DATABASE_ROUTERS = ['hospital_app.replicas.ReplicaRouter']
+# Cache alias holding the shard map version shared by all workers.
+SHARD_MAP_CACHE = 'default'
+
+# Read replicas per primary alias, e.g. {'default': ['replica_1', 'replica_2']};
+# see hospital_app/replicas.py. Safe-method requests read from them unless
+# the token's user wrote within DATABASE_REPLICA_PIN_SECONDS.
+DATABASE_REPLICAS = {}
+DATABASE_REPLICA_SELECTION = 'round_robin'  # or 'least_latency'
+DATABASE_REPLICA_CHECK_INTERVAL = 5
+DATABASE_REPLICA_MAX_LAG = 5
+DATABASE_REPLICA_PIN_SECONDS = 10
+DATABASE_REPLICA_PIN_CACHE = 'default'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -138,7 +168,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'authentication.backends.ClaimsJWTAuthentication',
     )
 }
 
@@ -148,3 +178,21 @@ SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
     'AUTH_HEADER_TYPES': ('Bearer',),
 }
+
+# Per-process cache of User rows for requests that need more than the token claims.
+AUTH_USER_CACHE_SIZE = 1024
+AUTH_USER_CACHE_TTL = 300
+# Cache alias recording when each user last changed; must be shared by all
+# workers so every one of them stops trusting older token claims.
+AUTH_USER_CHANGES_CACHE = 'default'
+
+# Login/registration throttling: per-process token buckets, plus a shared
+# fixed-window count in this cache alias when set (e.g. a Redis cache).
+AUTH_THROTTLE_RATES = {
+    'login': {'ip': '20/min', 'email': '5/min'},
+    'register': {'ip': '10/hour', 'email': '3/hour'},
+}
+AUTH_THROTTLE_CACHE = None
+
+# Cache alias holding the hospital directory version shared by all workers.
+HOSPITAL_DIRECTORY_CACHE = 'default'
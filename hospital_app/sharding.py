@@ -0,0 +1,419 @@
+"""
+Per-hospital database sharding.
+
+Each hospital's tenant data - branches, doctors, patients, appointments,
+chat sessions and everything hanging off them - lives on one database
+alias from settings.DATABASE_SHARDS, chosen by its HospitalShard row
+(unassigned hospitals use 'default'). Global data (users, hospitals, the
+shard map, token denylists, universal ID blocks) lives on 'default'.
+Users and hospitals are also copied to every shard as reference rows
+when the 'default' transaction that saved them commits, so shard-local
+joins (patient -> user, branch -> hospital) and foreign keys keep working.
+
+The shard for a request is kept in a context variable. It is resolved
+from the URL (`hospital_id` / `branch_id` view kwargs) by ShardMiddleware,
+or from the `hospital_id` token claim by the JWT authentication class;
+ShardRouter sends tenant models there. Code outside a request (commands,
+workers) picks a shard with use_shard(), or visits all of them with
+fan_out().
+
+Row ids are kept unique across shards by starting each shard's tenant
+sequences at its position in DATABASE_SHARDS times SHARD_ID_SPACING, so a
+hospital can be copied to another shard without renumbering (see
+hospitals/rebalance.py).
+
+With a single shard (the default) the router always answers 'default'
+and the middleware, claims and mirroring are no-ops.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.apps import apps as global_apps
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections, transaction
+from django.http import JsonResponse
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+SHARD_ID_SPACING = 2 ** 40
+TENANT_APPS = frozenset({'appointments', 'chatbot'})
+TENANT_MODELS = frozenset({
+    'hospitals.hospitalbranch',
+    'hospitals.doctor',
+    'hospitals.doctoravailability',
+    'hospitals.doctoravailabilityexception',
+    'patients.patient',
+    'patients.medicalhistoryentry',
+    'patients.patientblockingkey',
+    'patients.duplicatecandidate',
+    'patients.duplicatescanrun',
+})
+REFERENCE_MODELS = frozenset({'authentication.user', 'hospitals.hospital'})
+MAP_VERSION_KEY = 'sharding:map:version'
+
+_current = ContextVar('hospital_shard', default=None)
+
+
+def shard_aliases():
+    """settings.DATABASE_SHARDS; the first entry must be 'default'."""
+    return list(getattr(settings, 'DATABASE_SHARDS', ['default']))
+
+
+def reference_copies():
+    """Shards holding copies of the reference rows kept on 'default'."""
+    return shard_aliases()[1:]
+
+
+def is_sharded():
+    return len(shard_aliases()) > 1
+
+
+def is_tenant_model(model):
+    return model._meta.app_label in TENANT_APPS or model._meta.label_lower in TENANT_MODELS
+
+
+def current_shard():
+    return _current.get()
+
+
+@contextmanager
+def use_shard(alias):
+    token = _current.set(alias)
+    try:
+        yield alias
+    finally:
+        _current.reset(token)
+
+
+def bind_shard(iterable):
+    """
+    Iterate `iterable` under the shard current at this call, e.g. for a
+    streaming response consumed after the view has returned.
+    """
+    return _bound(current_shard(), iter(iterable))
+
+
+def _bound(alias, iterator):
+    while True:
+        with use_shard(alias):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+# Shard map -------------------------------------------------------------------
+
+def _cache():
+    return caches[getattr(settings, 'SHARD_MAP_CACHE', 'default')]
+
+
+def _map_version():
+    cache = _cache()
+    version = cache.get(MAP_VERSION_KEY)
+    if version is None:
+        cache.add(MAP_VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(MAP_VERSION_KEY)
+    return version
+
+
+def shard_map_changed():
+    cache = _cache()
+    try:
+        cache.incr(MAP_VERSION_KEY)
+    except ValueError:
+        cache.add(MAP_VERSION_KEY, time.time_ns(), timeout=None)
+
+
+class ShardMap:
+    """Per-process copy of HospitalShard, reloaded when the shared version moves."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._hospitals = {}
+        self._arrivals = {}
+        self._branches = {}
+
+    def _load(self):
+        version = _map_version()
+        if version != self._version:
+            HospitalShard = global_apps.get_model('hospitals', 'HospitalShard')
+            rows = HospitalShard.objects.using('default').values_list('hospital_id', 'alias', 'read_only', 'moved_at')
+            hospitals, arrivals = {}, {}
+            for hospital_id, alias, read_only, moved_at in rows:
+                hospitals[hospital_id] = (alias, read_only)
+                if moved_at and (alias not in arrivals or moved_at > arrivals[alias]):
+                    arrivals[alias] = moved_at
+            with self._lock:
+                self._hospitals, self._arrivals = hospitals, arrivals
+                self._version = version
+        return self._hospitals
+
+    def placement(self, hospital_id):
+        """(alias, read_only) for a hospital."""
+        return self._load().get(hospital_id, ('default', False))
+
+    def last_arrival(self, alias):
+        """When a hospital was last moved onto `alias`, or None."""
+        if not is_sharded():
+            return None
+        self._load()
+        return self._arrivals.get(alias)
+
+    def hospital_for_branch(self, branch_id):
+        hospital_id = self._branches.get(branch_id)
+        if hospital_id is None:
+            HospitalBranch = global_apps.get_model('hospitals', 'HospitalBranch')
+            for alias in shard_aliases():
+                hospital_id = HospitalBranch.objects.using(alias).filter(pk=branch_id).values_list(
+                    'hospital_id', flat=True
+                ).first()
+                if hospital_id is not None:
+                    # A branch never changes hospital, so this never goes stale.
+                    self._branches[branch_id] = hospital_id
+                    break
+        return hospital_id
+
+    def clear(self):
+        with self._lock:
+            self._version = None
+            self._hospitals = {}
+            self._arrivals = {}
+            self._branches = {}
+
+
+shard_map = ShardMap()
+
+
+def shard_for_hospital(hospital_id):
+    if not is_sharded() or hospital_id is None:
+        return 'default'
+    return shard_map.placement(hospital_id)[0]
+
+
+class ShardMoving(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'This hospital is being moved; try again shortly.'
+    default_code = 'shard_moving'
+
+
+def activate_hospital(hospital_id, write=False):
+    """Route this request's tenant queries to `hospital_id`'s shard."""
+    if not is_sharded() or hospital_id is None:
+        return
+    alias, read_only = shard_map.placement(hospital_id)
+    if write and read_only:
+        raise ShardMoving()
+    _current.set(alias)
+
+
+def activate_branch(branch_id, write=False):
+    """activate_hospital() for the hospital owning `branch_id`."""
+    if is_sharded() and branch_id is not None:
+        activate_hospital(shard_map.hospital_for_branch(branch_id), write=write)
+
+
+def locate_user(user_id):
+    """
+    (alias, hospital_id) of the shard holding the user's patient or doctor
+    row; ('default', None) if there is none. Used when issuing tokens.
+    """
+    if not is_sharded():
+        return 'default', None
+    Patient = global_apps.get_model('patients', 'Patient')
+    Doctor = global_apps.get_model('hospitals', 'Doctor')
+    for alias in shard_aliases():
+        row = Patient.objects.using(alias).filter(user_id=user_id).values_list('hospital_branch__hospital_id').first()
+        if row is not None:
+            return alias, row[0]
+        hospital_id = Doctor.objects.using(alias).filter(user_id=user_id).values_list(
+            'branch__hospital_id', flat=True
+        ).first()
+        if hospital_id is not None:
+            return alias, hospital_id
+    return 'default', None
+
+
+# Router and middleware -------------------------------------------------------
+
+class ShardRouter:
+    def _db(self, model, **hints):
+        if not is_tenant_model(model) or not is_sharded():
+            return 'default'
+        instance = hints.get('instance')
+        if instance is not None:
+            if is_tenant_model(type(instance)) and instance._state.db:
+                return instance._state.db
+            if type(instance)._meta.label_lower == 'hospitals.hospital' and instance.pk:
+                return shard_for_hospital(instance.pk)
+        return current_shard() or 'default'
+
+    db_for_read = _db
+    db_for_write = _db
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Tenant rows point at reference rows that also exist on 'default'.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Every shard carries the full schema; global tables just stay empty.
+        return True
+
+
+class ShardMiddleware:
+    """Scopes the shard to the request, resolving it from hospital/branch view kwargs."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _current.set(None)
+        try:
+            return self.get_response(request)
+        finally:
+            _current.reset(token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not is_sharded():
+            return None
+        hospital_id = view_kwargs.get('hospital_id')
+        if hospital_id is None and view_kwargs.get('branch_id') is not None:
+            hospital_id = shard_map.hospital_for_branch(view_kwargs['branch_id'])
+        if hospital_id is not None:
+            alias, read_only = shard_map.placement(hospital_id)
+            if read_only and request.method not in ('GET', 'HEAD', 'OPTIONS'):
+                return JsonResponse(
+                    {'detail': ShardMoving.default_detail}, status=ShardMoving.status_code, headers={'Retry-After': '5'}
+                )
+            _current.set(alias)
+        return None
+
+
+# Fan-out ---------------------------------------------------------------------
+
+def fan_out(func, aliases=None):
+    """Call `func(alias)` under each shard in turn; returns {alias: result}."""
+    results = {}
+    for alias in aliases or shard_aliases():
+        with use_shard(alias):
+            results[alias] = func(alias)
+    return results
+
+
+def fan_out_queryset(queryset, aliases=None):
+    """Rows of `queryset` from every shard, shard by shard (ordering is per shard)."""
+    for alias in aliases or shard_aliases():
+        yield from queryset.using(alias)
+
+
+# Raw row copies ----------------------------------------------------------------
+
+def concrete_columns(model):
+    return [field.attname for field in model._meta.concrete_fields]
+
+
+def write_rows(model, rows, using):
+    """
+    Replace rows (tuples in concrete_columns order, primary key first) on
+    `using`. Raw SQL, so auto_now fields keep their values and no signals
+    fire; call inside transaction.atomic(using=using).
+    """
+    if not rows:
+        return
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    fields = model._meta.concrete_fields
+    table = quote(model._meta.db_table)
+    pk_column = quote(model._meta.pk.column)
+    columns = ', '.join(quote(field.column) for field in fields)
+    placeholders = ', '.join(['%s'] * len(fields))
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), 500):
+            chunk = rows[start:start + 500]
+            cursor.execute(
+                f'DELETE FROM {table} WHERE {pk_column} IN ({", ".join(["%s"] * len(chunk))})',
+                [row[0] for row in chunk],
+            )
+            cursor.executemany(
+                f'INSERT INTO {table} ({columns}) VALUES ({placeholders})',
+                [
+                    [field.get_db_prep_save(value, connection) for field, value in zip(fields, row)]
+                    for row in chunk
+                ],
+            )
+
+
+def delete_rows(model, pks, using):
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    pks = list(pks)
+    with connection.cursor() as cursor:
+        for start in range(0, len(pks), 500):
+            chunk = pks[start:start + 500]
+            cursor.execute(
+                f'DELETE FROM {quote(model._meta.db_table)} WHERE {quote(model._meta.pk.column)} '
+                f'IN ({", ".join(["%s"] * len(chunk))})',
+                chunk,
+            )
+
+
+def mirror_reference(instance, using='default'):
+    """
+    Copy a saved User or Hospital row from 'default' to every other shard,
+    or delete it there, once the 'default' transaction commits, so a
+    rolled-back save never reaches the shards. The row is re-read at that
+    point, so whichever state committed last is what gets mirrored.
+    """
+    if not is_sharded() or using != 'default':
+        return
+    model = type(instance)
+    pk = instance.pk
+
+    def mirror():
+        row = model._base_manager.using('default').filter(pk=pk).values_list(*concrete_columns(model)).first()
+        for alias in reference_copies():
+            if row is None:
+                # Cascades to the tenant rows on that shard, with their signals.
+                with use_shard(alias):
+                    model._base_manager.using(alias).filter(pk=pk).delete()
+            else:
+                with transaction.atomic(using=alias):
+                    write_rows(model, [row], alias)
+
+    transaction.on_commit(mirror, using='default')
+
+
+def reserve_id_ranges(using='default', **kwargs):
+    """
+    post_migrate: start the tenant tables' id sequences on a shard at its
+    position in DATABASE_SHARDS times SHARD_ID_SPACING.
+    """
+    aliases = shard_aliases()
+    if using not in aliases[1:]:
+        return
+    floor = aliases.index(using) * SHARD_ID_SPACING
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        for model in global_apps.get_models():
+            if not is_tenant_model(model):
+                continue
+            table = model._meta.db_table
+            if connection.vendor == 'postgresql':
+                cursor.execute(
+                    f"SELECT setval(pg_get_serial_sequence(%s, %s), "
+                    f"GREATEST(%s, (SELECT COALESCE(MAX({connection.ops.quote_name(model._meta.pk.column)}), 0) "
+                    f"FROM {connection.ops.quote_name(table)})))",
+                    [table, model._meta.pk.column, floor],
+                )
+            elif connection.vendor == 'sqlite':
+                cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = %s', [table])
+                current = cursor.fetchone()
+                if current is None:
+                    cursor.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)', [table, floor])
+                elif current[0] < floor:
+                    cursor.execute('UPDATE sqlite_sequence SET seq = %s WHERE name = %s', [floor, table])
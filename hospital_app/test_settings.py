@@ -1,11 +1,48 @@
 # Use SQLite for tests to avoid PostgreSQL sequence issues
 from .settings import *
+import os
 import sys
+import tempfile
 
-if 'test' in sys.argv or 'test_coverage' in sys.argv:
+if os.environ.get('TEST_POSTGRES'):
+    # TEST_POSTGRES=1 runs the suite, Postgres-only tests included, against
+    # the server configured in settings.
+    DATABASES = {
+        'default': DATABASES['default'],
+        'shard_b': {**DATABASES['default'], 'TEST': {'NAME': 'test_hospital_db_shard_b'}},
+        'replica': {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}},
+    }
+elif 'test' in sys.argv or 'test_coverage' in sys.argv:
     DATABASES = {
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': ':memory:',
-        }
+        },
+        # Second shard for the sharding tests, which enable it with
+        # override_settings(DATABASE_SHARDS=['default', 'shard_b']).
+        'shard_b': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': ':memory:',
+        },
+        # Read replica of 'default' for the replica routing tests.
+        'replica': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': ':memory:',
+            'TEST': {'MIRROR': 'default'},
+        },
     }
+
+# Tests run in one process, so a per-process cache stands in for Redis.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Shared throttle counters for the throttle tests, cleared in their setUp.
+    'throttle': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'throttle',
+    },
+}
+
+# Keep uploaded test files out of the source tree.
+MEDIA_ROOT = tempfile.mkdtemp(prefix='hospital-test-media-')
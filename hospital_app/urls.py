@@ -24,6 +24,8 @@ urlpatterns = [
     path('api/authentication/', include('authentication.urls')),
     path('api/chatbot/', include('chatbot.urls')),
     path('api/appointments/', include('appointments.urls')),
+    path('api/hospitals/', include('hospitals.urls')),
+    path('api/patients/', include('patients.urls')),
 
     # Swagger URLs
     re_path(r'^swagger(?P<format>\.json|\.yaml)$', schema_view.without_ui(cache_timeout=0), name='schema-json'),
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Hospital, HospitalBranch, Doctor
+from .models import Hospital, HospitalBranch, Doctor, DoctorAvailability, DoctorAvailabilityException
 
 @admin.register(Hospital)
 class HospitalAdmin(admin.ModelAdmin):
@@ -10,12 +10,21 @@ class HospitalAdmin(admin.ModelAdmin):
 
 @admin.register(HospitalBranch)
 class HospitalBranchAdmin(admin.ModelAdmin):
-    list_display = ('name', 'hospital', 'city', 'state', 'created_at')
+    list_display = ('name', 'hospital', 'city', 'state', 'latitude', 'longitude', 'created_at')
     search_fields = ('name', 'hospital__name', 'city', 'state')
     readonly_fields = ('created_at',)
 
+class DoctorAvailabilityInline(admin.TabularInline):
+    model = DoctorAvailability
+    extra = 0
+
+class DoctorAvailabilityExceptionInline(admin.TabularInline):
+    model = DoctorAvailabilityException
+    extra = 0
+
 @admin.register(Doctor)
 class DoctorAdmin(admin.ModelAdmin):
     list_display = ('name', 'specialization', 'branch', 'created_at')
     search_fields = ('name', 'specialization', 'branch__name')
     readonly_fields = ('created_at',)
+    inlines = (DoctorAvailabilityInline, DoctorAvailabilityExceptionInline)
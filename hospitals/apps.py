@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class HospitalsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'hospitals'
+
+    def ready(self):
+        from django.db.models.signals import post_migrate
+        from hospital_app.sharding import reserve_id_ranges
+        import hospital_app.checks
+        import hospitals.signals
+        post_migrate.connect(reserve_id_ranges, sender=self)
@@ -0,0 +1,167 @@
+"""
+Hospital directory cache.
+
+The hospital -> branches -> doctors directory is read constantly and
+changes rarely, so responses are serialized to JSON bytes once and kept
+per process together with a strong ETag. Each entry is tagged with the
+directory version current when it was built; the version lives in a
+shared cache and is bumped by signals on any Hospital, HospitalBranch or
+Doctor write, so every worker drops its copies on the next request. Warm
+requests cost one cache get and no database queries. Branches and doctors
+are read from each hospital's own shard (see hospital_app.sharding).
+"""
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
+from rest_framework.renderers import JSONRenderer
+
+from hospital_app.replicas import use_primary
+from hospital_app.sharding import shard_for_hospital
+from .models import Hospital, HospitalBranch
+from .serializers import DirectoryHospitalSerializer
+
+VERSION_KEY = 'hospitals:directory:version'
+# Gaps larger than this are treated as foreign changes without checking.
+OWN_VERSIONS_KEPT = 1000
+
+_own_versions = set()
+_own_lock = threading.Lock()
+_commit_listeners = []
+
+
+def _cache():
+    return caches[getattr(settings, 'HOSPITAL_DIRECTORY_CACHE', 'default')]
+
+
+def current_version():
+    cache = _cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Start from the clock rather than 1, so a version evicted from the
+        # shared cache can't come back and match entries built before it.
+        cache.add(VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_version():
+    """Bump the shared version; returns the new version if this call set it."""
+    cache = _cache()
+    try:
+        version = cache.incr(VERSION_KEY)
+    except ValueError:
+        version = time.time_ns()
+        if not cache.add(VERSION_KEY, version, timeout=None):
+            return None
+    with _own_lock:
+        _own_versions.add(version)
+        if len(_own_versions) > OWN_VERSIONS_KEPT:
+            floor = version - OWN_VERSIONS_KEPT
+            _own_versions.difference_update([v for v in _own_versions if v < floor])
+    return version
+
+
+def only_own_changes(since, until):
+    """True if every bump in (since, until] was made by this process."""
+    if until - since > OWN_VERSIONS_KEPT:
+        return until == since
+    with _own_lock:
+        return all(version in _own_versions for version in range(since + 1, until + 1))
+
+
+def on_directory_commit(listener):
+    """
+    Register `listener(sender, pk, deleted, using)`, called after a directory
+    write commits and before the version is bumped for it.
+    """
+    _commit_listeners.append(listener)
+    return listener
+
+
+def directory_changed(sender=None, instance=None, deleted=False, using='default'):
+    """
+    Invalidate now for this process, and again on commit in case another
+    worker rebuilt from the pre-commit rows in between.
+    """
+    bump_version()
+    # Deletion clears instance.pk before the transaction commits.
+    pk = instance.pk if instance is not None else None
+
+    def committed():
+        for listener in _commit_listeners:
+            listener(sender, pk, deleted, using)
+        bump_version()
+
+    transaction.on_commit(committed, using=using)
+
+
+def hospitals_queryset():
+    return Hospital.objects.order_by('name', 'id')
+
+
+def with_branches(hospitals):
+    """Prefetch branches and doctors for `hospitals`, one query pair per shard."""
+    by_shard = {}
+    for hospital in hospitals:
+        by_shard.setdefault(shard_for_hospital(hospital.pk), []).append(hospital)
+    for alias, group in by_shard.items():
+        prefetch_related_objects(
+            group, Prefetch('branches', queryset=HospitalBranch.objects.using(alias).prefetch_related('doctors'))
+        )
+    return hospitals
+
+
+def render_hospitals(hospital_id=None):
+    """JSON bytes for the whole directory, or one hospital (None if it doesn't exist)."""
+    queryset = hospitals_queryset()
+    if hospital_id is None:
+        hospitals = with_branches(list(queryset))
+        return JSONRenderer().render(DirectoryHospitalSerializer(hospitals, many=True).data)
+    hospital = queryset.filter(pk=hospital_id).first()
+    if hospital is None:
+        return None
+    with_branches([hospital])
+    return JSONRenderer().render(DirectoryHospitalSerializer(hospital).data)
+
+
+class DirectoryCache:
+    """Per-process map of key -> (version, body, etag)."""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, build):
+        """
+        Return (body, etag) for `key`, calling `build()` for the JSON bytes on
+        a miss; (None, None) if `build` returns None (e.g. unknown hospital).
+        """
+        version = current_version()
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == version:
+            return entry[1], entry[2]
+        # Built from the primary so a lagging replica can't be cached under
+        # the new version.
+        with use_primary():
+            body = build()
+        if body is None:
+            return None, None
+        etag = f'"{hashlib.sha256(body).hexdigest()}"'
+        with self._lock:
+            # Entries from older versions are dead weight; drop them together.
+            if any(stale[0] != version for stale in self._entries.values()):
+                self._entries = {k: v for k, v in self._entries.items() if v[0] == version}
+            self._entries[key] = (version, body, etag)
+        return body, etag
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+
+
+directory_cache = DirectoryCache()
@@ -0,0 +1,319 @@
+"""
+Faceted doctor search.
+
+Doctors are held in a per-process inverted index instead of being
+searched with icontains joins across Doctor, HospitalBranch and Hospital:
+
+* facets  - specialization, city, state and hospital; each doctor has one
+            integer code per facet, and each facet value a sorted array of
+            doctor slots (its posting list)
+* text    - name, specialization, branch, city, state and hospital words;
+            every query word must prefix-match one of a doctor's words
+
+A query intersects the posting lists (smallest first, then by checking
+facet codes of the survivors), and facet counts come from one bincount
+per facet over the matching slots. A facet's own filter is left out of
+its counts, so clients can show "Cardiology (12)" next to the selected
+"Pediatrics".
+
+The index is patched in place when a Doctor, HospitalBranch or Hospital
+write commits in this process. A directory version bump from another
+process (see directory.py) makes the next query rebuild it instead.
+"""
+import bisect
+import re
+import threading
+
+import numpy as np
+
+from hospital_app.sharding import fan_out_queryset, shard_for_hospital
+from .directory import current_version, on_directory_commit, only_own_changes
+from .models import Doctor, Hospital, HospitalBranch
+
+FACETS = ('specialization', 'city', 'state', 'hospital')
+DOCTOR_FIELDS = (
+    'id', 'name', 'specialization', 'contact_info', 'branch_id', 'branch__name', 'branch__city',
+    'branch__state', 'branch__hospital_id', 'branch__hospital__name',
+)
+WORD = re.compile(r'\w+')
+EMPTY = np.empty(0, dtype=np.int64)
+DEAD = np.iinfo(np.int64).max
+
+
+def normalize(value):
+    return ' '.join(str(value).lower().split())
+
+
+def words(text):
+    return set(WORD.findall(text.lower()))
+
+
+def facet_values(row):
+    """(key, label) per facet for one DOCTOR_FIELDS row."""
+    return {
+        'specialization': (normalize(row['specialization']), row['specialization'].strip()),
+        'city': (normalize(row['branch__city']), row['branch__city'].strip()),
+        'state': (normalize(row['branch__state']), row['branch__state'].strip()),
+        'hospital': (row['branch__hospital_id'], row['branch__hospital__name']),
+    }
+
+
+def row_words(row):
+    return words(' '.join((
+        row['name'], row['specialization'], row['branch__name'], row['branch__city'], row['branch__state'],
+        row['branch__hospital__name'],
+    )))
+
+
+def sort_key(row):
+    return normalize(row['name']), row['id']
+
+
+def _add(postings, key, slot):
+    current = postings.get(key, EMPTY)
+    postings[key] = np.insert(current, np.searchsorted(current, slot), slot)
+
+
+def _remove(postings, key, slot):
+    current = postings[key]
+    current = np.delete(current, np.searchsorted(current, slot))
+    if len(current):
+        postings[key] = current
+    else:
+        del postings[key]
+
+
+class DoctorIndex:
+    def __init__(self):
+        self.version = None
+        self.slots = {}
+        self.rows = []
+        self.codes = {facet: np.empty(0, dtype=np.int64) for facet in FACETS}
+        self.keys = {facet: {} for facet in FACETS}
+        self.values = {facet: [] for facet in FACETS}
+        self.labels = {facet: [] for facet in FACETS}
+        self.postings = {facet: {} for facet in FACETS}
+        self.word_postings = {}
+        self.sorted_words = []
+        # (name key, id) of live doctors in result order, and each slot's
+        # position in it (DEAD for removed doctors).
+        self.order = []
+        self.rank = np.empty(0, dtype=np.int64)
+
+    @classmethod
+    def build(cls, rows):
+        """Bulk load; slots are assigned in order, so posting lists come out sorted."""
+        index = cls()
+        codes = {facet: [] for facet in FACETS}
+        postings = {facet: {} for facet in FACETS}
+        word_postings = {}
+        for row in rows:
+            if row['id'] in index.slots:
+                # Seen on two shards while its hospital is being moved.
+                continue
+            slot = len(index.rows)
+            index.slots[row['id']] = slot
+            index.rows.append(row)
+            for facet, (key, label) in facet_values(row).items():
+                code = index._code(facet, key, label)
+                codes[facet].append(code)
+                postings[facet].setdefault(code, []).append(slot)
+            for word in row_words(row):
+                word_postings.setdefault(word, []).append(slot)
+        for facet in FACETS:
+            index.codes[facet] = np.array(codes[facet], dtype=np.int64)
+            index.postings[facet] = {code: np.array(slots, dtype=np.int64) for code, slots in postings[facet].items()}
+        index.word_postings = {word: np.array(slots, dtype=np.int64) for word, slots in word_postings.items()}
+        index.sorted_words = sorted(word_postings)
+        ordered = sorted((sort_key(row), slot) for slot, row in enumerate(index.rows))
+        index.order = [key for key, _ in ordered]
+        index.rank = np.empty(len(index.rows), dtype=np.int64)
+        index.rank[[slot for _, slot in ordered]] = np.arange(len(ordered))
+        return index
+
+    def _code(self, facet, key, label):
+        code = self.keys[facet].get(key)
+        if code is None:
+            code = self.keys[facet][key] = len(self.labels[facet])
+            self.values[facet].append(key)
+            self.labels[facet].append(label)
+        elif facet == 'hospital':
+            # Keeps hospital names current after a rename.
+            self.labels[facet][code] = label
+        return code
+
+    def _grow(self):
+        slot = len(self.rows)
+        self.rows.append(None)
+        for facet in FACETS:
+            self.codes[facet] = np.append(self.codes[facet], -1)
+        self.rank = np.append(self.rank, DEAD)
+        return slot
+
+    def upsert(self, row):
+        slot = self.slots.get(row['id'])
+        if slot is None:
+            slot = self.slots[row['id']] = self._grow()
+        else:
+            self._unlink(slot)
+        self.rows[slot] = row
+        for facet, (key, label) in facet_values(row).items():
+            code = self._code(facet, key, label)
+            self.codes[facet][slot] = code
+            _add(self.postings[facet], code, slot)
+        for word in row_words(row):
+            if word not in self.word_postings:
+                bisect.insort(self.sorted_words, word)
+            _add(self.word_postings, word, slot)
+        key = sort_key(row)
+        position = bisect.bisect_left(self.order, key)
+        self.order.insert(position, key)
+        self.rank[(self.rank >= position) & (self.rank != DEAD)] += 1
+        self.rank[slot] = position
+
+    def remove(self, doctor_id):
+        slot = self.slots.pop(doctor_id, None)
+        if slot is not None:
+            self._unlink(slot)
+            self.rows[slot] = None
+
+    def _unlink(self, slot):
+        row = self.rows[slot]
+        for facet in FACETS:
+            _remove(self.postings[facet], self.codes[facet][slot], slot)
+            self.codes[facet][slot] = -1
+        for word in row_words(row):
+            _remove(self.word_postings, word, slot)
+            if word not in self.word_postings:
+                del self.sorted_words[bisect.bisect_left(self.sorted_words, word)]
+        position = self.rank[slot]
+        del self.order[position]
+        self.rank[slot] = DEAD
+        self.rank[(self.rank > position) & (self.rank != DEAD)] -= 1
+
+    def prefix_slots(self, prefix):
+        start = bisect.bisect_left(self.sorted_words, prefix)
+        end = bisect.bisect_left(self.sorted_words, prefix + '\uffff')
+        matches = [self.word_postings[word] for word in self.sorted_words[start:end]]
+        if len(matches) < 2:
+            return matches[0] if matches else EMPTY
+        mask = np.zeros(len(self.rows), dtype=bool)
+        mask[np.concatenate(matches)] = True
+        return np.flatnonzero(mask)
+
+    def _matching(self, text_sets, codes):
+        """Slots in every text set whose facet codes equal `codes` ({facet: code})."""
+        sets = [(len(slots), 'text', slots) for slots in text_sets]
+        sets += [(len(self.postings[facet].get(code, EMPTY)), facet, code) for facet, code in codes.items()]
+        if not sets:
+            return np.flatnonzero(self.codes['hospital'] >= 0)
+        sets.sort(key=lambda item: item[0])
+        _, kind, value = sets[0]
+        result = value if kind == 'text' else self.postings[kind].get(value, EMPTY)
+        for _, kind, value in sets[1:]:
+            if not len(result):
+                break
+            if kind == 'text':
+                result = result[np.isin(result, value, assume_unique=True)]
+            else:
+                result = result[self.codes[kind][result] == value]
+        return result
+
+    def search(self, q='', filters=None, limit=20, offset=0, facet_limit=20):
+        """
+        `filters` maps facet names to a value (a hospital id for 'hospital',
+        text otherwise). Returns {'count', 'results', 'facets'}.
+        """
+        text_sets = [self.prefix_slots(word) for word in sorted(words(q))]
+        codes = {}
+        for facet, value in (filters or {}).items():
+            code = self.keys[facet].get(value if facet == 'hospital' else normalize(value))
+            codes[facet] = -1 if code is None else code
+        matches = self._matching(text_sets, codes)
+
+        facets = {}
+        for facet in FACETS:
+            base = matches
+            if facet in codes:
+                base = self._matching(text_sets, {name: code for name, code in codes.items() if name != facet})
+            counts = np.bincount(self.codes[facet][base], minlength=len(self.labels[facet]))
+            present = np.flatnonzero(counts)
+            if len(present) > facet_limit:
+                # Only values that can make the top `facet_limit` go through the sort.
+                cutoff = np.partition(counts[present], len(present) - facet_limit)[len(present) - facet_limit]
+                present = present[counts[present] >= cutoff]
+            labels = self.labels[facet]
+            top = sorted(present.tolist(), key=lambda code: (-counts[code], labels[code]))[:facet_limit]
+            facets[facet] = [
+                {'value': self.values[facet][code], 'label': labels[code], 'count': int(counts[code])}
+                for code in top
+            ]
+
+        end = offset + limit
+        rank = self.rank[matches]
+        if len(matches) > end:
+            keep = np.argpartition(rank, end - 1)[:end]
+            page = matches[keep][np.argsort(rank[keep], kind='stable')]
+        else:
+            page = matches[np.argsort(rank, kind='stable')]
+        return {
+            'count': int(len(matches)),
+            'results': [self.rows[slot] for slot in page[offset:end].tolist()],
+            'facets': facets,
+        }
+
+
+_index = None
+_lock = threading.Lock()
+
+
+def doctor_rows(queryset=None):
+    if queryset is None:
+        return fan_out_queryset(Doctor.objects.values(*DOCTOR_FIELDS))
+    return queryset.values(*DOCTOR_FIELDS).iterator()
+
+
+def get_doctor_index():
+    """
+    The index, rebuilt from the database if the directory changed in another
+    process since it was last brought up to date; caller must hold `_lock`.
+    """
+    global _index
+    version = current_version()
+    if _index is None or not only_own_changes(_index.version, version):
+        _index = DoctorIndex.build(doctor_rows())
+    _index.version = version
+    return _index
+
+
+def search_doctors(q='', filters=None, limit=20, offset=0, facet_limit=20):
+    with _lock:
+        return get_doctor_index().search(q, filters, limit=limit, offset=offset, facet_limit=facet_limit)
+
+
+@on_directory_commit
+def apply_directory_change(sender, pk, deleted, using):
+    if _index is None or pk is None:
+        return
+    if sender is Doctor:
+        queryset = None if deleted else Doctor.objects.using(using).filter(pk=pk)
+    elif deleted:
+        # Cascaded doctor deletions arrive as Doctor changes of their own.
+        return
+    elif sender is HospitalBranch:
+        queryset = Doctor.objects.using(using).filter(branch_id=pk)
+    elif sender is Hospital:
+        # Hospitals are written to 'default'; their doctors are on its shard.
+        queryset = Doctor.objects.using(shard_for_hospital(pk)).filter(branch__hospital_id=pk)
+    else:
+        return
+    with _lock:
+        if _index is None:
+            return
+        # Read under the lock: two commits reading first and applying later
+        # could otherwise land in reverse order and leave the older row.
+        rows = list(doctor_rows(queryset)) if queryset is not None else []
+        if sender is Doctor and not rows:
+            _index.remove(pk)
+        for row in rows:
+            _index.upsert(row)
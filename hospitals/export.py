@@ -0,0 +1,145 @@
+"""
+Streaming export of per-branch operational data.
+
+Rows are read with server-side cursors (`.iterator(chunk_size=...)`) and
+rendered chunk by chunk, so memory use is bounded by CHUNK_SIZE no matter
+how many rows a branch has. Every renderer is a generator of str chunks
+that can feed a StreamingHttpResponse or a file.
+"""
+import csv
+import io
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from appointments.models import Appointment
+from chatbot.models import ChatbotSession, ChatMessage
+
+CHUNK_SIZE = 2000
+
+DATASETS = {
+    'appointments': {
+        'model': Appointment,
+        'branch_field': 'doctor__branch_id',
+        'time_field': 'appointment_time',
+        'columns': (
+            ('id', 'id'),
+            ('patient_universal_id', 'patient__universal_id'),
+            ('doctor_id', 'doctor_id'),
+            ('doctor_name', 'doctor__name'),
+            ('appointment_time', 'appointment_time'),
+            ('end_time', 'end_time'),
+            ('duration', 'duration'),
+            ('status', 'status'),
+            ('reason', 'reason'),
+            ('created_at', 'created_at'),
+        ),
+    },
+    'chat_sessions': {
+        'model': ChatbotSession,
+        'branch_field': 'patient__hospital_branch_id',
+        'time_field': 'created_at',
+        'columns': (
+            ('id', 'id'),
+            ('patient_universal_id', 'patient__universal_id'),
+            ('symptoms', 'symptoms'),
+            ('suggested_drugs', 'suggested_drugs'),
+            ('recommendation', 'recommendation'),
+            ('created_at', 'created_at'),
+        ),
+    },
+    'chat_messages': {
+        'model': ChatMessage,
+        'branch_field': 'session__patient__hospital_branch_id',
+        'time_field': 'timestamp',
+        'columns': (
+            ('id', 'id'),
+            ('session_id', 'session_id'),
+            ('sender', 'sender'),
+            ('message', 'message'),
+            ('timestamp', 'timestamp'),
+        ),
+    },
+}
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'columnar': 'application/x-ndjson',
+}
+
+
+def column_names(dataset):
+    return [name for name, _ in DATASETS[dataset]['columns']]
+
+
+def export_rows(dataset, branch_id, start=None, end=None, chunk_size=CHUNK_SIZE):
+    """Yield value tuples for `dataset` in primary-key order."""
+    spec = DATASETS[dataset]
+    queryset = spec['model'].objects.filter(**{spec['branch_field']: branch_id})
+    if start is not None:
+        queryset = queryset.filter(**{f"{spec['time_field']}__gte": start})
+    if end is not None:
+        queryset = queryset.filter(**{f"{spec['time_field']}__lt": end})
+    lookups = [lookup for _, lookup in spec['columns']]
+    return queryset.order_by('pk').values_list(*lookups).iterator(chunk_size=chunk_size)
+
+
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _to_text(value):
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, cls=DjangoJSONEncoder)
+    return value
+
+
+def render_csv(columns, rows, chunk_size=CHUNK_SIZE):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for batch in _batches(rows, chunk_size):
+        writer.writerows([_to_text(value) for value in row] for row in batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def render_ndjson(columns, rows, chunk_size=CHUNK_SIZE):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for batch in _batches(rows, chunk_size):
+        yield ''.join(encoder.encode(dict(zip(columns, row))) + '\n' for row in batch)
+
+
+def render_columnar(columns, rows, chunk_size=CHUNK_SIZE):
+    """
+    Row-group layout in the spirit of Parquet: a schema line, then one line
+    per row group holding each column as a contiguous array.
+    """
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    yield encoder.encode({'schema': columns, 'row_group_size': chunk_size}) + '\n'
+    for batch in _batches(rows, chunk_size):
+        group = {name: list(values) for name, values in zip(columns, zip(*batch))}
+        yield encoder.encode({'num_rows': len(batch), 'columns': group}) + '\n'
+
+
+RENDERERS = {
+    'csv': render_csv,
+    'ndjson': render_ndjson,
+    'columnar': render_columnar,
+}
+
+
+def stream_export(dataset, output_format, branch_id, start=None, end=None, chunk_size=CHUNK_SIZE):
+    rows = export_rows(dataset, branch_id, start=start, end=end, chunk_size=chunk_size)
+    return RENDERERS[output_format](column_names(dataset), rows, chunk_size=chunk_size)
@@ -0,0 +1,256 @@
+"""
+Nearest-branch search without PostGIS.
+
+Branches with coordinates are bucketed into fixed lat/lng grids held in
+memory: one index for all branches plus one per doctor specialization so
+a filtered search never wades through non-matching branches. A query
+scans a few rings of cells outward from the query point, comparing
+unit-vector dot products for each ring with NumPy, and stops once the k-th
+best distance is closer than anything an unscanned ring could hold.
+Queries far from any branch move on to a coarser grid, and finally to a
+best-first scan of the coarsest cells, ordered by how close each could be.
+
+The index is rebuilt lazily when the shared directory version changes
+(see directory.py), i.e. after any Hospital, HospitalBranch or Doctor
+write.
+"""
+import math
+import threading
+from collections import defaultdict
+
+import numpy as np
+
+from hospital_app.sharding import fan_out_queryset
+from .directory import current_version
+from .models import Doctor, HospitalBranch
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = EARTH_RADIUS_KM * math.pi / 180
+# Cell sizes, finest first: dense areas resolve by ring scans in the 0.1
+# degree grid, sparser ones in the 1 degree grid; anything else falls back
+# to a best-first scan over the (at most 648) cells of the 10 degree grid.
+LEVELS = (0.1, 1.0, 10.0)
+MAX_RINGS = 3
+
+
+def normalize_specialization(value):
+    return ' '.join(value.lower().split())
+
+
+def unit_vectors(lats, lngs):
+    """(n, 3) points on the unit sphere; closeness is then a dot product."""
+    lats, lngs = np.radians(lats), np.radians(lngs)
+    return np.column_stack([np.cos(lats) * np.cos(lngs), np.cos(lats) * np.sin(lngs), np.sin(lats)])
+
+
+def dot_to_km(dots):
+    """Great-circle distance for dot products of unit vectors."""
+    chord = np.sqrt(np.maximum(2.0 - 2.0 * dots, 0.0))
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(chord / 2, 1.0))
+
+
+def km_to_dot(km):
+    return math.cos(min(km / EARTH_RADIUS_KM, math.pi))
+
+
+def distance_km(lat, lng, lats, lngs):
+    return dot_to_km(unit_vectors(lats, lngs) @ unit_vectors([lat], [lng])[0])
+
+
+class Grid:
+    """Points bucketed into `degrees`-sized cells; `cells` maps (row, column) to index arrays."""
+
+    def __init__(self, lats, lngs, vectors, degrees):
+        self.vectors, self.degrees = vectors, degrees
+        self.columns = int(round(360 / degrees))
+        buckets = defaultdict(list)
+        for position, (lat, lng) in enumerate(zip(lats.tolist(), lngs.tolist())):
+            buckets[self.cell_of(lat, lng)].append(position)
+        self.cells = {cell: np.array(positions, dtype=np.int64) for cell, positions in buckets.items()}
+        self._bounds = None
+
+    def cell_bounds(self):
+        """
+        Per non-empty cell: index arrays, centroid unit vectors and the angle
+        from the centroid to the cell's furthest point. Built on first use.
+        """
+        if self._bounds is None:
+            members = list(self.cells.values())
+            centres = np.array([self.vectors[positions].mean(axis=0) for positions in members]).reshape(-1, 3)
+            centres /= np.linalg.norm(centres, axis=1, keepdims=True)
+            radii = np.array([
+                np.arccos(np.clip((self.vectors[positions] @ centre).min(), -1.0, 1.0))
+                for positions, centre in zip(members, centres)
+            ])
+            self._bounds = (members, centres, radii)
+        return self._bounds
+
+    def cell_of(self, lat, lng):
+        return int(math.floor(lat / self.degrees)), int(math.floor(lng / self.degrees))
+
+    def ring(self, row, column, radius):
+        if radius == 0:
+            cells = [(row, column)]
+        else:
+            cells = [(row + dy, column + dx) for dy in (-radius, radius) for dx in range(-radius, radius + 1)]
+            cells += [(row + dy, column + dx) for dx in (-radius, radius) for dy in range(-radius + 1, radius)]
+        # Columns wrap around the antimeridian.
+        half = self.columns // 2
+        found = [self.cells.get((r, (c + half) % self.columns - half)) for r, c in cells]
+        found = [positions for positions in found if positions is not None]
+        return np.concatenate(found) if found else None
+
+    def unscanned_bound(self, lat, radius):
+        """Lower bound (km) on the distance to any point outside rings 0..radius."""
+        # A row step is a fixed distance; a column step shrinks towards the
+        # poles, so use the most poleward latitude the scanned rings reach.
+        poleward = min(89.0, abs(lat) + (radius + 1) * self.degrees)
+        return radius * self.degrees * KM_PER_DEGREE * math.cos(math.radians(poleward))
+
+    def search(self, lat, lng, query, k, max_km=None):
+        """
+        (positions, dots) covering the `k` nearest points to unit vector
+        `query`, or None if MAX_RINGS rings were not enough to be sure.
+        """
+        row, column = self.cell_of(lat, lng)
+        positions, dots = [], []
+        for radius in range(MAX_RINGS + 1):
+            ring = self.ring(row, column, radius)
+            if ring is not None:
+                positions.append(ring)
+                dots.append(self.vectors[ring] @ query)
+            bound = self.unscanned_bound(lat, radius)
+            if max_km is not None and bound >= max_km:
+                break
+            if sum(len(chunk) for chunk in positions) >= k:
+                # k-th largest dot product = k-th nearest point.
+                if -np.partition(-np.concatenate(dots), k - 1)[k - 1] >= km_to_dot(bound):
+                    break
+        else:
+            return None
+        if not positions:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        return np.concatenate(positions), np.concatenate(dots)
+
+    def best_first(self, query, k, max_km=None):
+        """
+        (positions, dots) covering the `k` nearest points, visiting cells in
+        order of the closest any of their points could be.
+        """
+        members, centres, radii = self.cell_bounds()
+        nearest = np.maximum(np.arccos(np.clip(centres @ query, -1.0, 1.0)) - radii, 0.0)
+        limit = math.pi if max_km is None else max_km / EARTH_RADIUS_KM
+        order = np.argsort(nearest)
+        positions, dots, found = [], [], 0
+        for cell in order.tolist():
+            if nearest[cell] > limit:
+                break
+            if found >= k:
+                kth = -np.partition(-np.concatenate(dots), k - 1)[k - 1]
+                if kth >= math.cos(nearest[cell]):
+                    break
+            positions.append(members[cell])
+            dots.append(self.vectors[members[cell]] @ query)
+            found += len(members[cell])
+        if not positions:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        return np.concatenate(positions), np.concatenate(dots)
+
+
+class PointIndex:
+    """k-nearest-neighbour search over fixed points, one Grid per level."""
+
+    def __init__(self, ids, lats, lngs):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        lats, lngs = np.asarray(lats, dtype=float), np.asarray(lngs, dtype=float)
+        self.vectors = unit_vectors(lats, lngs)
+        self.grids = [Grid(lats, lngs, self.vectors, degrees) for degrees in LEVELS]
+
+    def nearest(self, lat, lng, k, max_km=None):
+        """Return [(distance_km, id)] for the `k` closest points, nearest first."""
+        if not len(self.ids):
+            return []
+        query = unit_vectors([lat], [lng])[0]
+        for grid in self.grids[:-1]:
+            found = grid.search(lat, lng, query, k, max_km=max_km)
+            if found is not None:
+                positions, dots = found
+                break
+        else:
+            positions, dots = self.grids[-1].best_first(query, k, max_km=max_km)
+        if max_km is not None:
+            keep = dots >= km_to_dot(max_km)
+            positions, dots = positions[keep], dots[keep]
+        if len(dots) > k:
+            top = np.argpartition(-dots, k - 1)[:k]
+            positions, dots = positions[top], dots[top]
+        order = np.argsort(-dots, kind='stable')
+        distances = dot_to_km(dots[order])
+        return [(float(distance), int(self.ids[positions[i]])) for distance, i in zip(distances, order)]
+
+
+class BranchIndex:
+    def __init__(self, branches, specializations):
+        """
+        `branches` maps id to a dict with at least latitude/longitude;
+        `specializations` maps normalized specialization to branch ids.
+        """
+        self.branches = branches
+
+        def index(ids):
+            ids = sorted(ids)
+            return PointIndex(ids, [branches[i]['latitude'] for i in ids], [branches[i]['longitude'] for i in ids])
+
+        self.all = index(branches)
+        self.by_specialization = {name: index(ids) for name, ids in specializations.items()}
+
+    @classmethod
+    def build(cls):
+        branches = {
+            row['id']: row
+            for row in fan_out_queryset(
+                HospitalBranch.objects.filter(latitude__isnull=False, longitude__isnull=False).values(
+                    'id', 'name', 'hospital_id', 'hospital__name', 'address', 'city', 'state', 'phone',
+                    'latitude', 'longitude',
+                )
+            )
+        }
+        specializations = defaultdict(set)
+        for branch_id, specialization in fan_out_queryset(
+            Doctor.objects.filter(branch__latitude__isnull=False, branch__longitude__isnull=False)
+            .values_list('branch_id', 'specialization').distinct()
+        ):
+            specializations[normalize_specialization(specialization)].add(branch_id)
+        return cls(branches, specializations)
+
+    def nearest(self, lat, lng, k=5, specialization=None, max_km=None):
+        points = self.all
+        if specialization:
+            points = self.by_specialization.get(normalize_specialization(specialization))
+            if points is None:
+                return []
+        return [
+            {**self.branches[branch_id], 'distance_km': round(distance, 3)}
+            for distance, branch_id in points.nearest(lat, lng, k, max_km=max_km)
+        ]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_branch_index():
+    """The index for the current directory version, rebuilding it if stale."""
+    global _index
+    version = current_version()
+    index = _index
+    if index is None or index[0] != version:
+        with _index_lock:
+            if _index is None or _index[0] != version:
+                _index = (version, BranchIndex.build())
+            index = _index
+    return index[1]
+
+
+def nearest_branches(lat, lng, k=5, specialization=None, max_km=None):
+    return get_branch_index().nearest(lat, lng, k=k, specialization=specialization, max_km=max_km)
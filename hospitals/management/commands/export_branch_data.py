@@ -0,0 +1,50 @@
+from datetime import datetime, time, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from hospital_app.sharding import activate_branch
+from hospitals.export import CHUNK_SIZE, DATASETS, FORMATS, stream_export
+from hospitals.models import HospitalBranch
+
+
+class Command(BaseCommand):
+    help = "Stream a branch's appointments or chat data to a file (or stdout) with constant memory."
+
+    def add_arguments(self, parser):
+        parser.add_argument('branch_id', type=int)
+        parser.add_argument('--dataset', choices=sorted(DATASETS), default='appointments')
+        parser.add_argument('--format', dest='output_format', choices=sorted(FORMATS), default='csv')
+        parser.add_argument('--start', help="First day to include (YYYY-MM-DD)")
+        parser.add_argument('--end', help="Last day to include (YYYY-MM-DD)")
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+        parser.add_argument('--output', '-o', help="Destination file; defaults to stdout")
+
+    def handle(self, *args, **options):
+        activate_branch(options['branch_id'])
+        if not HospitalBranch.objects.filter(pk=options['branch_id']).exists():
+            raise CommandError(f"Branch {options['branch_id']} does not exist.")
+        start = self._day(options['start'])
+        end = self._day(options['end'], offset=1)
+
+        chunks = stream_export(
+            options['dataset'], options['output_format'], options['branch_id'],
+            start=start, end=end, chunk_size=options['chunk_size'],
+        )
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as handle:
+                for chunk in chunks:
+                    handle.write(chunk)
+            self.stderr.write(f"Wrote {options['output']}")
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+
+    def _day(self, value, offset=0):
+        if not value:
+            return None
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f"Invalid date: {value}")
+        return timezone.make_aware(datetime.combine(day + timedelta(days=offset), time.min))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from hospitals.models import Hospital
+from hospitals.rebalance import CHUNK_SIZE, RebalanceError, move_hospital
+
+
+class Command(BaseCommand):
+    help = (
+        "Move a hospital's branches, doctors, patients, appointments and chat sessions to another "
+        "database shard. The hospital stays readable throughout and read-only only for the final sync."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('hospital_id', type=int)
+        parser.add_argument('shard', help="Target alias from settings.DATABASE_SHARDS")
+        parser.add_argument('--grace', type=float, default=5.0,
+                            help="Seconds to wait for in-flight writes after going read-only")
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        if not Hospital.objects.filter(pk=options['hospital_id']).exists():
+            raise CommandError(f"Hospital {options['hospital_id']} does not exist.")
+        try:
+            copied = move_hospital(
+                options['hospital_id'], options['shard'], grace=options['grace'],
+                chunk_size=options['chunk_size'], log=self.stderr.write,
+            )
+        except RebalanceError as exc:
+            raise CommandError(str(exc)) from exc
+        self.stdout.write(self.style.SUCCESS(
+            f"Moved {sum(copied.values())} rows to {options['shard']}. "
+            f"Run find_duplicate_patients --full --shard {options['shard']} to re-pair the moved patients."
+        ))
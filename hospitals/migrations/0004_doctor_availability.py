@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospitals', '0003_hospital_logo_hospital_website_hospitalbranch_email_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='doctor',
+            name='available_times',
+            field=models.TextField(blank=True, help_text='Legacy free-text slots, e.g. \'["Mon 9-11am","Tue 2-4pm"]\'. Scheduling uses DoctorAvailability instead.'),
+        ),
+        migrations.CreateModel(
+            name='DoctorAvailability',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weekday', models.PositiveSmallIntegerField(choices=[(0, 'Monday'), (1, 'Tuesday'), (2, 'Wednesday'), (3, 'Thursday'), (4, 'Friday'), (5, 'Saturday'), (6, 'Sunday')])),
+                ('start_time', models.TimeField()),
+                ('end_time', models.TimeField()),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='availability', to='hospitals.doctor')),
+            ],
+            options={
+                'ordering': ('doctor', 'weekday', 'start_time'),
+                'indexes': [models.Index(fields=['doctor', 'weekday'], name='hospitals_d_doctor__ea2c1d_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DoctorAvailabilityException',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('start_time', models.TimeField(blank=True, null=True)),
+                ('end_time', models.TimeField(blank=True, null=True)),
+                ('is_available', models.BooleanField(default=False)),
+                ('reason', models.CharField(blank=True, max_length=255)),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='availability_exceptions', to='hospitals.doctor')),
+            ],
+            options={
+                'ordering': ('doctor', 'date', 'start_time'),
+                'indexes': [models.Index(fields=['doctor', 'date'], name='hospitals_d_doctor__0ae368_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,85 @@
+import datetime
+import json
+import re
+
+from django.db import migrations
+
+WEEKDAYS = {'mon': 0, 'tue': 1, 'wed': 2, 'thu': 3, 'fri': 4, 'sat': 5, 'sun': 6}
+
+SLOT_RE = re.compile(
+    r'^(?P<day>mon|tue|wed|thu|fri|sat|sun)[a-z]*\.?\s+'
+    r'(?P<sh>\d{1,2})(?::(?P<sm>\d{2}))?\s*(?P<smer>am|pm)?\s*-\s*'
+    r'(?P<eh>\d{1,2})(?::(?P<em>\d{2}))?\s*(?P<emer>am|pm)?$'
+)
+
+
+def _to_minutes(hour, minute, meridiem):
+    if meridiem == 'pm' and hour < 12:
+        hour += 12
+    elif meridiem == 'am' and hour == 12:
+        hour = 0
+    return hour * 60 + minute
+
+
+def parse_legacy_slot(text):
+    """Parse strings such as 'Mon 9-11am' or 'Tue 2:30pm-4pm'; returns None if unparseable."""
+    match = SLOT_RE.match(text.strip().lower())
+    if not match:
+        return None
+    sh, eh = int(match['sh']), int(match['eh'])
+    sm, em = int(match['sm'] or 0), int(match['em'] or 0)
+    end_mer = match['emer']
+    start_mer = match['smer'] or end_mer
+    end = _to_minutes(eh, em, end_mer)
+    if end == 0 and end_mer == 'am':
+        # '10-12am' is almost always meant as ending at noon.
+        end = 12 * 60
+    start = _to_minutes(sh, sm, start_mer)
+    if start >= end and not match['smer']:
+        start = _to_minutes(sh, sm, 'am')
+    if not 0 <= start < end <= 24 * 60:
+        return None
+    to_time = lambda minutes: datetime.time(minutes // 60, minutes % 60) if minutes < 24 * 60 else datetime.time(0)
+    return WEEKDAYS[match['day']], to_time(start), to_time(end)
+
+
+def split_legacy_slots(value):
+    value = (value or '').strip()
+    if not value:
+        return []
+    try:
+        parsed = json.loads(value)
+    except ValueError:
+        parsed = None
+    if isinstance(parsed, str):
+        parsed = [parsed]
+    elif not isinstance(parsed, list):
+        # Plain text, or a JSON scalar such as 5.
+        parsed = value.split(',')
+    return [str(item) for item in parsed if str(item).strip()]
+
+
+def backfill_availability(apps, schema_editor):
+    Doctor = apps.get_model('hospitals', 'Doctor')
+    DoctorAvailability = apps.get_model('hospitals', 'DoctorAvailability')
+    rows = []
+    for doctor in Doctor.objects.exclude(available_times='').iterator():
+        for text in split_legacy_slots(doctor.available_times):
+            slot = parse_legacy_slot(text)
+            if slot:
+                weekday, start_time, end_time = slot
+                rows.append(DoctorAvailability(
+                    doctor=doctor, weekday=weekday, start_time=start_time, end_time=end_time
+                ))
+    DoctorAvailability.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospitals', '0004_doctor_availability'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_availability, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospitals', '0007_branch_coordinates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HospitalShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('alias', models.CharField(default='default', max_length=64)),
+                ('read_only', models.BooleanField(default=False)),
+                ('moved_at', models.DateTimeField(blank=True, null=True)),
+                ('hospital', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='shard', to='hospitals.hospital')),
+            ],
+        ),
+    ]
@@ -1,3 +1,5 @@
+from django.conf import settings
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 
 class Hospital(models.Model):
@@ -23,6 +25,8 @@ class HospitalBranch(models.Model):
     city     = models.CharField(max_length=100)
     state    = models.CharField(max_length=100)
     manager  = models.CharField(max_length=255, blank=True)
+    latitude  = models.FloatField(null=True, blank=True, validators=[MinValueValidator(-90), MaxValueValidator(90)])
+    longitude = models.FloatField(null=True, blank=True, validators=[MinValueValidator(-180), MaxValueValidator(180)])
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -34,10 +38,15 @@ class HospitalBranch(models.Model):
 
 class Doctor(models.Model):
     branch         = models.ForeignKey(HospitalBranch, on_delete=models.CASCADE, related_name='doctors')
+    user           = models.OneToOneField(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='doctor'
+    )
     name           = models.CharField(max_length=255)
     specialization = models.CharField(max_length=255)
     available_times = models.TextField(
-        help_text="JSON or comma-separated slots, e.g. '[\"Mon 9-11am\",\"Tue 2-4pm\"]'"
+        blank=True,
+        help_text="Legacy free-text slots, e.g. '[\"Mon 9-11am\",\"Tue 2-4pm\"]'. "
+                  "Scheduling uses DoctorAvailability instead."
     )
     contact_info   = models.CharField(max_length=255, blank=True)
     created_at     = models.DateTimeField(auto_now_add=True)
@@ -45,3 +54,64 @@ class Doctor(models.Model):
     def __str__(self):
         return f"Dr. {self.name} ({self.specialization})"
 
+
+class DoctorAvailability(models.Model):
+    """Recurring weekly working interval for a doctor (local wall-clock time)."""
+    WEEKDAY_CHOICES = [
+        (0, 'Monday'),
+        (1, 'Tuesday'),
+        (2, 'Wednesday'),
+        (3, 'Thursday'),
+        (4, 'Friday'),
+        (5, 'Saturday'),
+        (6, 'Sunday'),
+    ]
+
+    doctor     = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='availability')
+    weekday    = models.PositiveSmallIntegerField(choices=WEEKDAY_CHOICES)
+    start_time = models.TimeField()
+    end_time   = models.TimeField()
+
+    class Meta:
+        ordering = ('doctor', 'weekday', 'start_time')
+        indexes = [models.Index(fields=['doctor', 'weekday'])]
+
+    def __str__(self):
+        return f"{self.doctor.name}: {self.get_weekday_display()} {self.start_time}-{self.end_time}"
+
+
+class DoctorAvailabilityException(models.Model):
+    """
+    One-off change to a doctor's weekly availability on a given date.
+    Without times the exception covers the whole day; `is_available`
+    distinguishes extra hours from time off.
+    """
+    doctor       = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='availability_exceptions')
+    date         = models.DateField()
+    start_time   = models.TimeField(null=True, blank=True)
+    end_time     = models.TimeField(null=True, blank=True)
+    is_available = models.BooleanField(default=False)
+    reason       = models.CharField(max_length=255, blank=True)
+
+    class Meta:
+        ordering = ('doctor', 'date', 'start_time')
+        indexes = [models.Index(fields=['doctor', 'date'])]
+
+    def __str__(self):
+        kind = 'extra hours' if self.is_available else 'time off'
+        return f"{self.doctor.name}: {kind} on {self.date}"
+
+
+class HospitalShard(models.Model):
+    """
+    Database alias (from settings.DATABASE_SHARDS) holding a hospital's
+    tenant data; hospitals without a row live on 'default'. `read_only`
+    is set while the hospital is being moved (see hospitals/rebalance.py).
+    """
+    hospital  = models.OneToOneField(Hospital, on_delete=models.CASCADE, related_name='shard')
+    alias     = models.CharField(max_length=64, default='default')
+    read_only = models.BooleanField(default=False)
+    moved_at  = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.hospital.name} -> {self.alias}"
@@ -0,0 +1,216 @@
+"""
+Moving a hospital to another database shard while it stays online.
+
+1. The hospital's tenant rows are bulk-copied to the target shard in
+   foreign-key order, chunk by chunk, while reads and writes carry on
+   against the source.
+2. The hospital is marked read-only (writes get 503 + Retry-After) and
+   we wait `grace` seconds for in-flight requests to finish.
+3. Rows that changed during the copy are synced in two passes: parents
+   first, each chunk of source rows is compared with the target's and
+   differences are rewritten; then children first, target rows that no
+   longer exist on the source are deleted.
+4. HospitalShard is switched to the target, which every process picks
+   up on its next request, and the source rows are deleted.
+
+Rows keep their ids: each shard allocates ids from its own range (see
+hospital_app.sharding.reserve_id_ranges), so they cannot collide. On
+SQLite, AUTOINCREMENT follows the largest id in the table, so copying
+rows into a shard earlier in DATABASE_SHARDS would move its counter into
+the source's range; such moves are refused there.
+
+A hospital whose appointments or waitlist entries involve patients or
+doctors of another hospital (or branch-less patients) cannot be moved
+without splitting them, and is refused. Duplicate-patient candidates for
+the moved patients are dropped; rerun find_duplicate_patients --full.
+"""
+import time
+
+from django.apps import apps
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from hospital_app.sharding import (
+    concrete_columns, delete_rows, shard_aliases, shard_for_hospital, shard_map_changed, write_rows,
+)
+from .directory import bump_version
+from .models import HospitalShard
+
+# (model, lookup from the model to its hospital id), parents before children.
+PLAN = (
+    ('hospitals.HospitalBranch', 'hospital_id'),
+    ('hospitals.Doctor', 'branch__hospital_id'),
+    ('hospitals.DoctorAvailability', 'doctor__branch__hospital_id'),
+    ('hospitals.DoctorAvailabilityException', 'doctor__branch__hospital_id'),
+    ('patients.Patient', 'hospital_branch__hospital_id'),
+    ('patients.MedicalHistoryEntry', 'patient__hospital_branch__hospital_id'),
+    ('patients.PatientBlockingKey', 'patient__hospital_branch__hospital_id'),
+    ('appointments.Appointment', 'doctor__branch__hospital_id'),
+    ('appointments.AppointmentChange', 'patient__hospital_branch__hospital_id'),
+    ('appointments.AppointmentReminder', 'appointment__doctor__branch__hospital_id'),
+    ('appointments.WaitlistEntry', 'doctor__branch__hospital_id'),
+    ('appointments.DoctorDailyUtilization', 'branch__hospital_id'),
+    ('chatbot.ChatbotSession', 'patient__hospital_branch__hospital_id'),
+    ('chatbot.ChatMessage', 'session__patient__hospital_branch__hospital_id'),
+)
+# Columns each shard fills in itself on insert, so they never match the source.
+SHARD_ASSIGNED = {'appointments.AppointmentChange': ('txid',)}
+# Rows tying two hospitals together: (model, owner lookup, other lookup).
+CROSS_CHECKS = (
+    ('appointments.Appointment', 'doctor__branch__hospital_id', 'patient__hospital_branch__hospital_id'),
+    ('appointments.WaitlistEntry', 'doctor__branch__hospital_id', 'patient__hospital_branch__hospital_id'),
+    ('appointments.DoctorDailyUtilization', 'branch__hospital_id', 'doctor__branch__hospital_id'),
+)
+CHUNK_SIZE = 1000
+
+
+class RebalanceError(Exception):
+    """The hospital cannot be moved as requested."""
+
+
+def plan():
+    return [(apps.get_model(label), lookup) for label, lookup in PLAN]
+
+
+def owned(model, lookup, hospital_id, using):
+    return model._base_manager.using(using).filter(**{lookup: hospital_id}).order_by('pk')
+
+
+def cross_references(hospital_id, using):
+    """{model label: rows linking the hospital to another one} on `using`."""
+    found = {}
+    for label, owner, other in CROSS_CHECKS:
+        model = apps.get_model(label)
+        mine, theirs = Q(**{owner: hospital_id}), Q(**{other: hospital_id})
+        count = model._base_manager.using(using).filter((mine & ~theirs) | (~mine & theirs)).count()
+        if count:
+            found[label] = count
+    return found
+
+
+def copy_rows(model, lookup, hospital_id, source, target, chunk_size=CHUNK_SIZE):
+    """Bulk-copy the hospital's `model` rows; returns the number copied."""
+    queryset = owned(model, lookup, hospital_id, source).values_list(*concrete_columns(model))
+    copied = last = 0
+    while True:
+        rows = list(queryset.filter(pk__gt=last)[:chunk_size])
+        if not rows:
+            return copied
+        with transaction.atomic(using=target):
+            write_rows(model, rows, target)
+        copied += len(rows)
+        last = rows[-1][0]
+
+
+def sync_rows(model, lookup, hospital_id, source, target, chunk_size=CHUNK_SIZE):
+    """
+    Rewrite the target's copies of the hospital's `model` rows that differ
+    from the source; call inside transaction.atomic(using=target). Returns
+    the number of rows written.
+    """
+    columns = concrete_columns(model)
+    assigned = SHARD_ASSIGNED.get(model._meta.label, ())
+    compared = [position for position, column in enumerate(columns) if column not in assigned]
+    source_rows = owned(model, lookup, hospital_id, source).values_list(*columns)
+    written = last = 0
+    while True:
+        rows = list(source_rows.filter(pk__gt=last)[:chunk_size])
+        if not rows:
+            return written
+        existing = model._base_manager.using(target).filter(pk__in=[row[0] for row in rows]).values_list(*columns)
+        existing = {row[0]: [row[position] for position in compared] for row in existing}
+        changed = [row for row in rows if existing.get(row[0]) != [row[position] for position in compared]]
+        write_rows(model, changed, target)
+        written += len(changed)
+        last = rows[-1][0]
+
+
+def prune_rows(model, lookup, hospital_id, source, target, chunk_size=CHUNK_SIZE):
+    """
+    Delete the target's copies of the hospital's `model` rows that no longer
+    exist on the source. Run children before parents: target rows are found
+    through their parents' joins, which must still be there. Returns the
+    number of rows deleted.
+    """
+    target_pks = owned(model, lookup, hospital_id, target).values_list('pk', flat=True)
+    deleted = last = 0
+    while True:
+        chunk = list(target_pks.filter(pk__gt=last)[:chunk_size])
+        if not chunk:
+            return deleted
+        kept = set(owned(model, lookup, hospital_id, source).filter(pk__in=chunk).values_list('pk', flat=True))
+        gone = [pk for pk in chunk if pk not in kept]
+        delete_rows(model, gone, target)
+        deleted += len(gone)
+        last = chunk[-1]
+
+
+def remove_rows(hospital_id, using, chunk_size=CHUNK_SIZE):
+    """Delete the hospital's tenant rows from `using` without signals, children first."""
+    Patient = apps.get_model('patients', 'Patient')
+    DuplicateCandidate = apps.get_model('patients', 'DuplicateCandidate')
+    patients = Patient.objects.using(using).filter(hospital_branch__hospital_id=hospital_id).values('pk')
+    with transaction.atomic(using=using):
+        delete_rows(DuplicateCandidate, DuplicateCandidate.objects.using(using).filter(
+            Q(patient_a__in=patients) | Q(patient_b__in=patients)
+        ).values_list('pk', flat=True), using)
+        for model, lookup in reversed(plan()):
+            pks = owned(model, lookup, hospital_id, using).values_list('pk', flat=True)
+            while True:
+                chunk = list(pks[:chunk_size])
+                if not chunk:
+                    break
+                delete_rows(model, chunk, using)
+
+
+def _set_placement(hospital_id, **fields):
+    HospitalShard.objects.using('default').update_or_create(hospital_id=hospital_id, defaults=fields)
+    shard_map_changed()
+
+
+def move_hospital(hospital_id, target, grace=5.0, chunk_size=CHUNK_SIZE, log=None):
+    """Move a hospital's tenant data to shard `target`; returns {model label: rows copied}."""
+    log = log or (lambda message: None)
+    aliases = shard_aliases()
+    if target not in aliases:
+        raise RebalanceError(f"Unknown shard {target!r}; expected one of {aliases}.")
+    source = shard_for_hospital(hospital_id)
+    if source == target:
+        raise RebalanceError(f"Hospital {hospital_id} is already on {target!r}.")
+    if connections[target].vendor == 'sqlite' and aliases.index(target) < aliases.index(source):
+        raise RebalanceError("On SQLite a hospital can only move to a shard later in DATABASE_SHARDS.")
+    crossing = cross_references(hospital_id, source)
+    if crossing:
+        raise RebalanceError(f"Hospital {hospital_id} shares rows with other hospitals: {crossing}.")
+
+    copied = {}
+    try:
+        for model, lookup in plan():
+            copied[model._meta.label] = copy_rows(model, lookup, hospital_id, source, target, chunk_size)
+            log(f"Copied {copied[model._meta.label]} {model._meta.label} rows.")
+
+        _set_placement(hospital_id, alias=source, read_only=True)
+        log(f"Hospital {hospital_id} is read-only; waiting {grace}s for in-flight writes.")
+        time.sleep(grace)
+
+        with transaction.atomic(using=target):
+            # Copied change rows keep their ids; arrival forces a full resync.
+            for model, lookup in plan():
+                written = sync_rows(model, lookup, hospital_id, source, target, chunk_size)
+                if written:
+                    log(f"Synced {model._meta.label}: {written} written.")
+            for model, lookup in reversed(plan()):
+                deleted = prune_rows(model, lookup, hospital_id, source, target, chunk_size)
+                if deleted:
+                    log(f"Synced {model._meta.label}: {deleted} deleted.")
+    except BaseException:
+        remove_rows(hospital_id, target, chunk_size)
+        _set_placement(hospital_id, alias=source, read_only=False)
+        raise
+
+    _set_placement(hospital_id, alias=target, read_only=False, moved_at=timezone.now())
+    bump_version()
+    remove_rows(hospital_id, source, chunk_size)
+    log(f"Hospital {hospital_id} moved from {source!r} to {target!r}.")
+    return copied
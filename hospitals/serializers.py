@@ -0,0 +1,93 @@
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+from rest_framework import serializers
+
+from .export import DATASETS, FORMATS
+from .models import Doctor, Hospital, HospitalBranch
+
+
+class ExportQuerySerializer(serializers.Serializer):
+    dataset = serializers.ChoiceField(choices=sorted(DATASETS))
+    output  = serializers.ChoiceField(choices=sorted(FORMATS), default='csv')
+    start   = serializers.DateField(required=False)
+    end     = serializers.DateField(required=False, help_text="Inclusive")
+
+    def validate(self, data):
+        if data.get('start') and data.get('end') and data['end'] < data['start']:
+            raise serializers.ValidationError("End date must not be before start date.")
+        if data.get('start'):
+            data['start'] = timezone.make_aware(datetime.combine(data['start'], time.min))
+        if data.get('end'):
+            data['end'] = timezone.make_aware(datetime.combine(data['end'] + timedelta(days=1), time.min))
+        return data
+
+
+class DirectoryDoctorSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Doctor
+        fields = ['id', 'name', 'specialization', 'contact_info']
+
+
+class DirectoryBranchSerializer(serializers.ModelSerializer):
+    doctors = DirectoryDoctorSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = HospitalBranch
+        fields = [
+            'id', 'name', 'address', 'phone', 'email', 'city', 'state', 'manager', 'latitude', 'longitude', 'doctors',
+        ]
+
+
+class DirectoryHospitalSerializer(serializers.ModelSerializer):
+    branches = DirectoryBranchSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Hospital
+        fields = ['id', 'name', 'email', 'address', 'phone', 'website', 'logo', 'is_verified', 'branches']
+
+
+class NearestBranchQuerySerializer(serializers.Serializer):
+    lat            = serializers.FloatField(min_value=-90, max_value=90)
+    lng            = serializers.FloatField(min_value=-180, max_value=180)
+    k              = serializers.IntegerField(min_value=1, max_value=50, default=5)
+    specialization = serializers.CharField(required=False, max_length=255)
+    max_km         = serializers.FloatField(required=False, min_value=0.1, max_value=20000)
+
+
+class NearestBranchSerializer(serializers.Serializer):
+    id            = serializers.IntegerField()
+    name          = serializers.CharField()
+    hospital      = serializers.IntegerField(source='hospital_id')
+    hospital_name = serializers.CharField(source='hospital__name')
+    address       = serializers.CharField()
+    city          = serializers.CharField()
+    state         = serializers.CharField()
+    phone         = serializers.CharField()
+    latitude      = serializers.FloatField()
+    longitude     = serializers.FloatField()
+    distance_km   = serializers.FloatField()
+
+
+class DoctorSearchQuerySerializer(serializers.Serializer):
+    q              = serializers.CharField(required=False, allow_blank=True, max_length=100, default='')
+    specialization = serializers.CharField(required=False, max_length=255)
+    city           = serializers.CharField(required=False, max_length=100)
+    state          = serializers.CharField(required=False, max_length=100)
+    hospital       = serializers.IntegerField(required=False)
+    limit          = serializers.IntegerField(min_value=1, max_value=50, default=20)
+    offset         = serializers.IntegerField(min_value=0, max_value=500, default=0)
+    facet_limit    = serializers.IntegerField(min_value=0, max_value=100, default=20)
+
+
+class DoctorSearchResultSerializer(serializers.Serializer):
+    id             = serializers.IntegerField()
+    name           = serializers.CharField()
+    specialization = serializers.CharField()
+    contact_info   = serializers.CharField()
+    branch         = serializers.IntegerField(source='branch_id')
+    branch_name    = serializers.CharField(source='branch__name')
+    city           = serializers.CharField(source='branch__city')
+    state          = serializers.CharField(source='branch__state')
+    hospital       = serializers.IntegerField(source='branch__hospital_id')
+    hospital_name  = serializers.CharField(source='branch__hospital__name')
@@ -0,0 +1,38 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from authentication.backends import invalidate_user
+from hospital_app.sharding import mirror_reference
+from .directory import directory_changed
+from .models import Doctor, Hospital, HospitalBranch
+
+
+@receiver(post_save, sender=Doctor)
+@receiver(post_delete, sender=Doctor)
+def invalidate_doctor_user(sender, instance, **kwargs):
+    if instance.user_id:
+        invalidate_user(instance.user_id)
+
+
+@receiver(post_save, sender=Hospital)
+@receiver(post_save, sender=HospitalBranch)
+@receiver(post_save, sender=Doctor)
+def directory_saved(sender, instance, using, **kwargs):
+    directory_changed(sender, instance, using=using)
+
+
+@receiver(post_delete, sender=Hospital)
+@receiver(post_delete, sender=HospitalBranch)
+@receiver(post_delete, sender=Doctor)
+def directory_deleted(sender, instance, using, **kwargs):
+    directory_changed(sender, instance, deleted=True, using=using)
+
+
+@receiver(post_save, sender=Hospital)
+def mirror_hospital(sender, instance, using, **kwargs):
+    mirror_reference(instance, using)
+
+
+@receiver(post_delete, sender=Hospital)
+def unmirror_hospital(sender, instance, using, **kwargs):
+    mirror_reference(instance, using)
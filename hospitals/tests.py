@@ -1,5 +1,21 @@
-from django.test import TestCase
-from .models import Hospital, HospitalBranch, Doctor
+import csv
+import io
+import json
+from datetime import time, timedelta
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from appointments.models import Appointment
+from authentication.models import User
+from chatbot.models import ChatbotSession, ChatMessage
+from patients.models import Patient
+from .models import Hospital, HospitalBranch, HospitalShard, Doctor, DoctorAvailability
 
 class HospitalModelTests(TestCase):
     def setUp(self):
@@ -74,3 +90,356 @@ class HospitalModelTests(TestCase):
         Doctor.objects.create(branch=self.branch, name='Dr. Jane', specialization='Pediatrics', available_times='["Tue 10-12am"]')
         cardiologists = Doctor.objects.filter(specialization='Cardiology')
         self.assertIn(self.doctor, cardiologists)
+
+
+class BranchExportTests(APITestCase):
+    def setUp(self):
+        self.hospital = Hospital.objects.create(name='Export Hospital', email='export@example.com', address='1 St', phone='1234567890')
+        self.branch = HospitalBranch.objects.create(hospital=self.hospital, name='Export Branch', address='1 St', phone='1234567890', city='City', state='State')
+        self.doctor = Doctor.objects.create(branch=self.branch, name='Dr. Export', specialization='General')
+        user = User.objects.create_user(email='export-patient@example.com', password='testpass123', full_name='Export Patient')
+        self.patient = Patient.objects.get(user=user)
+        self.patient.hospital_branch = self.branch
+        self.patient.save()
+        start = timezone.now() + timedelta(days=1)
+        for i in range(5):
+            Appointment.objects.create(patient=self.patient, doctor=self.doctor, appointment_time=start + timedelta(hours=i))
+        session = ChatbotSession.objects.create(patient=self.patient, symptoms='cough', suggested_drugs=['Syrup'])
+        ChatMessage.objects.create(session=session, sender='PATIENT', message='I cough')
+        self.admin = User.objects.create_user(email='export-admin@example.com', password='testpass123', full_name='Admin', role='ADMIN')
+        self.client.force_authenticate(user=self.admin)
+        self.url = reverse('branch-export', args=[self.branch.id])
+
+    def test_streams_appointments_as_csv(self):
+        response = self.client.get(self.url, {'dataset': 'appointments', 'output': 'csv'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(rows[0][:2], ['id', 'patient_universal_id'])
+        self.assertEqual(len(rows), 6)
+
+    def test_streams_chat_sessions_as_ndjson(self):
+        response = self.client.get(self.url, {'dataset': 'chat_sessions', 'output': 'ndjson'})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(json.loads(lines[0])['suggested_drugs'], ['Syrup'])
+
+    def test_command_writes_columnar_row_groups(self):
+        out = io.StringIO()
+        call_command('export_branch_data', self.branch.id, '--format', 'columnar', '--chunk-size', '2', stdout=out)
+        lines = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(lines[0]['schema'][0], 'id')
+        self.assertEqual([line['num_rows'] for line in lines[1:]], [2, 2, 1])
+
+    def test_requires_admin(self):
+        self.client.force_authenticate(user=self.patient.user)
+        response = self.client.get(self.url, {'dataset': 'appointments'})
+        self.assertEqual(response.status_code, 403)
+
+
+class HospitalDirectoryTests(APITestCase):
+    def setUp(self):
+        from .directory import directory_cache
+        directory_cache.clear()
+        self.hospital = Hospital.objects.create(name='City Hospital', email='city@example.com', address='1 St', phone='1')
+        self.branch = HospitalBranch.objects.create(hospital=self.hospital, name='Central', address='1 St', phone='1', city='City', state='State')
+        self.doctor = Doctor.objects.create(branch=self.branch, name='Ada', specialization='Cardiology')
+        Hospital.objects.create(name='Another Hospital', email='another@example.com', address='2 St', phone='2')
+
+    def test_nested_directory_served_from_cache(self):
+        response = self.client.get(reverse('hospital-directory'))
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual([hospital['name'] for hospital in data], ['Another Hospital', 'City Hospital'])
+        self.assertEqual(data[1]['branches'][0]['doctors'][0]['specialization'], 'Cardiology')
+        with self.assertNumQueries(0):
+            warm = self.client.get(reverse('hospital-directory'))
+        self.assertEqual(warm.content, response.content)
+        self.assertEqual(warm['ETag'], response['ETag'])
+
+    def test_etag_revalidation_and_invalidation_on_write(self):
+        url = reverse('hospital-directory-detail', args=[self.hospital.id])
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.doctor.specialization = 'Neurology'
+        self.doctor.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['branches'][0]['doctors'][0]['specialization'], 'Neurology')
+
+    def test_unknown_hospital(self):
+        response = self.client.get(reverse('hospital-directory-detail', args=[999999]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_deploy_check_rejects_per_process_caches(self):
+        from hospital_app.checks import check_shared_caches
+        errors = check_shared_caches(None)
+        self.assertIn('HOSPITAL_DIRECTORY_CACHE', [error.msg.split()[0] for error in errors])
+        redis = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://cache:6379/1'}}
+        with override_settings(CACHES=redis):
+            self.assertEqual(check_shared_caches(None), [])
+
+
+class NearestBranchTests(APITestCase):
+    def setUp(self):
+        hospital = Hospital.objects.create(name='Geo Hospital', email='geo@example.com', address='1 St', phone='1')
+        self.branches = {}
+        for name, lat, lng in [
+            ('Downtown', 40.7128, -74.0060),
+            ('Brooklyn', 40.6782, -73.9442),
+            ('Newark', 40.7357, -74.1724),
+            ('Boston', 42.3601, -71.0589),
+            ('Fiji', -17.7134, 179.9),
+            ('Unmapped', None, None),
+        ]:
+            self.branches[name] = HospitalBranch.objects.create(
+                hospital=hospital, name=name, address='1 St', phone='1', city='City', state='State',
+                latitude=lat, longitude=lng,
+            )
+        Doctor.objects.create(branch=self.branches['Newark'], name='Pia', specialization='Pediatrics')
+        Doctor.objects.create(branch=self.branches['Boston'], name='Ped', specialization=' pediatrics ')
+        Doctor.objects.create(branch=self.branches['Unmapped'], name='Pat', specialization='Pediatrics')
+
+    def _nearest(self, **params):
+        response = self.client.get(reverse('nearest-branches'), params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data['results']
+
+    def test_nearest_branches_in_distance_order(self):
+        results = self._nearest(lat=40.7306, lng=-73.9866, k=3)
+        self.assertEqual([result['name'] for result in results], ['Downtown', 'Brooklyn', 'Newark'])
+        self.assertAlmostEqual(results[0]['distance_km'], 2.57, delta=0.05)
+        self.assertEqual(results[0]['hospital_name'], 'Geo Hospital')
+
+    def test_specialization_filter_and_radius(self):
+        results = self._nearest(lat=40.7306, lng=-73.9866, specialization='PEDIATRICS')
+        self.assertEqual([result['name'] for result in results], ['Newark', 'Boston'])
+        results = self._nearest(lat=40.7306, lng=-73.9866, specialization='pediatrics', max_km=50)
+        self.assertEqual([result['name'] for result in results], ['Newark'])
+        self.assertEqual(self._nearest(lat=40.7, lng=-74.0, specialization='Dermatology'), [])
+
+    def test_search_wraps_antimeridian_and_tracks_writes(self):
+        self.assertEqual(self._nearest(lat=-17.7, lng=-179.95, k=1)[0]['name'], 'Fiji')
+        with self.assertNumQueries(0):
+            self._nearest(lat=-17.7, lng=-179.95, k=1)
+        branch = self.branches['Unmapped']
+        branch.latitude, branch.longitude = -17.7, -179.9
+        branch.save()
+        self.assertEqual(self._nearest(lat=-17.7, lng=-179.95, k=1)[0]['name'], 'Unmapped')
+
+    def test_grid_matches_brute_force(self):
+        import random
+        import numpy as np
+        from .geo import PointIndex, distance_km
+        rng = random.Random(7)
+        lats = [rng.uniform(-60, 60) for _ in range(2000)]
+        lngs = [rng.uniform(-180, 180) for _ in range(2000)]
+        grid = PointIndex(range(2000), lats, lngs)
+        for _ in range(20):
+            lat, lng = rng.uniform(-60, 60), rng.uniform(-180, 180)
+            expected = np.argsort(distance_km(lat, lng, np.array(lats), np.array(lngs)))[:5].tolist()
+            self.assertEqual([branch_id for _, branch_id in grid.nearest(lat, lng, 5)], expected)
+
+
+class DoctorSearchTests(APITestCase):
+    def setUp(self):
+        from . import doctor_search
+        doctor_search._index = None
+        general = Hospital.objects.create(name='General', email='general@example.com', address='1 St', phone='1')
+        mercy = Hospital.objects.create(name='Mercy', email='mercy@example.com', address='2 St', phone='2')
+        self.boston = HospitalBranch.objects.create(hospital=general, name='Central', address='1 St', phone='1', city='Boston', state='MA')
+        self.salem = HospitalBranch.objects.create(hospital=mercy, name='North', address='2 St', phone='2', city='Salem', state='MA')
+        austin = HospitalBranch.objects.create(hospital=mercy, name='South', address='3 St', phone='3', city='Austin', state='TX')
+        self.mercy = mercy
+        self.ada = Doctor.objects.create(branch=self.boston, name='Ada Smith', specialization='Cardiology')
+        Doctor.objects.create(branch=self.boston, name='Bob Smithers', specialization='Pediatrics')
+        Doctor.objects.create(branch=self.salem, name='Cy Young', specialization='pediatrics')
+        Doctor.objects.create(branch=austin, name='Dee Jones', specialization='Dermatology')
+
+    def _search(self, **params):
+        response = self.client.get(reverse('doctor-search'), params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def _facet(self, data, facet):
+        return {item['label']: item['count'] for item in data['facets'][facet]}
+
+    def test_text_and_facet_filters_with_counts(self):
+        data = self._search(q='smi')
+        self.assertEqual([doctor['name'] for doctor in data['results']], ['Ada Smith', 'Bob Smithers'])
+        data = self._search(specialization='PEDIATRICS', state='ma')
+        self.assertEqual(data['count'], 2)
+        self.assertEqual(self._facet(data, 'city'), {'Boston': 1, 'Salem': 1})
+        # The selected facet counts as if unfiltered, within the other filters.
+        self.assertEqual(self._facet(data, 'specialization'), {'Pediatrics': 2, 'Cardiology': 1})
+        data = self._search(q='mercy', hospital=self.mercy.id, limit=1)
+        self.assertEqual((data['count'], data['next_offset']), (2, 1))
+        self.assertEqual(data['results'][0]['hospital_name'], 'Mercy')
+        self.assertEqual(self._search(city='Nowhere')['count'], 0)
+
+    def test_committed_writes_patch_the_index(self):
+        self._search()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ada.specialization = 'Pediatrics'
+            self.ada.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.salem.city = 'Lowell'
+            self.salem.save()
+        with self.assertNumQueries(0):
+            data = self._search(specialization='pediatrics')
+        self.assertEqual(data['count'], 3)
+        self.assertEqual(self._facet(data, 'city'), {'Boston': 2, 'Lowell': 1})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.boston.delete()
+        with self.assertNumQueries(0):
+            self.assertEqual(self._search(q='smith')['count'], 0)
+
+    def test_writes_from_other_processes_trigger_a_rebuild(self):
+        from .directory import VERSION_KEY, _cache
+        self._search()
+        Doctor.objects.filter(pk=self.ada.pk).update(name='Ada Lovelace')
+        _cache().incr(VERSION_KEY)
+        self.assertEqual(self._search(q='lovelace')['count'], 1)
+
+
+@override_settings(DATABASE_SHARDS=['default', 'shard_b'])
+class ShardingTests(APITestCase):
+    databases = {'default', 'shard_b'}
+
+    def setUp(self):
+        from hospital_app.sharding import reserve_id_ranges, shard_map, shard_map_changed
+        from . import doctor_search
+        from .directory import directory_cache
+        shard_map.clear()
+        reserve_id_ranges(using='shard_b')
+        directory_cache.clear()
+        doctor_search._index = None
+        # Hospitals and users reach the other shards when 'default' commits.
+        with self.captureOnCommitCallbacks(execute=True):
+            self.home = Hospital.objects.create(name='Home', email='home@example.com', address='1 St', phone='1')
+            self.away = Hospital.objects.create(name='Away', email='away@example.com', address='2 St', phone='2')
+        HospitalShard.objects.create(hospital=self.away, alias='shard_b')
+        shard_map_changed()
+        self.home_branch = HospitalBranch.objects.create(hospital=self.home, name='Home Central', address='1 St', phone='1', city='Boston', state='MA')
+        self.home_doctor = Doctor.objects.create(branch=self.home_branch, name='Ada Home', specialization='Cardiology')
+        self.away_branch = HospitalBranch.objects.using('shard_b').create(hospital=self.away, name='Away Central', address='2 St', phone='2', city='Austin', state='TX')
+        self.away_doctor = Doctor.objects.using('shard_b').create(branch=self.away_branch, name='Bo Away', specialization='Cardiology')
+
+    def _patient(self, email, branch):
+        from hospital_app.sharding import use_shard
+        with use_shard(branch._state.db), self.captureOnCommitCallbacks(execute=True):
+            user = User.objects.create_user(email=email, password='pass12345', full_name='Pat Ient')
+            Patient.objects.filter(user=user).update(hospital_branch=branch)
+        return user
+
+    def _login(self, user):
+        from authentication.tokens import ClaimsRefreshToken
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {ClaimsRefreshToken.for_user(user).access_token}')
+
+    def test_tenant_rows_live_on_their_hospitals_shard(self):
+        from hospital_app.sharding import SHARD_ID_SPACING
+        self.assertFalse(HospitalBranch.objects.using('default').filter(name='Away Central').exists())
+        self.assertGreaterEqual(self.away_doctor.pk, SHARD_ID_SPACING)
+        # Hospitals and users are copied to every shard for local joins.
+        self.assertTrue(Hospital.objects.using('shard_b').filter(pk=self.home.pk).exists())
+        user = self._patient('away@example.com', self.away_branch)
+        self.assertTrue(User.objects.using('shard_b').filter(pk=user.pk).exists())
+        self.assertTrue(Patient.objects.using('shard_b').filter(user_id=user.pk).exists())
+        # Reverse relations from a hospital follow it to its shard.
+        self.assertEqual(list(self.away.branches.all()), [self.away_branch])
+
+    def test_rolled_back_reference_rows_never_reach_other_shards(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                Hospital.objects.create(name='Gone', email='gone@example.com', address='3 St', phone='3')
+                raise RuntimeError
+        self.assertFalse(Hospital.objects.using('shard_b').filter(name='Gone').exists())
+
+    def test_requests_are_routed_by_token_and_listings_fan_out(self):
+        user = self._patient('away@example.com', self.away_branch)
+        self._login(user)
+        response = self.client.post(reverse('patient-appointments'), {
+            'doctor': self.away_doctor.pk, 'appointment_time': (timezone.now() + timedelta(days=2)).isoformat(),
+        })
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertTrue(Appointment.objects.using('shard_b').filter(pk=response.data['id']).exists())
+        self.assertFalse(Appointment.objects.using('default').exists())
+        self.assertEqual(len(self.client.get(reverse('patient-appointments')).data['results']), 1)
+
+        self.client.credentials()
+        directory = self.client.get(reverse('hospital-directory')).json()
+        self.assertEqual(
+            {hospital['name']: [branch['name'] for branch in hospital['branches']] for hospital in directory},
+            {'Away': ['Away Central'], 'Home': ['Home Central']},
+        )
+        self.assertEqual(self.client.get(reverse('doctor-search'), {'specialization': 'cardiology'}).data['count'], 2)
+
+    def test_writes_are_rejected_while_the_hospital_is_moving(self):
+        from hospital_app.sharding import shard_map_changed
+        user = self._patient('away@example.com', self.away_branch)
+        self._login(user)
+        HospitalShard.objects.filter(hospital=self.away).update(read_only=True)
+        shard_map_changed()
+        response = self.client.post(reverse('patient-appointments'), {
+            'doctor': self.away_doctor.pk, 'appointment_time': (timezone.now() + timedelta(days=2)).isoformat(),
+        })
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self.client.get(reverse('patient-appointments')).status_code, 200)
+
+    def test_move_hospital_copies_and_switches(self):
+        user = self._patient('home@example.com', self.home_branch)
+        patient = Patient.objects.get(user=user)
+        appointment = Appointment.objects.create(
+            patient=patient, doctor=self.home_doctor, appointment_time=timezone.now() + timedelta(days=1),
+        )
+        session = ChatbotSession.objects.create(patient=patient, symptoms='cough')
+        ChatMessage.objects.create(session=session, sender='PATIENT', message='cough')
+
+        call_command('move_hospital', self.home.pk, 'shard_b', grace=0, stdout=io.StringIO(), stderr=io.StringIO())
+
+        self.assertEqual(HospitalShard.objects.get(hospital=self.home).alias, 'shard_b')
+        for model in (HospitalBranch, Doctor, Patient, Appointment, ChatbotSession, ChatMessage):
+            self.assertFalse(model.objects.using('default').exists(), model)
+        moved = Appointment.objects.using('shard_b').get(pk=appointment.pk)
+        self.assertEqual((moved.patient_id, moved.doctor_id), (patient.pk, self.home_doctor.pk))
+        self.assertEqual(moved.reminders.count(), appointment.reminders.using('shard_b').count())
+        self.assertTrue(moved.reminders.exists())
+        self.client.credentials()
+        detail = self.client.get(reverse('hospital-directory-detail', args=[self.home.pk])).json()
+        self.assertEqual(detail['branches'][0]['doctors'][0]['name'], 'Ada Home')
+
+    def test_move_drops_rows_deleted_during_the_grace_period(self):
+        leaving = Doctor.objects.create(branch=self.home_branch, name='Di Leaving', specialization='Cardiology')
+        DoctorAvailability.objects.create(doctor=leaving, weekday=0, start_time=time(9), end_time=time(17))
+        user = self._patient('home@example.com', self.home_branch)
+        appointment = Appointment.objects.create(
+            patient=Patient.objects.get(user=user), doctor=self.home_doctor,
+            appointment_time=timezone.now() + timedelta(days=1),
+        )
+        self.assertTrue(appointment.reminders.exists())
+
+        def delete_during_grace(seconds):
+            leaving.delete()
+            appointment.delete()
+
+        with mock.patch('hospitals.rebalance.time.sleep', side_effect=delete_during_grace):
+            call_command('move_hospital', self.home.pk, 'shard_b', grace=0, stdout=io.StringIO(), stderr=io.StringIO())
+
+        self.assertEqual(HospitalShard.objects.get(hospital=self.home).alias, 'shard_b')
+        self.assertEqual(list(Doctor.objects.using('shard_b').filter(branch=self.home_branch)), [self.home_doctor])
+        self.assertFalse(DoctorAvailability.objects.using('shard_b').filter(doctor_id=leaving.pk).exists())
+        self.assertFalse(Appointment.objects.using('shard_b').exists())
+
+    def test_move_refuses_hospitals_sharing_rows(self):
+        user = self._patient('home@example.com', self.home_branch)
+        other = HospitalBranch.objects.create(hospital=Hospital.objects.create(
+            name='Other', email='other@example.com', address='3 St', phone='3'
+        ), name='Other Central', address='3 St', phone='3', city='Boston', state='MA')
+        doctor = Doctor.objects.create(branch=other, name='Cy Other', specialization='Cardiology')
+        Appointment.objects.create(
+            patient=Patient.objects.get(user=user), doctor=doctor, appointment_time=timezone.now() + timedelta(days=1),
+        )
+        with self.assertRaisesMessage(CommandError, 'shares rows with other hospitals'):
+            call_command('move_hospital', self.home.pk, 'shard_b', grace=0, stderr=io.StringIO())
+        self.assertFalse(HospitalBranch.objects.using('shard_b').filter(hospital=self.home).exists())
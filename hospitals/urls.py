@@ -0,0 +1,10 @@
+from django.urls import path
+from .views import BranchExportView, DoctorSearchView, HospitalDirectoryView, NearestBranchView
+
+urlpatterns = [
+    path('branches/<int:branch_id>/export/', BranchExportView.as_view(), name='branch-export'),
+    path('branches/nearest/', NearestBranchView.as_view(), name='nearest-branches'),
+    path('doctors/search/', DoctorSearchView.as_view(), name='doctor-search'),
+    path('directory/', HospitalDirectoryView.as_view(), name='hospital-directory'),
+    path('directory/<int:hospital_id>/', HospitalDirectoryView.as_view(), name='hospital-directory-detail'),
+]
@@ -1,3 +1,115 @@
-from django.shortcuts import render
+from django.http import HttpResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from rest_framework import permissions, status
+from rest_framework.response import Response
+from rest_framework.views import APIView
 
-# Create your views here.
+from authentication.permissions import IsAdmin
+from hospital_app.sharding import bind_shard
+from .directory import directory_cache, render_hospitals
+from .doctor_search import FACETS, search_doctors
+from .export import FORMATS, stream_export
+from .geo import nearest_branches
+from .models import HospitalBranch
+from .serializers import (
+    DoctorSearchQuerySerializer,
+    DoctorSearchResultSerializer,
+    ExportQuerySerializer,
+    NearestBranchQuerySerializer,
+    NearestBranchSerializer,
+)
+
+
+class BranchExportView(APIView):
+    """
+    Stream a branch's appointments, chat sessions or chat messages as
+    csv, ndjson or columnar row groups, e.g.
+    ?dataset=appointments&output=csv&start=2025-01-01&end=2025-03-31
+    """
+    permission_classes = [IsAdmin]
+
+    def get(self, request, branch_id):
+        query = ExportQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+        params = query.validated_data
+        branch = get_object_or_404(HospitalBranch, pk=branch_id)
+
+        output = params['output']
+        extension = 'csv' if output == 'csv' else 'ndjson'
+        response = StreamingHttpResponse(
+            bind_shard(
+                stream_export(params['dataset'], output, branch.pk, start=params.get('start'), end=params.get('end'))
+            ),
+            content_type=FORMATS[output],
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="branch-{branch.pk}-{params["dataset"]}.{extension}"'
+        )
+        return response
+
+
+class HospitalDirectoryView(APIView):
+    """
+    Public hospital -> branches -> doctors directory, either all hospitals
+    or one. Served as pre-rendered JSON from the directory cache with a
+    strong ETag; If-None-Match revalidation gets 304.
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, hospital_id=None):
+        key = 'all' if hospital_id is None else hospital_id
+        body, etag = directory_cache.get(key, lambda: render_hospitals(hospital_id))
+        if body is None:
+            return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+        headers = {'ETag': etag, 'Cache-Control': 'public, no-cache'}
+        if etag in request.headers.get('If-None-Match', ''):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return HttpResponse(body, content_type='application/json', headers=headers)
+
+
+class NearestBranchView(APIView):
+    """
+    The k branches closest to ?lat=&lng=, optionally only those with a
+    doctor of ?specialization= and within ?max_km=, from the in-memory
+    branch grid index.
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        query = NearestBranchQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+        params = query.validated_data
+        results = nearest_branches(
+            params['lat'], params['lng'], k=params['k'],
+            specialization=params.get('specialization'), max_km=params.get('max_km'),
+        )
+        return Response({'results': NearestBranchSerializer(results, many=True).data})
+
+
+class DoctorSearchView(APIView):
+    """
+    Doctor search with facet counts, e.g. ?q=smith&specialization=pediatrics&city=boston.
+    Served from the in-memory doctor index; each facet's counts ignore its
+    own filter.
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        query = DoctorSearchQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+        params = query.validated_data
+        found = search_doctors(
+            params['q'],
+            filters={facet: params[facet] for facet in FACETS if facet in params},
+            limit=params['limit'], offset=params['offset'], facet_limit=params['facet_limit'],
+        )
+        end = params['offset'] + params['limit']
+        return Response({
+            'count': found['count'],
+            'results': DoctorSearchResultSerializer(found['results'], many=True).data,
+            'facets': found['facets'],
+            'next_offset': end if end < found['count'] else None,
+        })
@@ -1,3 +1,42 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import DuplicateCandidate, MedicalHistoryEntry, Patient
+
+
+@admin.register(Patient)
+class PatientAdmin(admin.ModelAdmin):
+    list_display = ('universal_id', 'full_name', 'hospital_branch', 'date_of_birth', 'phone')
+    list_filter = ('hospital_branch', 'gender')
+    list_select_related = ('user', 'hospital_branch')
+    # Prefix and exact lookups instead of the default leading-wildcard icontains.
+    search_fields = ('^search_name', '=universal_id', '=phone')
+    raw_id_fields = ('user',)
+    readonly_fields = ('universal_id',)
+
+    def full_name(self, obj):
+        return obj.user.full_name
+    full_name.admin_order_field = 'search_name'
+
+
+@admin.register(MedicalHistoryEntry)
+class MedicalHistoryEntryAdmin(admin.ModelAdmin):
+    list_display = ('patient', 'kind', 'recorded_at', 'recorded_by')
+    list_filter = ('kind',)
+    list_select_related = ('patient__user', 'recorded_by')
+    raw_id_fields = ('patient', 'recorded_by')
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(DuplicateCandidate)
+class DuplicateCandidateAdmin(admin.ModelAdmin):
+    list_display = ('patient_a', 'patient_b', 'score', 'name_score', 'dob_score', 'phone_score', 'status')
+    list_filter = ('status',)
+    list_select_related = ('patient_a__user', 'patient_b__user')
+    raw_id_fields = ('patient_a', 'patient_b')
+    readonly_fields = ('score', 'name_score', 'dob_score', 'phone_score', 'created_at', 'updated_at')
+    ordering = ('status', '-score')
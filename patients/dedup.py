@@ -0,0 +1,220 @@
+"""
+Duplicate patient detection.
+
+Record linkage in three steps, each over bounded chunks of patients:
+
+1. Blocking: every patient gets a few blocking keys (Soundex of first and
+   last name, date of birth, last 7 phone digits) in PatientBlockingKey.
+2. Candidate pairs: patients that share a key with a new or changed
+   patient. Keys shared by more than `max_block` patients (a common
+   birthday, say) are skipped, which keeps the pair count near-linear.
+3. Scoring: pairs are scored in NumPy batches, combining hashed-trigram
+   name similarity, DOB agreement and phone agreement. Pairs at or above
+   the threshold are upserted into DuplicateCandidate, keeping any review
+   status.
+
+Runs are incremental: only patients updated since the last finished
+DuplicateScanRun are re-keyed and re-paired.
+"""
+import zlib
+from collections import defaultdict
+
+import numpy as np
+from django.db import router, transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from .models import DuplicateCandidate, DuplicateScanRun, Patient, PatientBlockingKey
+
+CHUNK_SIZE = 5000
+MAX_BLOCK = 200
+THRESHOLD = 0.75
+NAME_BUCKETS = 256
+WEIGHTS = {'name': 0.55, 'dob': 0.3, 'phone': 0.15}
+SOUNDEX_CODES = {
+    **dict.fromkeys('bfpv', '1'), **dict.fromkeys('cgjkqsxz', '2'), **dict.fromkeys('dt', '3'),
+    'l': '4', **dict.fromkeys('mn', '5'), 'r': '6',
+}
+
+
+def soundex(word):
+    letters = [char for char in word.lower() if char.isalpha()]
+    if not letters:
+        return ''
+    code, previous = letters[0].upper(), SOUNDEX_CODES.get(letters[0], '')
+    for char in letters[1:]:
+        digit = SOUNDEX_CODES.get(char, '')
+        if digit and digit != previous:
+            code += digit
+        if char not in 'hw':
+            previous = digit
+    return (code + '000')[:4]
+
+
+def phone_suffix(phone):
+    digits = ''.join(char for char in phone or '' if char.isdigit())
+    return digits[-7:] if len(digits) >= 7 else ''
+
+
+def blocking_keys(search_name, date_of_birth, phone):
+    keys = set()
+    parts = search_name.split()
+    if parts:
+        keys.add(f'n:{soundex(parts[0])}:{soundex(parts[-1])}')
+    if date_of_birth:
+        keys.add(f'd:{date_of_birth.isoformat()}')
+    suffix = phone_suffix(phone)
+    if suffix:
+        keys.add(f'p:{suffix}')
+    return keys
+
+
+def name_vectors(names):
+    """Boolean (n, NAME_BUCKETS) matrix of hashed character trigrams."""
+    matrix = np.zeros((len(names), NAME_BUCKETS), dtype=bool)
+    for row, name in enumerate(names):
+        padded = f'  {name} '
+        for i in range(len(padded) - 2):
+            matrix[row, zlib.crc32(padded[i:i + 3].encode()) % NAME_BUCKETS] = True
+    return matrix
+
+
+def score_pairs(left, right, features):
+    """
+    `left`/`right` are index arrays into `features` (dict of arrays: names
+    matrix, dob ordinals (0 = unknown), ordinals of the dob with day and
+    month swapped (0 = not a valid date), phone suffix ints (0 = unknown)).
+    Returns (total, name, dob, phone) score arrays.
+    """
+    names = features['names']
+    shared = np.logical_and(names[left], names[right]).sum(axis=1)
+    either = np.logical_or(names[left], names[right]).sum(axis=1)
+    name = np.divide(shared, either, out=np.zeros(len(left)), where=either > 0)
+
+    dob_left, dob_right = features['dob'][left], features['dob'][right]
+    known = (dob_left > 0) & (dob_right > 0)
+    # Transposed day/month or a one-day typo still counts for something.
+    near = (np.abs(dob_left - dob_right) <= 1) | (features['dob_swapped'][left] == dob_right)
+    dob = np.where(known & (dob_left == dob_right), 1.0, np.where(known & near, 0.5, 0.0))
+
+    phone_left, phone_right = features['phone'][left], features['phone'][right]
+    phone = ((phone_left > 0) & (phone_left == phone_right)).astype(float)
+
+    total = WEIGHTS['name'] * name + WEIGHTS['dob'] * dob + WEIGHTS['phone'] * phone
+    return total, name, dob, phone
+
+
+def _chunks(queryset, size):
+    """Yield lists of ids from `queryset` in id order without holding them all."""
+    last = 0
+    while True:
+        ids = list(queryset.filter(id__gt=last).order_by('id').values_list('id', flat=True)[:size])
+        if not ids:
+            return
+        yield ids
+        last = ids[-1]
+
+
+def refresh_keys(patient_ids):
+    rows = Patient.objects.filter(id__in=patient_ids).values_list('id', 'search_name', 'date_of_birth', 'phone')
+    with transaction.atomic(using=router.db_for_write(PatientBlockingKey)):
+        PatientBlockingKey.objects.filter(patient_id__in=patient_ids).delete()
+        PatientBlockingKey.objects.bulk_create([
+            PatientBlockingKey(patient_id=patient_id, key=key)
+            for patient_id, search_name, dob, phone in rows
+            for key in blocking_keys(search_name, dob, phone)
+        ])
+
+
+def candidate_pairs(patient_ids, max_block=MAX_BLOCK):
+    """Set of (a, b), a < b, pairing `patient_ids` with anyone sharing a block."""
+    touched = PatientBlockingKey.objects.filter(patient_id__in=patient_ids).values('key')
+    # Oversized blocks are dropped in SQL, so their members are never loaded.
+    blocks = (
+        PatientBlockingKey.objects.filter(key__in=touched)
+        .values('key')
+        .annotate(size=Count('id'))
+        .filter(size__gte=2, size__lte=max_block)
+        .values('key')
+    )
+    members = defaultdict(list)
+    for key, patient_id in PatientBlockingKey.objects.filter(key__in=blocks).values_list('key', 'patient_id').iterator():
+        members[key].append(patient_id)
+    changed = set(patient_ids)
+    pairs = set()
+    for block in members.values():
+        for patient_id in block:
+            if patient_id in changed:
+                pairs.update((min(patient_id, other), max(patient_id, other)) for other in block if other != patient_id)
+    return pairs
+
+
+def swapped_ordinal(day):
+    """Ordinal of `day` with day and month transposed, or 0 if that is not a different valid date."""
+    if day is None or day.day > 12 or day.day == day.month:
+        return 0
+    try:
+        return day.replace(month=day.day, day=day.month).toordinal()
+    except ValueError:
+        return 0
+
+
+def load_features(patient_ids):
+    rows = list(Patient.objects.filter(id__in=patient_ids).values_list('id', 'search_name', 'date_of_birth', 'phone'))
+    index = {row[0]: position for position, row in enumerate(rows)}
+    features = {
+        'names': name_vectors([row[1] for row in rows]),
+        'dob': np.array([row[2].toordinal() if row[2] else 0 for row in rows], dtype=np.int64),
+        'dob_swapped': np.array([swapped_ordinal(row[2]) for row in rows], dtype=np.int64),
+        'phone': np.array([int(phone_suffix(row[3]) or 0) for row in rows], dtype=np.int64),
+    }
+    return index, features
+
+
+def write_candidates(pairs, threshold=THRESHOLD):
+    """Score `pairs` and upsert those above `threshold`; returns the number written."""
+    pairs = sorted(pairs)
+    if not pairs:
+        return 0
+    index, features = load_features({patient_id for pair in pairs for patient_id in pair})
+    pairs = [pair for pair in pairs if pair[0] in index and pair[1] in index]
+    left = np.array([index[a] for a, _ in pairs], dtype=np.int64)
+    right = np.array([index[b] for _, b in pairs], dtype=np.int64)
+    total, name, dob, phone = score_pairs(left, right, features)
+    keep = np.nonzero(total >= threshold)[0]
+    DuplicateCandidate.objects.bulk_create(
+        [
+            DuplicateCandidate(
+                patient_a_id=pairs[i][0], patient_b_id=pairs[i][1], score=float(total[i]),
+                name_score=float(name[i]), dob_score=float(dob[i]), phone_score=float(phone[i]),
+            )
+            for i in keep
+        ],
+        update_conflicts=True,
+        unique_fields=['patient_a', 'patient_b'],
+        update_fields=['score', 'name_score', 'dob_score', 'phone_score', 'updated_at'],
+    )
+    return len(keep)
+
+
+def scan_duplicates(full=False, chunk_size=CHUNK_SIZE, threshold=THRESHOLD, max_block=MAX_BLOCK, progress=None):
+    """Run one (incremental unless `full`) scan and return its DuplicateScanRun."""
+    run = DuplicateScanRun.objects.create(started_at=timezone.now())
+    previous = DuplicateScanRun.objects.filter(finished_at__isnull=False).order_by('-started_at').first()
+    changed = Patient.objects.all()
+    if previous and not full:
+        # Start from the previous run's start, so edits made while it ran are seen.
+        changed = changed.filter(updated_at__gte=previous.started_at)
+
+    for ids in _chunks(changed, chunk_size):
+        refresh_keys(ids)
+    for ids in _chunks(changed, chunk_size):
+        pairs = candidate_pairs(ids, max_block=max_block)
+        run.patients_scanned += len(ids)
+        run.pairs_scored += len(pairs)
+        run.candidates += write_candidates(pairs, threshold=threshold)
+        if progress:
+            progress(run)
+    run.finished_at = timezone.now()
+    run.save()
+    return run
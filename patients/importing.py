@@ -0,0 +1,221 @@
+"""
+Bulk patient import.
+
+Records are streamed from CSV or NDJSON and processed in batches. For each
+batch the passwords are hashed in a process pool while the previous batch
+is written, then Users and their Patient rows are inserted with two
+bulk_create calls in one transaction. bulk_create sends no post_save, so
+patients.signals.create_patient_profile does not run; universal IDs come
+straight from the block allocator. When the database is sharded, the new
+users are copied to every shard and each patient is written to its
+branch's shard (see hospital_app.sharding).
+"""
+import csv
+import json
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils.dateparse import parse_date
+
+from authentication.models import User
+from hospital_app.sharding import concrete_columns, is_sharded, reference_copies, shard_aliases, write_rows
+from hospitals.models import HospitalBranch
+from .models import MedicalHistoryEntry, Patient, search_name_for
+from .universal_ids import allocate_universal_ids
+
+BATCH_SIZE = 1000
+PATIENT_FIELDS = ('gender', 'phone', 'address', 'emergency_contact')
+GENDERS = {code for code, _ in Patient.GENDER_CHOICES}
+
+
+class ImportStats:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.read = 0
+        self.imported = 0
+        self.skipped = 0
+        self.errors = []
+
+    @property
+    def rate(self):
+        elapsed = time.monotonic() - self.started
+        return self.imported / elapsed if elapsed else 0.0
+
+
+def read_records(handle, input_format):
+    """Yield (line number, dict) from an open text file."""
+    if input_format == 'csv':
+        for line, row in enumerate(csv.DictReader(handle), start=2):
+            yield line, row
+        return
+    for line, raw in enumerate(handle, start=1):
+        raw = raw.strip()
+        if not raw:
+            continue
+        try:
+            yield line, json.loads(raw)
+        except json.JSONDecodeError as exc:
+            yield line, {'_error': f"invalid JSON: {exc.msg}"}
+
+
+def clean_record(record, default_branch_id, branch_ids):
+    """Return (cleaned dict, None) or (None, error message)."""
+    if '_error' in record:
+        return None, record['_error']
+    email = User.objects.normalize_email((record.get('email') or '').strip())
+    full_name = (record.get('full_name') or '').strip()
+    if not email or '@' not in email:
+        return None, "missing or invalid email"
+    if not full_name:
+        return None, "missing full_name"
+
+    cleaned = {
+        'email': email,
+        'full_name': full_name[:255],
+        'password': record.get('password') or None,
+        'date_of_birth': None,
+        'hospital_branch_id': default_branch_id,
+    }
+    if record.get('date_of_birth'):
+        try:
+            cleaned['date_of_birth'] = parse_date(str(record['date_of_birth']))
+        except ValueError:
+            cleaned['date_of_birth'] = None
+        if cleaned['date_of_birth'] is None:
+            return None, f"invalid date_of_birth {record['date_of_birth']!r}"
+    if record.get('hospital_branch'):
+        try:
+            cleaned['hospital_branch_id'] = int(record['hospital_branch'])
+        except (TypeError, ValueError):
+            return None, f"invalid hospital_branch {record['hospital_branch']!r}"
+    if cleaned['hospital_branch_id'] is not None and cleaned['hospital_branch_id'] not in branch_ids:
+        return None, f"unknown hospital_branch {cleaned['hospital_branch_id']}"
+    for field in PATIENT_FIELDS:
+        cleaned[field] = str(record.get(field) or '').strip()
+    cleaned['medical_history'] = str(record.get('medical_history') or '').strip()
+    if cleaned['gender'] and cleaned['gender'] not in GENDERS:
+        return None, f"invalid gender {cleaned['gender']!r}"
+    return cleaned, None
+
+
+def _setup_worker():
+    # Needed when the pool uses the "spawn" start method.
+    django.setup()
+
+
+def hash_passwords(passwords, pool=None):
+    """Hash a list of raw passwords; None yields an unusable password."""
+    if pool is None:
+        return [make_password(password) for password in passwords]
+    chunksize = max(1, len(passwords) // (pool._max_workers * 4))
+    return pool.map(make_password, passwords, chunksize=chunksize)
+
+
+def write_batch(records, hashed, branch_shards=None):
+    """
+    Insert Users and Patients for one batch; returns the number of patients
+    created. `branch_shards` maps branch ids to their shard.
+    """
+    branch_shards = branch_shards or {}
+    users = [
+        User(email=record['email'], full_name=record['full_name'], role='PATIENT', password=password)
+        for record, password in zip(records, hashed)
+    ]
+    with transaction.atomic():
+        users = User.objects.bulk_create(users)
+        if is_sharded():
+            rows = list(User.objects.filter(pk__in=[user.pk for user in users]).values_list(*concrete_columns(User)))
+            for alias in reference_copies():
+                with transaction.atomic(using=alias):
+                    write_rows(User, rows, alias)
+        by_shard = defaultdict(list)
+        for user, record, universal_id in zip(users, records, allocate_universal_ids(len(users))):
+            patient = Patient(
+                user_id=user.pk,
+                universal_id=universal_id,
+                search_name=search_name_for(record['full_name']),
+                hospital_branch_id=record['hospital_branch_id'],
+                date_of_birth=record['date_of_birth'],
+                **{field: record[field] for field in PATIENT_FIELDS},
+            )
+            by_shard[branch_shards.get(record['hospital_branch_id'], 'default')].append((patient, record))
+        created = 0
+        for alias, group in by_shard.items():
+            with transaction.atomic(using=alias):
+                patients = Patient.objects.using(alias).bulk_create([patient for patient, _ in group])
+                MedicalHistoryEntry.objects.using(alias).bulk_create([
+                    MedicalHistoryEntry(patient_id=patient.pk, kind='NOTE', text=record['medical_history'])
+                    for patient, (_, record) in zip(patients, group)
+                    if record['medical_history']
+                ])
+            created += len(patients)
+    return created
+
+
+def import_patients(records, default_branch_id=None, batch_size=BATCH_SIZE, workers=None, progress=None):
+    """
+    Import (line, dict) records. `workers=0` hashes in-process; None uses one
+    process per CPU. `progress(stats)` is called after every batch.
+    """
+    stats = ImportStats()
+    branch_ids = {
+        branch_id: alias
+        for alias in shard_aliases()
+        for branch_id in HospitalBranch.objects.using(alias).values_list('id', flat=True)
+    }
+    seen = set()
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_setup_worker) if workers != 0 else None
+    pending = None
+    try:
+        for batch in _batches(records, batch_size):
+            stats.read += len(batch)
+            cleaned = []
+            for line, record in batch:
+                record, error = clean_record(record, default_branch_id, branch_ids)
+                if error is None and record['email'] in seen:
+                    error = "duplicate email in input"
+                if error:
+                    stats.skipped += 1
+                    stats.errors.append((line, error))
+                    continue
+                seen.add(record['email'])
+                cleaned.append((line, record))
+            existing = set(
+                User.objects.filter(email__in=[record['email'] for _, record in cleaned]).values_list('email', flat=True)
+            )
+            for line, record in cleaned:
+                if record['email'] in existing:
+                    stats.skipped += 1
+                    stats.errors.append((line, "email already registered"))
+            cleaned = [record for _, record in cleaned if record['email'] not in existing]
+
+            # Hash this batch while the previous one is written.
+            hashed = hash_passwords([record['password'] for record in cleaned], pool)
+            if pending:
+                stats.imported += write_batch(*pending, branch_ids)
+                if progress:
+                    progress(stats)
+            pending = (cleaned, hashed)
+        if pending:
+            stats.imported += write_batch(pending[0], list(pending[1]), branch_ids)
+            if progress:
+                progress(stats)
+    finally:
+        if pool:
+            pool.shutdown()
+    return stats
+
+
+def _batches(records, size):
+    batch = []
+    for item in records:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from hospital_app.sharding import is_sharded, shard_aliases, use_shard
+from patients.dedup import CHUNK_SIZE, MAX_BLOCK, THRESHOLD, scan_duplicates
+
+
+class Command(BaseCommand):
+    help = (
+        "Find likely duplicate patients across branches and record them as DuplicateCandidate rows. "
+        "Only patients changed since the last finished scan are examined unless --full is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help="Rescan every patient")
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+        parser.add_argument('--threshold', type=float, default=THRESHOLD, help="Minimum score (0-1) to record")
+        parser.add_argument('--max-block', type=int, default=MAX_BLOCK,
+                            help="Skip blocking keys shared by more patients than this")
+        parser.add_argument('--shard', action='append', dest='shards',
+                            help="Database shard to scan (repeatable); default: all")
+
+    def handle(self, *args, **options):
+        if not 0 < options['threshold'] <= 1:
+            raise CommandError("--threshold must be in (0, 1].")
+        # Patients are only compared with others on the same shard.
+        for alias in options['shards'] or shard_aliases():
+            with use_shard(alias):
+                run = scan_duplicates(
+                    full=options['full'],
+                    chunk_size=options['chunk_size'],
+                    threshold=options['threshold'],
+                    max_block=options['max_block'],
+                    progress=lambda run: self.stderr.write(
+                        f"{run.patients_scanned} patients, {run.pairs_scored} pairs, {run.candidates} candidates"
+                    ),
+                )
+            summary = (
+                f"Scanned {run.patients_scanned} patients, scored {run.pairs_scored} pairs, "
+                f"recorded {run.candidates} candidates."
+            )
+            self.stdout.write(self.style.SUCCESS(f"{alias}: {summary}" if is_sharded() else summary))
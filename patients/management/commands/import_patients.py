@@ -0,0 +1,52 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from hospitals.models import HospitalBranch
+from patients.importing import BATCH_SIZE, import_patients, read_records
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk-import patients from CSV or NDJSON. Columns/keys: email, full_name, password, "
+        "date_of_birth, gender, phone, address, emergency_contact, medical_history, hospital_branch."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Input file, or - for stdin")
+        parser.add_argument('--format', dest='input_format', choices=['csv', 'ndjson'],
+                            help="Defaults to the file extension")
+        parser.add_argument('--branch', type=int, help="Branch for records without hospital_branch")
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--workers', type=int, help="Password hashing processes (0 = in-process; default: CPUs)")
+        parser.add_argument('--max-errors', type=int, default=20, help="Skipped rows to list individually")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        input_format = options['input_format'] or ('ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv')
+        if options['branch'] and not HospitalBranch.objects.filter(pk=options['branch']).exists():
+            raise CommandError(f"Branch {options['branch']} does not exist.")
+
+        handle = sys.stdin if path == '-' else open(path, encoding='utf-8', newline='')
+        try:
+            stats = import_patients(
+                read_records(handle, input_format),
+                default_branch_id=options['branch'],
+                batch_size=options['batch_size'],
+                workers=options['workers'],
+                progress=lambda stats: self.stderr.write(
+                    f"{stats.imported} imported, {stats.skipped} skipped ({stats.rate:.0f} rows/s)"
+                ),
+            )
+        finally:
+            if handle is not sys.stdin:
+                handle.close()
+
+        for line, error in stats.errors[:options['max_errors']]:
+            self.stderr.write(f"line {line}: {error}")
+        if len(stats.errors) > options['max_errors']:
+            self.stderr.write(f"... and {len(stats.errors) - options['max_errors']} more")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {stats.imported} patients, skipped {stats.skipped} of {stats.read} rows "
+            f"({stats.rate:.0f} rows/s)."
+        ))
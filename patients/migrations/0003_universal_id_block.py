@@ -0,0 +1,33 @@
+from django.db import migrations, models
+
+
+def create_sequence(apps, schema_editor):
+    # Postgres reserves blocks from a sequence, which is not rolled back
+    # with the registration that happened to need a new block.
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE SEQUENCE IF NOT EXISTS patients_universal_id_hi START 1')
+
+
+def drop_sequence(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP SEQUENCE IF EXISTS patients_universal_id_hi')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0002_patient_address_patient_emergency_contact_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UniversalIdBlock',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('next_hi', models.BigIntegerField(default=1)),
+            ],
+        ),
+        migrations.RunPython(create_sequence, drop_sequence),
+    ]
@@ -0,0 +1,102 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:57
+
+import sqlite3
+
+from django.conf import settings
+from django.db import migrations, models
+
+FTS_TABLE = 'patients_patient_fts'
+
+
+def backfill_search_names(apps, schema_editor):
+    Patient = apps.get_model('patients', 'Patient')
+    batch = []
+    for patient in Patient.objects.select_related('user').only('id', 'user__full_name').iterator(chunk_size=2000):
+        patient.search_name = ' '.join(patient.user.full_name.lower().split())
+        batch.append(patient)
+        if len(batch) >= 2000:
+            Patient.objects.bulk_update(batch, ['search_name'])
+            batch = []
+    Patient.objects.bulk_update(batch, ['search_name'])
+
+
+def create_fts_triggers(schema_editor):
+    # SQLite drops these whenever Django remakes patients_patient (e.g. on
+    # AddField), so later migrations that alter the table call this again.
+    schema_editor.execute(
+        f"CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON patients_patient BEGIN "
+        f"INSERT INTO {FTS_TABLE}(rowid, search_name) VALUES (new.id, new.search_name); END"
+    )
+    schema_editor.execute(
+        f"CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON patients_patient BEGIN "
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_name) VALUES ('delete', old.id, old.search_name); END"
+    )
+    schema_editor.execute(
+        f"CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE OF search_name ON patients_patient BEGIN "
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_name) VALUES ('delete', old.id, old.search_name); "
+        f"INSERT INTO {FTS_TABLE}(rowid, search_name) VALUES (new.id, new.search_name); END"
+    )
+
+
+def add_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        # Trigram GIN index serves both the fuzzy (%) and substring searches.
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        schema_editor.execute(
+            'CREATE INDEX patient_name_trgm ON patients_patient USING gin (search_name gin_trgm_ops)'
+        )
+    elif vendor == 'sqlite' and sqlite3.sqlite_version_info >= (3, 34):
+        # External-content FTS5 table with the trigram tokenizer (SQLite >= 3.34),
+        # kept in sync by triggers.
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+            f"search_name, content='patients_patient', content_rowid='id', tokenize='trigram')"
+        )
+        create_fts_triggers(schema_editor)
+        schema_editor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def drop_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS patient_name_trgm')
+    elif vendor == 'sqlite':
+        for suffix in ('ai', 'ad', 'au'):
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS {FTS_TABLE}_{suffix}')
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospitals', '0006_doctor_user'),
+        ('patients', '0003_universal_id_block'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patient',
+            name='search_name',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.RunPython(backfill_search_names, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['hospital_branch', 'search_name'], name='patient_branch_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['search_name'], name='patient_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['hospital_branch', 'date_of_birth'], name='patient_branch_dob_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['phone'], name='patient_phone_idx'),
+        ),
+        migrations.RunPython(add_search_indexes, drop_search_indexes),
+    ]
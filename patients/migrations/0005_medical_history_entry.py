@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:03
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def copy_legacy_history(apps, schema_editor):
+    # The legacy column is left in place (deferred, no longer written) so the
+    # previous release keeps working during the rollout.
+    Patient = apps.get_model('patients', 'Patient')
+    MedicalHistoryEntry = apps.get_model('patients', 'MedicalHistoryEntry')
+    legacy = Patient.objects.exclude(medical_history='').values_list('id', 'medical_history')
+    batch = []
+    for patient_id, text in legacy.iterator(chunk_size=1000):
+        if text.strip():
+            batch.append(MedicalHistoryEntry(patient_id=patient_id, kind='LEGACY', text=text))
+        if len(batch) >= 1000:
+            MedicalHistoryEntry.objects.bulk_create(batch)
+            batch = []
+    MedicalHistoryEntry.objects.bulk_create(batch)
+
+
+def remove_legacy_entries(apps, schema_editor):
+    apps.get_model('patients', 'MedicalHistoryEntry').objects.filter(kind='LEGACY').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0004_patient_search'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='patient',
+            options={'base_manager_name': 'objects'},
+        ),
+        migrations.AlterField(
+            model_name='patient',
+            name='medical_history',
+            field=models.TextField(blank=True, help_text='Legacy free-text history, copied into MedicalHistoryEntry; no longer written.'),
+        ),
+        migrations.CreateModel(
+            name='MedicalHistoryEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('NOTE', 'Note'), ('CONDITION', 'Condition'), ('ALLERGY', 'Allergy'), ('MEDICATION', 'Medication'), ('PROCEDURE', 'Procedure'), ('IMMUNIZATION', 'Immunization'), ('LEGACY', 'Imported from legacy history')], default='NOTE', max_length=20)),
+                ('text', models.TextField()),
+                ('data', models.JSONField(blank=True, default=dict, help_text='Structured fields for the kind, e.g. dose or severity')),
+                ('recorded_at', models.DateTimeField(auto_now_add=True)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='history_entries', to='patients.patient')),
+                ('recorded_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['patient', '-recorded_at', '-id'], name='history_patient_recent_idx')],
+            },
+        ),
+        migrations.RunPython(copy_legacy_history, remove_legacy_entries),
+    ]
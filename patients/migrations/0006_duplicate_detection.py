@@ -0,0 +1,79 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:05
+
+import importlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+search_migration = importlib.import_module('patients.migrations.0004_patient_search')
+
+
+def restore_fts_triggers(apps, schema_editor):
+    # Adding updated_at makes SQLite rebuild patients_patient, dropping the
+    # FTS triggers created in 0004.
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    table = search_migration.FTS_TABLE
+    if table not in schema_editor.connection.introspection.table_names():
+        return
+    for suffix in ('ai', 'ad', 'au'):
+        schema_editor.execute(f'DROP TRIGGER IF EXISTS {table}_{suffix}')
+    search_migration.create_fts_triggers(schema_editor)
+    schema_editor.execute(f"INSERT INTO {table}({table}) VALUES ('rebuild')")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0005_medical_history_entry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DuplicateScanRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField()),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('patients_scanned', models.PositiveIntegerField(default=0)),
+                ('pairs_scored', models.PositiveIntegerField(default=0)),
+                ('candidates', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.CreateModel(
+            name='DuplicateCandidate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('name_score', models.FloatField()),
+                ('dob_score', models.FloatField()),
+                ('phone_score', models.FloatField()),
+                ('status', models.CharField(choices=[('PENDING', 'Pending review'), ('MERGED', 'Merged'), ('DISMISSED', 'Not a duplicate')], default='PENDING', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('patient_a', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='patients.patient')),
+                ('patient_b', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='patients.patient')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', '-score'], name='duplicate_review_idx')],
+                'constraints': [models.UniqueConstraint(fields=('patient_a', 'patient_b'), name='duplicate_pair_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PatientBlockingKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='blocking_keys', to='patients.patient')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['key', 'patient'], name='blocking_key_idx')],
+            },
+        ),
+        migrations.RunPython(restore_fts_triggers, migrations.RunPython.noop),
+    ]
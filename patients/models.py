@@ -2,6 +2,12 @@ from django.db import models
 from authentication.models import User
 from hospitals.models import HospitalBranch
 
+class PatientManager(models.Manager):
+    def get_queryset(self):
+        # The legacy history blob can be large; load it only when asked for.
+        return super().get_queryset().defer('medical_history')
+
+
 class Patient(models.Model):
     GENDER_CHOICES = [
         ('M', 'Male'),
@@ -17,8 +23,125 @@ class Patient(models.Model):
     phone = models.CharField(max_length=20, blank=True)
     address = models.TextField(blank=True)
     emergency_contact = models.CharField(max_length=255, blank=True)
-    medical_history = models.TextField(blank=True)
+    medical_history = models.TextField(
+        blank=True, help_text="Legacy free-text history, copied into MedicalHistoryEntry; no longer written.",
+    )
+    # Lower-cased copy of user.full_name for search; kept in sync by signals.
+    search_name = models.CharField(max_length=255, blank=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = PatientManager()
+
+    class Meta:
+        # Also used for user.patient and other related-object access.
+        base_manager_name = 'objects'
+        indexes = [
+            models.Index(fields=['hospital_branch', 'search_name'], name='patient_branch_name_idx'),
+            models.Index(fields=['search_name'], name='patient_name_idx'),
+            models.Index(fields=['hospital_branch', 'date_of_birth'], name='patient_branch_dob_idx'),
+            models.Index(fields=['phone'], name='patient_phone_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.full_name} ({self.universal_id})"
 
+
+def search_name_for(full_name):
+    return ' '.join(full_name.lower().split())
+
+
+class UniversalIdBlock(models.Model):
+    """
+    hi/lo counter for universal IDs on backends without sequences: each
+    reservation takes `next_hi` and bumps it, giving the process a block of
+    BLOCK_SIZE IDs. Postgres uses the patients_universal_id_hi sequence.
+    """
+    name = models.CharField(max_length=50, primary_key=True)
+    next_hi = models.BigIntegerField(default=1)
+
+    def __str__(self):
+        return f"{self.name}: next block {self.next_hi}"
+
+
+class MedicalHistoryEntry(models.Model):
+    """One append-only medical history record; corrections are new entries."""
+    KIND_CHOICES = [
+        ('NOTE', 'Note'),
+        ('CONDITION', 'Condition'),
+        ('ALLERGY', 'Allergy'),
+        ('MEDICATION', 'Medication'),
+        ('PROCEDURE', 'Procedure'),
+        ('IMMUNIZATION', 'Immunization'),
+        ('LEGACY', 'Imported from legacy history'),
+    ]
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='history_entries')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, default='NOTE')
+    text = models.TextField()
+    data = models.JSONField(default=dict, blank=True, help_text="Structured fields for the kind, e.g. dose or severity")
+    recorded_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    recorded_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['patient', '-recorded_at', '-id'], name='history_patient_recent_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} for patient {self.patient_id} @ {self.recorded_at}"
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Medical history entries are append-only.")
+        super().save(*args, **kwargs)
+
+
+class PatientBlockingKey(models.Model):
+    """Blocking keys for duplicate detection (phonetic name, DOB, phone suffix)."""
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='blocking_keys')
+    key = models.CharField(max_length=64)
+
+    class Meta:
+        indexes = [models.Index(fields=['key', 'patient'], name='blocking_key_idx')]
+
+    def __str__(self):
+        return f"{self.key} -> {self.patient_id}"
+
+
+class DuplicateCandidate(models.Model):
+    """A scored pair of patients that may be the same person, awaiting review."""
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending review'),
+        ('MERGED', 'Merged'),
+        ('DISMISSED', 'Not a duplicate'),
+    ]
+    # patient_a_id < patient_b_id, so each pair is stored once.
+    patient_a = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='+')
+    patient_b = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+    name_score = models.FloatField()
+    dob_score = models.FloatField()
+    phone_score = models.FloatField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['patient_a', 'patient_b'], name='duplicate_pair_uniq'),
+        ]
+        indexes = [models.Index(fields=['status', '-score'], name='duplicate_review_idx')]
+
+    def __str__(self):
+        return f"{self.patient_a_id} ~ {self.patient_b_id} ({self.score:.2f}, {self.status})"
+
+
+class DuplicateScanRun(models.Model):
+    """Watermark for incremental duplicate scans."""
+    started_at = models.DateTimeField()
+    finished_at = models.DateTimeField(null=True, blank=True)
+    patients_scanned = models.PositiveIntegerField(default=0)
+    pairs_scored = models.PositiveIntegerField(default=0)
+    candidates = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"Duplicate scan {self.started_at:%Y-%m-%d %H:%M}"
@@ -0,0 +1,9 @@
+from rest_framework.pagination import CursorPagination
+
+
+class MedicalHistoryCursorPagination(CursorPagination):
+    """Newest entries first, seeking through the (patient, -recorded_at, -id) index."""
+    ordering = ('-recorded_at', '-id')
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
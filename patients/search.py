@@ -0,0 +1,155 @@
+"""
+Patient directory search.
+
+Names are searched through Patient.search_name (lower-cased full name):
+
+* exact   - universal ID, phone number or date of birth, via unique/B-tree indexes
+* prefix  - a range scan on the search_name B-tree index
+* fuzzy   - typo tolerant; pg_trgm similarity (`%` operator, GIN index) on
+            Postgres, FTS5 trigram candidates re-ranked by trigram overlap
+            on SQLite, a bounded LIKE scan elsewhere
+
+`auto` picks exact for ID/phone/date-looking queries, otherwise prefix
+results followed by fuzzy ones. Every mode is scoped by branch when given.
+"""
+import re
+
+from django.contrib.postgres.lookups import TrigramSimilar
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import connections, router
+from django.utils.dateparse import parse_date
+
+from .models import Patient, search_name_for
+from .universal_ids import normalize
+
+MODES = ('auto', 'exact', 'prefix', 'fuzzy')
+FUZZY_THRESHOLD = 0.3
+FUZZY_CANDIDATES = 500
+FTS_TABLE = 'patients_patient_fts'
+LEGACY_ID = re.compile(r'^[0-9A-Fa-f]{8}$')
+PHONE = re.compile(r'^\+?[\d\s().-]{6,}$')
+
+# search_name__trigram_similar is pg_trgm's `%`, which the GIN index serves.
+Patient._meta.get_field('search_name').register_lookup(TrigramSimilar)
+
+
+def trigrams(text):
+    padded = f'  {text} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def trigram_similarity(left, right):
+    """Same measure as pg_trgm's similarity(), for re-ranking on SQLite."""
+    left, right = trigrams(left), trigrams(right)
+    return len(left & right) / len(left | right) if left and right else 0.0
+
+
+def _base(branch_id):
+    queryset = Patient.objects.select_related('user', 'hospital_branch')
+    if branch_id:
+        queryset = queryset.filter(hospital_branch_id=branch_id)
+    return queryset
+
+
+def exact_matches(query, branch_id=None):
+    queryset = _base(branch_id)
+    candidates = {query.strip().upper()}
+    try:
+        candidates.add(normalize(query.strip()))
+    except ValueError:
+        pass
+    if LEGACY_ID.match(query.strip()) or any(len(candidate) == 9 for candidate in candidates):
+        found = list(queryset.filter(universal_id__in=candidates))
+        if found:
+            return found
+    try:
+        day = parse_date(query.strip())
+    except ValueError:
+        day = None
+    if day:
+        return list(queryset.filter(date_of_birth=day).order_by('search_name', 'id')[:FUZZY_CANDIDATES])
+    if PHONE.match(query.strip()):
+        digits = re.sub(r'\D', '', query)
+        return list(queryset.filter(phone__in={query.strip(), digits}).order_by('search_name', 'id')[:FUZZY_CANDIDATES])
+    return []
+
+
+def prefix_matches(query, branch_id=None, limit=50, offset=0):
+    name = search_name_for(query)
+    if not name:
+        return []
+    # The range bounds let the B-tree index serve the scan; startswith keeps
+    # the result exact under any collation.
+    queryset = _base(branch_id).filter(
+        search_name__gte=name, search_name__lt=name + '\uffff', search_name__startswith=name,
+    )
+    return list(queryset.order_by('search_name', 'id')[offset:offset + limit])
+
+
+def fuzzy_matches(query, branch_id=None, limit=50, offset=0):
+    """Returns [(patient, score)] ranked by trigram similarity."""
+    name = search_name_for(query)
+    if len(name) < 3:
+        return []
+    connection = connections[router.db_for_read(Patient)]
+    if connection.vendor == 'postgresql':
+        queryset = _base(branch_id).filter(search_name__trigram_similar=name).annotate(
+            score=TrigramSimilarity('search_name', name),
+        ).order_by('-score', 'search_name', 'id')
+        return [(patient, patient.score) for patient in queryset[offset:offset + limit]]
+
+    candidate_ids = _sqlite_candidates(connection, name) if connection.vendor == 'sqlite' else None
+    queryset = _base(branch_id)
+    if candidate_ids is not None:
+        queryset = queryset.filter(id__in=candidate_ids)
+    else:
+        queryset = queryset.filter(search_name__contains=name[:3])
+    scored = [
+        (patient, trigram_similarity(name, patient.search_name))
+        for patient in queryset[:FUZZY_CANDIDATES]
+    ]
+    scored = sorted(
+        ((patient, score) for patient, score in scored if score >= FUZZY_THRESHOLD),
+        key=lambda item: (-item[1], item[0].search_name, item[0].id),
+    )
+    return scored[offset:offset + limit]
+
+
+def _sqlite_candidates(connection, name):
+    """Ids sharing any trigram with `name`, best bm25 first; None without FTS5."""
+    terms = sorted({gram for gram in (name[i:i + 3] for i in range(len(name) - 2)) if gram.strip()})
+    match = ' OR '.join('"{}"'.format(term.replace('"', '""')) for term in terms)
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+        if cursor.fetchone() is None:
+            return None
+        cursor.execute(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s ORDER BY bm25({FTS_TABLE}) LIMIT %s',
+            [match, FUZZY_CANDIDATES],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_patients(query, branch_id=None, mode='auto', limit=20, offset=0):
+    """Returns a list of (patient, match type, score), at most `limit` long."""
+    query = query.strip()
+    if mode in ('auto', 'exact'):
+        found = exact_matches(query, branch_id)
+        if found or mode == 'exact':
+            return [(patient, 'exact', 1.0) for patient in found][offset:offset + limit]
+    if mode == 'prefix':
+        return [(patient, 'prefix', 1.0) for patient in prefix_matches(query, branch_id, limit, offset)]
+    if mode == 'fuzzy':
+        return [(patient, 'fuzzy', score) for patient, score in fuzzy_matches(query, branch_id, limit, offset)]
+
+    # auto: prefix hits first, then fuzzy hits not already listed.
+    window = offset + limit
+    results = [(patient, 'prefix', 1.0) for patient in prefix_matches(query, branch_id, window)]
+    if len(results) < window:
+        seen = {patient.id for patient, _, _ in results}
+        results += [
+            (patient, 'fuzzy', score)
+            for patient, score in fuzzy_matches(query, branch_id, window)
+            if patient.id not in seen
+        ]
+    return results[offset:window]
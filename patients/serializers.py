@@ -1,7 +1,64 @@
 from rest_framework import serializers
-from .models import Patient
+from .models import MedicalHistoryEntry, Patient
 
 class PatientProfileSerializer(serializers.ModelSerializer):
     class Meta:
         model = Patient
-        fields = ['date_of_birth', 'gender', 'phone']
\ No newline at end of file
+        fields = ['date_of_birth', 'gender', 'phone']
+
+class PatientSearchQuerySerializer(serializers.Serializer):
+    q      = serializers.CharField(min_length=2, max_length=100)
+    mode   = serializers.ChoiceField(choices=['auto', 'exact', 'prefix', 'fuzzy'], default='auto')
+    branch = serializers.IntegerField(required=False)
+    limit  = serializers.IntegerField(min_value=1, max_value=50, default=20)
+    offset = serializers.IntegerField(min_value=0, max_value=500, default=0)
+
+
+class PatientSearchResultSerializer(serializers.ModelSerializer):
+    full_name = serializers.CharField(source='user.full_name')
+    email     = serializers.EmailField(source='user.email')
+    branch    = serializers.CharField(source='hospital_branch.name', default=None)
+
+    class Meta:
+        model = Patient
+        fields = ['id', 'universal_id', 'full_name', 'email', 'date_of_birth', 'phone', 'hospital_branch', 'branch']
+
+
+class TimelineAppointmentSerializer(serializers.Serializer):
+    id               = serializers.IntegerField()
+    appointment_time = serializers.DateTimeField()
+    end_time         = serializers.DateTimeField()
+    duration         = serializers.IntegerField()
+    status           = serializers.CharField()
+    reason           = serializers.CharField()
+    doctor           = serializers.SerializerMethodField()
+    branch           = serializers.SerializerMethodField()
+
+    def get_doctor(self, obj):
+        return {'id': obj.doctor.id, 'name': obj.doctor.name, 'specialization': obj.doctor.specialization}
+
+    def get_branch(self, obj):
+        branch = obj.doctor.branch
+        return {'id': branch.id, 'name': branch.name, 'city': branch.city}
+
+
+class TimelineChatMessageSerializer(serializers.Serializer):
+    sender    = serializers.CharField()
+    message   = serializers.CharField()
+    timestamp = serializers.DateTimeField()
+
+
+class TimelineChatSessionSerializer(serializers.Serializer):
+    id              = serializers.IntegerField()
+    symptoms        = serializers.CharField()
+    suggested_drugs = serializers.JSONField()
+    recommendation  = serializers.CharField()
+    created_at      = serializers.DateTimeField()
+    messages        = TimelineChatMessageSerializer(many=True, source='messages.all')
+
+
+class MedicalHistoryEntrySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = MedicalHistoryEntry
+        fields = ['id', 'kind', 'text', 'data', 'recorded_by', 'recorded_at']
+        read_only_fields = ['id', 'recorded_by', 'recorded_at']
@@ -1,24 +1,37 @@
-import uuid
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.conf import settings
+from django.utils import timezone
 
-from .models import Patient
+from .models import Patient, search_name_for
+from .universal_ids import next_universal_id
+from authentication.backends import invalidate_user
 from authentication.models import User
-
-
-def generate_universal_id():
-    """Returns an 8-character uppercase alphanumeric ID."""
-    return uuid.uuid4().hex[:8].upper()
+from hospital_app.sharding import shard_aliases
 
 
 @receiver(post_save, sender=User)
-def create_patient_profile(sender, instance, created, **kwargs):
+def create_patient_profile(sender, instance, created, update_fields=None, **kwargs):
     """
     When a User is created with role PATIENT, auto-create a Patient record.
     """
     if created and instance.role == 'PATIENT':
         Patient.objects.create(
             user=instance,
-            universal_id=generate_universal_id()
-        )
\ No newline at end of file
+            universal_id=next_universal_id(),
+            search_name=search_name_for(instance.full_name),
+        )
+    elif not created and (update_fields is None or 'full_name' in update_fields):
+        name = search_name_for(instance.full_name)
+        # The patient row may be on any shard.
+        for alias in shard_aliases():
+            Patient.objects.using(alias).filter(user_id=instance.pk).exclude(search_name=name).update(
+                search_name=name, updated_at=timezone.now(),
+            )
+
+
+@receiver(post_save, sender=Patient)
+@receiver(post_delete, sender=Patient)
+def invalidate_patient_user(sender, instance, **kwargs):
+    """Tokens carry the patient id; make older tokens fall back to the database."""
+    invalidate_user(instance.user_id)
@@ -1,8 +1,21 @@
 from django.test import TestCase
-from .models import Patient
+from .models import MedicalHistoryEntry, Patient
+from .universal_ids import BLOCK_SIZE, BlockAllocator, decode, encode
 from authentication.models import User
-from hospitals.models import Hospital, HospitalBranch
-from datetime import date
+from hospitals.models import Doctor, Hospital, HospitalBranch
+from appointments.models import Appointment
+from chatbot.models import ChatbotSession, ChatMessage
+from datetime import date, timedelta
+from io import StringIO
+import os
+
+from django.core.management import call_command
+from django.db import DatabaseError, connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
 
 class PatientModelTests(TestCase):
     def setUp(self):
@@ -113,3 +126,349 @@ class PatientModelTests(TestCase):
         patient2.hospital_branch = self.branch
         patient2.save()
         self.assertEqual(patient2.address, '')
+
+
+class ImportPatientsCommandTests(TestCase):
+    def setUp(self):
+        self.hospital = Hospital.objects.create(name='Import Hospital', email='import@example.com', address='1 St', phone='1234567890')
+        self.branch = HospitalBranch.objects.create(hospital=self.hospital, name='Import Branch', address='1 St', phone='1234567890', city='City', state='State')
+        User.objects.create_user(email='existing@example.com', password='x', full_name='Existing')
+
+    def _run(self, content, suffix, *args):
+        import tempfile
+        with tempfile.NamedTemporaryFile('w', suffix=suffix, delete=False, encoding='utf-8') as handle:
+            handle.write(content)
+        out, err = StringIO(), StringIO()
+        call_command('import_patients', handle.name, '--workers', '0', '--batch-size', '2', *args, stdout=out, stderr=err)
+        os.unlink(handle.name)
+        return out.getvalue(), err.getvalue()
+
+    def test_csv_import_creates_users_and_patients_in_bulk(self):
+        content = (
+            "email,full_name,password,date_of_birth,gender,phone\n"
+            "a@example.com,Alice,secret123,1990-05-01,F,555\n"
+            "b@example.com,Bob,,,M,\n"
+            "existing@example.com,Dup,pw,,,\n"
+            "a@example.com,Alice Again,pw,,,\n"
+            "c@example.com,,pw,,,\n"
+            "d@example.com,Dee,pw,not-a-date,,\n"
+            "e@example.com,Eve,pw,,,\n"
+        )
+        out, err = self._run(content, '.csv', '--branch', str(self.branch.id))
+        self.assertIn("Imported 3 patients, skipped 4 of 7 rows", out)
+        self.assertIn("line 5: duplicate email in input", err)
+        alice = Patient.objects.select_related('user').get(user__email='a@example.com')
+        self.assertTrue(alice.user.check_password('secret123'))
+        self.assertEqual(alice.user.role, 'PATIENT')
+        self.assertEqual(alice.hospital_branch, self.branch)
+        self.assertEqual(alice.date_of_birth, date(1990, 5, 1))
+        self.assertFalse(Patient.objects.get(user__email='b@example.com').user.has_usable_password())
+        self.assertEqual(Patient.objects.filter(user__email__in=['a@example.com', 'b@example.com', 'e@example.com']).values('universal_id').distinct().count(), 3)
+
+    def test_ndjson_import(self):
+        content = '{"email": "n@example.com", "full_name": "Nia", "hospital_branch": %d}\nnot json\n' % self.branch.id
+        out, err = self._run(content, '.ndjson')
+        self.assertIn("Imported 1 patients, skipped 1 of 2 rows", out)
+        self.assertIn("line 2: invalid JSON", err)
+        self.assertEqual(Patient.objects.get(user__email='n@example.com').hospital_branch, self.branch)
+
+
+class UniversalIdTests(TestCase):
+    def test_encode_round_trips_and_detects_typos(self):
+        for value in (0, 1, 1024, 2 ** 40 - 1):
+            universal_id = encode(value)
+            self.assertEqual(len(universal_id), 9)
+            self.assertEqual(decode(universal_id.lower()), value)
+        universal_id = encode(123456)
+        typo = ('1' if universal_id[3] != '1' else '2').join([universal_id[:3], universal_id[4:]])
+        with self.assertRaises(ValueError):
+            decode(typo)
+
+    def test_consecutive_values_are_not_consecutive_ids(self):
+        self.assertNotEqual(encode(1)[:7], encode(2)[:7])
+
+    def test_allocator_reserves_once_per_block_and_is_thread_safe(self):
+        import threading
+        reservations = []
+        allocator = BlockAllocator(reserve=lambda: reservations.append(1) or len(reservations), block_size=100)
+        values, lock = [], threading.Lock()
+
+        def take():
+            taken = [allocator.next_value() for _ in range(250)]
+            with lock:
+                values.extend(taken)
+
+        threads = [threading.Thread(target=take) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(set(values)), 1000)
+        self.assertEqual(len(reservations), 10)
+
+    def test_blocks_are_reserved_from_the_database(self):
+        allocator = BlockAllocator()
+        first = allocator.next_value()
+        with self.assertNumQueries(0):
+            [allocator.next_value() for _ in range(BLOCK_SIZE - 1)]
+        self.assertEqual(BlockAllocator().next_value(), first + BLOCK_SIZE)
+
+    def test_rolled_back_reservation_is_not_reused(self):
+        allocator = BlockAllocator(block_size=4)
+        try:
+            with transaction.atomic():
+                allocator.next_value()
+                raise DatabaseError('rolled back')
+        except DatabaseError:
+            pass
+        kept = [allocator.next_value() for _ in range(9)]
+        self.assertEqual(len(set(kept)), 9)
+
+    def test_registration_assigns_new_style_id(self):
+        user = User.objects.create_user(email='uid1@example.com', password='x', full_name='One')
+        self.assertEqual(len(user.patient.universal_id), 9)
+        decode(user.patient.universal_id)
+
+
+class PatientSearchTests(APITestCase):
+    def setUp(self):
+        self.hospital = Hospital.objects.create(name='Search Hospital', email='search@example.com', address='1 St', phone='1234567890')
+        self.branch = HospitalBranch.objects.create(hospital=self.hospital, name='North', address='1 St', phone='1234567890', city='City', state='State')
+        self.other = HospitalBranch.objects.create(hospital=self.hospital, name='South', address='2 St', phone='1234567890', city='City', state='State')
+        self.patients = {}
+        for name, branch, phone, dob in [
+            ('Jonathan Smith', self.branch, '5550001', date(1980, 1, 2)),
+            ('Jon Smythe', self.branch, '5550002', date(1990, 3, 4)),
+            ('Joanna Smith', self.other, '5550003', date(1980, 1, 2)),
+            ('Maria Garcia', self.branch, '5550004', None),
+        ]:
+            user = User.objects.create_user(email=f'{name.split()[0].lower()}@example.com', password='x', full_name=name)
+            Patient.objects.filter(user=user).update(hospital_branch=branch, phone=phone, date_of_birth=dob)
+            self.patients[name] = Patient.objects.get(user=user)
+        self.staff = User.objects.create_user(email='reception@example.com', password='x', full_name='Reception', role='ADMIN')
+        self.client.force_authenticate(user=self.staff)
+
+    def _search(self, **params):
+        response = self.client.get(reverse('patient-search'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        return [result['full_name'] for result in response.data['results']], response.data
+
+    def test_prefix_and_branch_scope(self):
+        names, _ = self._search(q='jon', mode='prefix', branch=self.branch.id)
+        self.assertEqual(names, ['Jon Smythe', 'Jonathan Smith'])
+        names, _ = self._search(q='jo', mode='prefix', branch=self.other.id)
+        self.assertEqual(names, ['Joanna Smith'])
+
+    def test_fuzzy_tolerates_typos(self):
+        names, data = self._search(q='jonathon smiht', mode='fuzzy')
+        self.assertEqual(names[0], 'Jonathan Smith')
+        self.assertEqual(data['results'][0]['match'], 'fuzzy')
+        self.assertNotIn('Maria Garcia', names)
+
+    def test_exact_id_phone_and_date(self):
+        patient = self.patients['Jon Smythe']
+        names, _ = self._search(q=patient.universal_id.lower())
+        self.assertEqual(names, ['Jon Smythe'])
+        names, _ = self._search(q='555-0003')
+        self.assertEqual(names, ['Joanna Smith'])
+        names, _ = self._search(q='1980-01-02', branch=self.branch.id)
+        self.assertEqual(names, ['Jonathan Smith'])
+
+    def test_rename_updates_index_and_pagination(self):
+        user = self.patients['Maria Garcia'].user
+        user.full_name = 'Jonas Brown'
+        user.save()
+        names, data = self._search(q='jon', mode='prefix', limit=2)
+        self.assertEqual(names, ['Jon Smythe', 'Jonas Brown'])
+        self.assertEqual(data['next_offset'], 2)
+        names, data = self._search(q='jon', mode='prefix', limit=2, offset=2)
+        self.assertEqual(names, ['Jonathan Smith'])
+        self.assertIsNone(data['next_offset'])
+
+    def test_patients_cannot_search(self):
+        self.client.force_authenticate(user=self.patients['Jon Smythe'].user)
+        self.assertEqual(self.client.get(reverse('patient-search'), {'q': 'jon'}).status_code, status.HTTP_403_FORBIDDEN)
+
+
+class PatientTimelineTests(APITestCase):
+    def setUp(self):
+        hospital = Hospital.objects.create(name='Timeline Hospital', email='timeline@example.com', address='1 St', phone='1234567890')
+        self.branch = HospitalBranch.objects.create(hospital=hospital, name='Timeline Branch', address='1 St', phone='1234567890', city='City', state='State')
+        self.doctors = [Doctor.objects.create(branch=self.branch, name=f'Dr. {i}', specialization='General') for i in range(3)]
+        self.user = User.objects.create_user(email='timeline@example.com', password='x', full_name='Timeline Patient')
+        self.patient = self.user.patient
+        self.staff = User.objects.create_user(email='timeline-staff@example.com', password='x', full_name='Staff', role='ADMIN')
+        self.base = timezone.now().replace(microsecond=0)
+
+    def _populate(self, count, start=0):
+        for i in range(start, start + count):
+            Appointment.objects.create(
+                patient=self.patient, doctor=self.doctors[i % 3],
+                appointment_time=self.base + timedelta(hours=2 * i), reason=f'visit {i}',
+            )
+            session = ChatbotSession.objects.create(patient=self.patient, symptoms=f'cough {i}')
+            ChatbotSession.objects.filter(pk=session.pk).update(created_at=self.base + timedelta(hours=2 * i + 1))
+            ChatMessage.objects.bulk_create([
+                ChatMessage(session=session, sender='PATIENT', message='hello'),
+                ChatMessage(session=session, sender='BOT', message='hi'),
+            ])
+
+    def _pages(self, url, limit):
+        items, cursor = [], None
+        while True:
+            params = {'limit': limit, **({'cursor': cursor} if cursor else {})}
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            items += response.data['results']
+            cursor = response.data['next_cursor']
+            if not cursor:
+                return items
+
+    def test_pages_merge_chronologically(self):
+        self._populate(5)
+        self.client.force_authenticate(user=self.staff)
+        items = self._pages(reverse('patient-timeline', args=[self.patient.id]), limit=3)
+        self.assertEqual(len(items), 10)
+        self.assertEqual([item['type'] for item in items[:2]], ['chat_session', 'appointment'])
+        times = [item['time'] for item in items]
+        self.assertEqual(times, sorted(times, reverse=True))
+        self.assertEqual(items[1]['appointment']['branch']['name'], 'Timeline Branch')
+        self.assertEqual([message['sender'] for message in items[0]['chat_session']['messages']], ['PATIENT', 'BOT'])
+
+    def test_query_budget_is_fixed(self):
+        self.client.force_authenticate(user=self.staff)
+        url = reverse('patient-timeline', args=[self.patient.id])
+        self._populate(2)
+        with self.assertNumQueries(4):
+            self.client.get(url, {'limit': 50})
+        self._populate(20, start=2)
+        with self.assertNumQueries(4):
+            response = self.client.get(url, {'limit': 50})
+        self.assertEqual(len(response.data['results']), 44)
+
+    def test_patients_see_only_their_own_timeline(self):
+        self._populate(1)
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(reverse('my-timeline'))
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertEqual(self.client.get(reverse('patient-timeline', args=[self.patient.id])).status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.client.get(reverse('my-timeline'), {'cursor': 'bogus'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class MedicalHistoryTests(APITestCase):
+    def setUp(self):
+        hospital = Hospital.objects.create(name='History Hospital', email='history-h@example.com', address='1 St', phone='1')
+        self.branch = HospitalBranch.objects.create(hospital=hospital, name='History Branch', address='1 St', phone='1', city='City', state='State')
+        self.user = User.objects.create_user(email='history@example.com', password='x', full_name='History Patient')
+        self.patient = Patient.objects.get(user=self.user)
+        Patient.objects.filter(pk=self.patient.pk).update(hospital_branch=self.branch)
+        self.doctor = User.objects.create_user(email='history-doc@example.com', password='x', full_name='Doc', role='DOCTOR')
+        Doctor.objects.create(branch=self.branch, user=self.doctor, name='Dr. History', specialization='General')
+
+    def test_patient_loads_defer_legacy_history(self):
+        Patient.objects.filter(pk=self.patient.pk).update(medical_history='x' * 100000)
+        self.assertIn('medical_history', Patient.objects.get(pk=self.patient.pk).get_deferred_fields())
+        self.assertIn('medical_history', User.objects.get(pk=self.user.pk).patient.get_deferred_fields())
+        self.client.force_authenticate(user=self.user)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('patient-profile'))
+        self.assertFalse(any('medical_history' in query['sql'] for query in queries))
+
+    def test_staff_append_and_patient_reads_newest_first(self):
+        self.client.force_authenticate(user=self.doctor)
+        url = reverse('patient-medical-history', args=[self.patient.id])
+        for i in range(3):
+            response = self.client.post(url, {'kind': 'ALLERGY' if i == 1 else 'NOTE', 'text': f'entry {i}', 'data': {'n': i}}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['recorded_by'], self.doctor.id)
+
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(reverse('my-medical-history'), {'page_size': 2})
+        self.assertEqual([entry['text'] for entry in response.data['results']], ['entry 2', 'entry 1'])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([entry['text'] for entry in response.data['results']], ['entry 0'])
+        response = self.client.get(reverse('my-medical-history'), {'kind': 'allergy'})
+        self.assertEqual([entry['text'] for entry in response.data['results']], ['entry 1'])
+        self.assertEqual(self.client.post(reverse('my-medical-history'), {'text': 'mine'}).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_doctors_of_other_branches_cannot_read(self):
+        other_branch = HospitalBranch.objects.create(
+            hospital=self.branch.hospital, name='Other Branch', address='2 St', phone='2', city='City', state='State',
+        )
+        outsider = User.objects.create_user(email='outsider-doc@example.com', password='x', full_name='Out', role='DOCTOR')
+        Doctor.objects.create(branch=other_branch, user=outsider, name='Dr. Out', specialization='General')
+        self.client.force_authenticate(user=outsider)
+        url = reverse('patient-medical-history', args=[self.patient.id])
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.post(url, {'text': 'note'}).status_code, status.HTTP_404_NOT_FOUND)
+        timeline = reverse('patient-timeline', args=[self.patient.id])
+        self.assertEqual(self.client.get(timeline).status_code, status.HTTP_404_NOT_FOUND)
+        self.client.force_authenticate(user=self.doctor)
+        self.assertEqual(self.client.get(timeline).status_code, status.HTTP_200_OK)
+
+    def test_entries_are_append_only(self):
+        entry = MedicalHistoryEntry.objects.create(patient=self.patient, text='first')
+        entry.text = 'changed'
+        with self.assertRaises(ValueError):
+            entry.save()
+
+
+class DuplicateDetectionTests(TestCase):
+    def setUp(self):
+        hospital = Hospital.objects.create(name='Dedup Hospital', email='dedup@example.com', address='1 St', phone='1234567890')
+        self.north = HospitalBranch.objects.create(hospital=hospital, name='North', address='1 St', phone='1', city='City', state='State')
+        self.south = HospitalBranch.objects.create(hospital=hospital, name='South', address='2 St', phone='2', city='City', state='State')
+        self.jonathan = self._patient('jon1@example.com', 'Jonathan Smith', self.north, date(1980, 3, 14), '+1 (555) 123-4567')
+        self.jonathon = self._patient('jon2@example.com', 'Jonathon Smith', self.south, date(1980, 3, 14), '555-123-4567')
+        self.other = self._patient('mary@example.com', 'Mary Jones', self.south, date(1980, 3, 14), '555-987-6543')
+
+    def _patient(self, email, name, branch, dob, phone):
+        patient = Patient.objects.get(user=User.objects.create_user(email=email, password='x', full_name=name))
+        patient.hospital_branch, patient.date_of_birth, patient.phone = branch, dob, phone
+        patient.save()
+        return patient
+
+    def _run(self, *args):
+        out = StringIO()
+        call_command('find_duplicate_patients', *args, stdout=out, stderr=StringIO())
+        return out.getvalue()
+
+    def test_soundex(self):
+        from .dedup import soundex
+        self.assertEqual([soundex(name) for name in ('Robert', 'Rupert', 'Ashcraft', 'Tymczak')], ['R163', 'R163', 'A261', 'T522'])
+
+    def test_cross_branch_duplicates_are_recorded_once(self):
+        from .models import DuplicateCandidate
+        self.assertIn("Scanned 3 patients", self._run())
+        candidate = DuplicateCandidate.objects.get()
+        pair = sorted([self.jonathan.id, self.jonathon.id])
+        self.assertEqual([candidate.patient_a_id, candidate.patient_b_id], pair)
+        self.assertEqual(candidate.dob_score, 1.0)
+        self.assertEqual(candidate.phone_score, 1.0)
+        self.assertEqual(candidate.status, 'PENDING')
+
+    def test_incremental_runs_only_rescan_changed_patients(self):
+        from .models import DuplicateCandidate
+        self._run()
+        self.assertIn("Scanned 0 patients", self._run())
+        DuplicateCandidate.objects.update(status='DISMISSED')
+        self.other.phone = '555 123 4567'
+        self.other.save()
+        self.assertIn("Scanned 1 patients", self._run())
+        # The review decision survives the rescore.
+        self.assertEqual(DuplicateCandidate.objects.get().status, 'DISMISSED')
+        self.assertIn("Scanned 3 patients", self._run('--full'))
+
+    def test_transposed_day_and_month_get_partial_credit(self):
+        from .models import DuplicateCandidate
+        for patient, dob in ((self.jonathan, date(1980, 3, 4)), (self.jonathon, date(1980, 4, 3))):
+            patient.date_of_birth = dob
+            patient.save()
+        self._run('--threshold', '0.5')
+        pair = DuplicateCandidate.objects.get(patient_a=self.jonathan, patient_b=self.jonathon)
+        self.assertEqual(pair.dob_score, 0.5)
+
+    def test_oversized_blocks_are_skipped(self):
+        from .models import DuplicateCandidate
+        self._run('--max-block', '1')
+        self.assertFalse(DuplicateCandidate.objects.exists())
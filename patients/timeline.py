@@ -0,0 +1,86 @@
+"""
+Patient timeline: appointments and chatbot sessions (with their messages)
+merged newest first.
+
+A page costs a fixed number of queries however many items it holds: one
+for appointments (doctor and branch joined in), one for sessions and one
+prefetch for their messages. Items are ordered by (time, kind, id)
+descending and paged with a keyset cursor over that key, so each source
+is read with a LIMIT from the cursor position.
+"""
+import base64
+import heapq
+import json
+
+from django.db.models import Prefetch, Q
+from django.utils.dateparse import parse_datetime
+
+from appointments.models import Appointment
+from chatbot.models import ChatbotSession, ChatMessage
+
+# Tie-break between kinds at the same instant.
+APPOINTMENT, CHAT_SESSION = 1, 0
+
+
+def encode_cursor(time, kind, pk):
+    raw = json.dumps([time.isoformat(), kind, pk]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (time, kind, pk); raises ValueError for a malformed cursor."""
+    try:
+        time, kind, pk = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        time = parse_datetime(time)
+    except (TypeError, ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor.")
+    if time is None or kind not in (APPOINTMENT, CHAT_SESSION) or not isinstance(pk, int):
+        raise ValueError("Invalid cursor.")
+    return time, kind, pk
+
+
+def _before(field, kind, cursor):
+    """Q for rows of `kind` that sort after `cursor` in descending (time, kind, id) order."""
+    if cursor is None:
+        return Q()
+    time, cursor_kind, pk = cursor
+    if kind < cursor_kind:
+        same_instant = Q(**{field: time})
+    elif kind == cursor_kind:
+        same_instant = Q(**{field: time, 'id__lt': pk})
+    else:
+        same_instant = Q(pk__in=[])
+    return Q(**{f'{field}__lt': time}) | same_instant
+
+
+def patient_timeline(patient_id, cursor=None, limit=20):
+    """Returns (items, next cursor or None); items are (kind, time, object)."""
+    appointments = (
+        Appointment.objects
+        .filter(_before('appointment_time', APPOINTMENT, cursor), patient_id=patient_id)
+        .select_related('doctor__branch')
+        .order_by('-appointment_time', '-id')[:limit + 1]
+    )
+    sessions = (
+        ChatbotSession.objects
+        .filter(_before('created_at', CHAT_SESSION, cursor), patient_id=patient_id)
+        .prefetch_related(Prefetch('messages', queryset=ChatMessage.objects.order_by('timestamp', 'id')))
+        .order_by('-created_at', '-id')[:limit + 1]
+    )
+    merged = heapq.merge(
+        ((appointment.appointment_time, APPOINTMENT, appointment.id, appointment) for appointment in appointments),
+        ((session.created_at, CHAT_SESSION, session.id, session) for session in sessions),
+        key=lambda item: item[:3],
+        reverse=True,
+    )
+    items = []
+    for item in merged:
+        items.append(item)
+        if len(items) > limit:
+            break
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        time, kind, pk, _ = items[-1]
+        next_cursor = encode_cursor(time, kind, pk)
+    return [(kind, time, obj) for time, kind, _, obj in items], next_cursor
@@ -0,0 +1,158 @@
+"""
+Universal patient IDs.
+
+IDs are handed out from blocks of BLOCK_SIZE values reserved per process:
+from the patients_universal_id_hi sequence on Postgres, or the
+UniversalIdBlock hi/lo row elsewhere. Taking the next ID from the current
+block is a single `next()` on a range iterator, which is atomic under the
+GIL, so the lock is only taken to reserve a new block.
+
+Outside Postgres the hi/lo bump joins the caller's transaction, so if
+that transaction rolls back the hi value is handed out again; the
+allocator then drops the block instead of issuing its IDs twice.
+
+Values are scrambled with a multiplicative bijection so consecutive
+patients do not get consecutive IDs, then encoded as 8 Crockford base32
+symbols plus a check symbol. The result is 9 characters, so new IDs can
+never collide with the legacy 8-character hex IDs.
+"""
+import os
+import threading
+
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.db.models import F
+
+from .models import UniversalIdBlock
+
+ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+CHECK_ALPHABET = ALPHABET + '*~$=U'
+DECODE = {symbol: value for value, symbol in enumerate(ALPHABET)}
+DECODE.update({'O': 0, 'I': 1, 'L': 1})
+
+DATA_SYMBOLS = 8
+SPACE = 32 ** DATA_SYMBOLS  # 2**40
+MULTIPLIER = 0x5DEECE66D  # odd, so multiplication is a bijection modulo 2**40
+INVERSE = pow(MULTIPLIER, -1, SPACE)
+# Fixed: every process must agree on it or blocks would overlap.
+BLOCK_SIZE = 1024
+SEQUENCE_NAME = 'patients_universal_id_hi'
+BLOCK_NAME = 'universal_id'
+
+
+def encode(value):
+    scrambled = (value * MULTIPLIER) % SPACE
+    symbols = []
+    for _ in range(DATA_SYMBOLS):
+        scrambled, digit = divmod(scrambled, 32)
+        symbols.append(ALPHABET[digit])
+    return ''.join(reversed(symbols)) + CHECK_ALPHABET[(value * MULTIPLIER) % SPACE % 37]
+
+
+def decode(universal_id):
+    """Return the allocated value, or raise ValueError for a malformed or mistyped ID."""
+    normalized = universal_id.replace('-', '').upper()
+    if len(normalized) != DATA_SYMBOLS + 1:
+        raise ValueError("Universal IDs have 9 symbols.")
+    scrambled = 0
+    for symbol in normalized[:-1]:
+        if symbol not in DECODE:
+            raise ValueError(f"Invalid symbol {symbol!r}.")
+        scrambled = scrambled * 32 + DECODE[symbol]
+    if CHECK_ALPHABET[scrambled % 37] != normalized[-1]:
+        raise ValueError("Check symbol does not match.")
+    return (scrambled * INVERSE) % SPACE
+
+
+def normalize(universal_id):
+    """Canonical form of a (possibly mistyped-case or hyphenated) new-style ID."""
+    return encode(decode(universal_id))
+
+
+def reserve_block():
+    """Return the next hi value; the block is [hi * BLOCK_SIZE, (hi + 1) * BLOCK_SIZE)."""
+    if connection.vendor == 'postgresql':
+        # nextval() is not rolled back with the surrounding transaction.
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT nextval(%s)', [SEQUENCE_NAME])
+            return cursor.fetchone()[0]
+    # Joins the caller's transaction; BlockAllocator drops the block if
+    # that rolls back, since the next reservation returns the same hi.
+    with transaction.atomic():
+        if not UniversalIdBlock.objects.filter(name=BLOCK_NAME).update(next_hi=F('next_hi') + 1):
+            UniversalIdBlock.objects.get_or_create(name=BLOCK_NAME)
+            UniversalIdBlock.objects.filter(name=BLOCK_NAME).update(next_hi=F('next_hi') + 1)
+        return UniversalIdBlock.objects.get(name=BLOCK_NAME).next_hi - 1
+
+
+class BlockAllocator:
+    def __init__(self, reserve=reserve_block, block_size=BLOCK_SIZE):
+        self.reserve = reserve
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._block = iter(())
+        # (block, connection, position in its run_on_commit, callback) while
+        # the transaction the current block was reserved in is still open.
+        self._pending = None
+
+    def next_value(self):
+        while True:
+            if self._pending is not None:
+                self._drop_if_rolled_back()
+            block = self._block
+            value = next(block, None)
+            if value is not None:
+                return value
+            with self._lock:
+                if self._block is block:
+                    hi = self.reserve()
+                    self._block = iter(range(hi * self.block_size, (hi + 1) * self.block_size))
+                    self._watch(self._block)
+
+    def _watch(self, block):
+        """Remember a block whose reservation commits or rolls back with the caller."""
+        wrapper = connections[DEFAULT_DB_ALIAS]
+        if wrapper.vendor == 'postgresql' or not wrapper.in_atomic_block:
+            return
+
+        def committed():
+            with self._lock:
+                if self._pending is not None and self._pending[0] is block:
+                    self._pending = None
+
+        transaction.on_commit(committed)
+        self._pending = (block, wrapper, len(wrapper.run_on_commit) - 1, committed)
+
+    def _drop_if_rolled_back(self):
+        with self._lock:
+            if self._pending is None:
+                return
+            block, wrapper, position, committed = self._pending
+            # A rollback (of the transaction or a savepoint around the
+            # reservation) discards the callback; entries before it stay put.
+            hooks = wrapper.run_on_commit
+            if len(hooks) > position and hooks[position][1] is committed:
+                return
+            # Also reached while a commit runs its hooks; dropping a block
+            # then only wastes its remaining IDs.
+            self._pending = None
+            if self._block is block:
+                self._block = iter(())
+
+    def reset(self):
+        """Drop the current block (after fork, the child must not reuse the parent's)."""
+        self._lock = threading.Lock()
+        self._block = iter(())
+        self._pending = None
+
+
+allocator = BlockAllocator()
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=allocator.reset)
+
+
+def next_universal_id():
+    return encode(allocator.next_value())
+
+
+def allocate_universal_ids(count):
+    return [encode(allocator.next_value()) for _ in range(count)]
@@ -1,6 +1,11 @@
 from django.urls import path
-from .views import PatientProfileUpdateView
+from .views import MedicalHistoryView, PatientProfileUpdateView, PatientSearchView, PatientTimelineView
 
 urlpatterns = [
     path('me/profile/', PatientProfileUpdateView.as_view(), name='patient-profile'),
+    path('search/', PatientSearchView.as_view(), name='patient-search'),
+    path('me/timeline/', PatientTimelineView.as_view(), name='my-timeline'),
+    path('<int:patient_id>/timeline/', PatientTimelineView.as_view(), name='patient-timeline'),
+    path('me/history/', MedicalHistoryView.as_view(), name='my-medical-history'),
+    path('<int:patient_id>/history/', MedicalHistoryView.as_view(), name='patient-medical-history'),
 ]
\ No newline at end of file
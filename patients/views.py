@@ -1,10 +1,145 @@
-from rest_framework import generics, permissions
-from .models import Patient
-from .serializers import PatientProfileSerializer
+from rest_framework import generics, permissions, status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from authentication.permissions import IsClinicStaff
+from hospital_app.sharding import activate_branch
+from hospitals.models import Doctor
+from .models import MedicalHistoryEntry, Patient
+from .pagination import MedicalHistoryCursorPagination
+from .search import search_patients
+from .timeline import APPOINTMENT, decode_cursor, patient_timeline
+from .serializers import (
+    MedicalHistoryEntrySerializer, PatientProfileSerializer, PatientSearchQuerySerializer, PatientSearchResultSerializer,
+    TimelineAppointmentSerializer, TimelineChatSessionSerializer,
+)
 
 class PatientProfileUpdateView(generics.RetrieveUpdateAPIView):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = PatientProfileSerializer
 
     def get_object(self):
-        return Patient.objects.get(user=self.request.user)
+        return Patient.objects.get(user_id=self.request.user.pk)
+
+
+def is_branch_scoped(user):
+    """Doctors (other than staff) only see patients of their own branch."""
+    return user.role == 'DOCTOR' and not user.is_staff
+
+
+def visible_patients(user):
+    """Patients a clinic staff member may read."""
+    patients = Patient.objects.all()
+    if is_branch_scoped(user):
+        patients = patients.filter(
+            hospital_branch_id__in=Doctor.objects.filter(pk=user.doctor_id).values('branch_id'),
+        )
+    return patients
+
+
+class PatientSearchView(APIView):
+    """
+    Reception search by name, universal ID, phone or date of birth, e.g.
+    ?q=jon smth&mode=fuzzy&branch=3. Doctors only see their own branch.
+    """
+    permission_classes = [IsClinicStaff]
+
+    def get(self, request):
+        query = PatientSearchQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+        params = query.validated_data
+
+        branch_id = params.get('branch')
+        if is_branch_scoped(request.user):
+            branch_id = Doctor.objects.filter(pk=request.user.doctor_id).values_list('branch_id', flat=True).first()
+            if branch_id is None:
+                return Response({'results': [], 'next_offset': None})
+        elif branch_id is not None:
+            activate_branch(branch_id)
+
+        matches = search_patients(
+            params['q'], branch_id=branch_id, mode=params['mode'],
+            limit=params['limit'] + 1, offset=params['offset'],
+        )
+        has_more = len(matches) > params['limit']
+        matches = matches[:params['limit']]
+        results = []
+        for patient, match, score in matches:
+            result = PatientSearchResultSerializer(patient).data
+            result['match'] = match
+            result['score'] = round(score, 3)
+            results.append(result)
+        return Response({
+            'results': results,
+            'next_offset': params['offset'] + len(matches) if has_more else None,
+        })
+
+
+class PatientTimelineView(APIView):
+    """
+    A patient's appointments and chatbot sessions, newest first, paged
+    with ?cursor=<next_cursor>&limit=. Staff pass a patient id (doctors
+    only for their own branch); patients read their own timeline at
+    me/timeline/.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    MAX_LIMIT = 100
+
+    def get(self, request, patient_id=None):
+        user = request.user
+        if patient_id is None:
+            patient_id = user.patient_id
+            if patient_id is None:
+                return Response({'detail': 'Only patients have a timeline.'}, status=status.HTTP_403_FORBIDDEN)
+        elif not IsClinicStaff().has_permission(request, self):
+            return Response(status=status.HTTP_403_FORBIDDEN)
+        elif not visible_patients(user).filter(pk=patient_id).exists():
+            return Response(status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            limit = min(max(int(request.query_params.get('limit', 20)), 1), self.MAX_LIMIT)
+            cursor = request.query_params.get('cursor')
+            cursor = decode_cursor(cursor) if cursor else None
+        except ValueError as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        items, next_cursor = patient_timeline(patient_id, cursor=cursor, limit=limit)
+        results = []
+        for kind, time, obj in items:
+            if kind == APPOINTMENT:
+                results.append({'type': 'appointment', 'time': time, 'appointment': TimelineAppointmentSerializer(obj).data})
+            else:
+                results.append({'type': 'chat_session', 'time': time, 'chat_session': TimelineChatSessionSerializer(obj).data})
+        return Response({'results': results, 'next_cursor': next_cursor})
+
+
+class MedicalHistoryView(generics.ListCreateAPIView):
+    """
+    Append-only medical history, most recent first (?kind= filters).
+    Patients read their own at me/history/; clinic staff read and append
+    for any patient, doctors only within their own branch.
+    """
+    serializer_class = MedicalHistoryEntrySerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = MedicalHistoryCursorPagination
+
+    def get_patient_id(self):
+        patient_id = self.kwargs.get('patient_id')
+        if patient_id is None:
+            if self.request.user.patient_id is None or self.request.method != 'GET':
+                self.permission_denied(self.request)
+            return self.request.user.patient_id
+        if not IsClinicStaff().has_permission(self.request, self):
+            self.permission_denied(self.request)
+        generics.get_object_or_404(visible_patients(self.request.user).only('id'), pk=patient_id)
+        return patient_id
+
+    def get_queryset(self):
+        queryset = MedicalHistoryEntry.objects.filter(patient_id=self.get_patient_id())
+        kind = self.request.query_params.get('kind')
+        if kind:
+            queryset = queryset.filter(kind=kind.upper())
+        return queryset
+
+    def perform_create(self, serializer):
+        serializer.save(patient_id=self.get_patient_id(), recorded_by_id=self.request.user.pk)